@@ -1,11 +1,20 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import geopandas as gpd
 import rasterio
-from rasterio.mask import mask
+from rasterio.features import rasterize
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
 import shapely
 # from rasterio.plot import show
 import json
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import configuration as config
+from main_functions import main_utils
 # import pytz
 """
 Extract raster statistics for each polygon in a shapefile, calculate the percentage of data availability, and export
@@ -37,6 +46,37 @@ Update the file paths and parameters as needed.
 Run the script.
 """
 
+# Zone rasters and zone to region matrices by content hash of shapefile and grid, see get_zone_raster
+zone_cache = {}
+
+# Region tables with the rounded LV95 and WGS84 geometries by content hash of the shapefile, see get_region_table
+region_table_cache = {}
+
+# Pre-serialized GeoJSON features and GeoParquet schemas of the region tables, see write_geojson and write_parquet
+geojson_template_cache = {}
+parquet_template_cache = {}
+
+# Version of the zone labels (see build_zones), part of the cache key of the label rasters
+ZONES_VERSION = 2
+
+# VHI drought classes for the class-area shares: inclusive (min, max) value ranges as in the VHI color maps
+vhi_classes = {
+    "extremely_dry": (0, 10),
+    "severely_dry": (11, 20),
+    "moderately_dry": (21, 30),
+    "mildly_dry": (31, 40),
+    "normal": (41, 50),
+    "good": (51, 60),
+    "excellent": (61, 100)
+}
+
+# Percentiles of the valid values exported per region
+region_percentiles = {
+    "p10": 10,
+    "median": 50,
+    "p90": 90
+}
+
 def scale_raster_values(raster_values, scaling_factor):
     """
     Scale raster values by a factor with appropriate precision.
@@ -60,6 +100,641 @@ def scale_raster_values(raster_values, scaling_factor):
 
     return scaled_values
 
+def round_geometries(geometries, decimals):
+    """
+    Rounds the coordinates of geometries, with the same result as a WKT round trip with rounding_precision.
+
+    Args:
+        geometries: Array of shapely geometries
+        decimals: Number of decimals to keep
+
+    Returns:
+        Array of geometries with rounded coordinates
+    """
+    return shapely.transform(geometries, lambda coordinates: np.round(coordinates, decimals))
+
+
+def get_region_table(shape_file):
+    """
+    Returns the warn regions with the geometries as exported.
+
+    The geometries are rounded to 0 decimals in LV95 (approx 0.2m displacement of the vertexes) and, after the
+    reprojection, to 5 decimals in WGS84 (approx 0.2-0.5m differences). They never change between runs, so the
+    table is cached as GeoParquet in config.ASSET_CACHE under the content hash of the shapefile and kept in
+    memory for the following exports.
+
+    Args:
+        shape_file: Path to the shapefile with the warn regions (EPSG:2056)
+
+    Returns:
+        Tuple (regions, geometries_wgs84) with the GeoDataFrame of the regions with the rounded LV95 geometries
+        and the GeoSeries of the rounded WGS84 geometries. Both are shared, callers must copy before changing them.
+    """
+    digest = main_utils.shapefile_hash(shape_file)
+    if digest in region_table_cache:
+        return region_table_cache[digest]
+
+    layer_name = os.path.splitext(os.path.basename(shape_file))[0]
+    table_file = os.path.join(
+        config.ASSET_CACHE, f"{layer_name}_regions_{digest[:16]}.parquet")
+
+    if os.path.exists(table_file):
+        table = gpd.read_parquet(table_file)
+    else:
+        table = gpd.read_file(shape_file)
+        table.geometry = round_geometries(table.geometry.values, 0)
+        table["geometry_wgs84"] = gpd.GeoSeries(
+            round_geometries(table.geometry.to_crs(epsg=4326).values, 5), index=table.index, crs="EPSG:4326")
+
+        # Write to a temporary file first, so concurrent runs never read a partial table
+        os.makedirs(config.ASSET_CACHE, exist_ok=True)
+        temp_file = f"{table_file}.{os.getpid()}.tmp"
+        table.to_parquet(temp_file)
+        os.replace(temp_file, table_file)
+
+    geometries_wgs84 = table["geometry_wgs84"]
+    regions = table.drop(columns=["geometry_wgs84"])
+    region_table_cache[digest] = (regions, geometries_wgs84)
+    return regions, geometries_wgs84
+
+
+def get_polygons(geometry):
+    """Returns the polygon parts of a geometry with a positive area, as MultiPolygon or None."""
+    polygons = [part for part in shapely.get_parts(geometry) if part.geom_type == "Polygon" and part.area > 0]
+    return shapely.MultiPolygon(polygons) if polygons else None
+
+
+def build_zones(geometries):
+    """
+    Splits the regions into zones that can be burned into a single label raster.
+
+    Each region is a zone, and each area shared by two or more regions (partial overlap or containment) is an
+    additional zone belonging to all of them, so pixels in an overlap are counted for every region as with a
+    per-region mask. The zones are ordered by the number of regions, so the zone of all regions sharing a pixel
+    is burned last.
+
+    Args:
+        geometries: List of region polygons
+
+    Returns:
+        Tuple (zone_geometries, zone_regions) with the zone polygons and a boolean matrix of shape
+        (zones + 1, regions) telling which regions a zone label belongs to (label 0 is outside all regions)
+    """
+    zone_geometries = list(geometries)
+    zone_members = [(index,) for index in range(len(zone_geometries))]
+
+    # Overlaps of two regions, then of three regions within those, etc.
+    overlaps = list(zip(zone_geometries, zone_members))
+    while overlaps:
+        next_overlaps = []
+        for overlap, members in overlaps:
+            for j in range(members[-1] + 1, len(geometries)):
+                if not overlap.intersects(geometries[j]):
+                    continue
+                shared = get_polygons(overlap.intersection(geometries[j]))
+                if shared is not None:
+                    next_overlaps.append((shared, members + (j,)))
+        for shared, members in next_overlaps:
+            zone_geometries.append(shared)
+            zone_members.append(members)
+        overlaps = next_overlaps
+
+    zone_regions = np.zeros((len(zone_geometries) + 1, len(geometries)), dtype=bool)
+    for index, members in enumerate(zone_members):
+        zone_regions[index + 1, list(members)] = True
+
+    return zone_geometries, zone_regions
+
+
+def get_strips(src, rows_per_strip):
+    """
+    Splits a raster into full-width strips.
+
+    Args:
+        src: Opened rasterio dataset
+        rows_per_strip: Number of rows per strip
+
+    Returns:
+        List of rasterio windows
+    """
+    return [Window(0, row, src.width, min(rows_per_strip, src.height - row))
+            for row in range(0, src.height, rows_per_strip)]
+
+
+def get_blocks(src, zones):
+    """
+    Streams the internal blocks of a raster along with the zone labels.
+
+    Blocks outside all regions are skipped without reading the raster, so only one block of each is held in
+    memory at a time.
+
+    Args:
+        src: Opened rasterio dataset (single band)
+        zones: Opened zone label raster on the same grid (see get_zone_raster)
+
+    Yields:
+        Tuples (labels, values) of flat arrays for each block intersecting a region
+    """
+    for _, window in src.block_windows(1):
+        labels = zones.read(1, window=window)
+        if not labels.any():
+            continue
+        yield labels.ravel(), src.read(1, window=window).ravel()
+
+
+def get_zone_raster(shape_file, src):
+    """
+    Returns the label raster of the warn regions on the grid of a raster.
+
+    The regions are rasterized once per grid (e.g. 10 m and 30 m) with the same pixel rule as rasterio.mask
+    (pixel center inside the polygon) and cached as tiled GeoTIFF in config.ASSET_CACHE, under the content hash
+    of the shapefile and the grid.
+
+    Args:
+        shape_file: Path to the shapefile with the warn regions (EPSG:2056)
+        src: Opened rasterio dataset defining the grid
+
+    Returns:
+        Tuple (zone_file, zone_regions) with the path of the label raster and the zone to region matrix
+    """
+    layer_name = os.path.splitext(os.path.basename(shape_file))[0]
+    digest = main_utils.shapefile_hash(
+        shape_file, tuple(src.transform), src.width, src.height, ZONES_VERSION)
+    zone_file = os.path.join(
+        config.ASSET_CACHE, f"{layer_name}_zones_{digest[:16]}.tif")
+
+    # Reuse the zones of this process, e.g. for the dates of a batch
+    if digest in zone_cache and os.path.exists(zone_file):
+        return zone_cache[digest]
+
+    geometries = list(gpd.read_file(shape_file).geometry)
+    zone_geometries, zone_regions = build_zones(geometries)
+
+    if not os.path.exists(zone_file):
+        os.makedirs(config.ASSET_CACHE, exist_ok=True)
+        profile = {
+            "driver": "GTiff",
+            "dtype": "uint8" if len(zone_regions) <= 256 else "uint16",
+            "count": 1,
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs,
+            "transform": src.transform,
+            "tiled": True,
+            "blockxsize": 512,
+            "blockysize": 512,
+            "compress": "DEFLATE"
+        }
+        zone_bounds = [zone.bounds for zone in zone_geometries]
+
+        # Write to a temporary file first, so concurrent runs never read a partial raster
+        temp_file = f"{zone_file}.{os.getpid()}.tmp"
+        with rasterio.open(temp_file, "w", **profile) as dst:
+            for window in get_strips(dst, 512):
+                strip_transform = window_transform(window, dst.transform)
+                left, top = strip_transform * (0, 0)
+                right, bottom = strip_transform * (window.width, window.height)
+
+                # Burn the zones intersecting the strip, overlaps of more regions last
+                shapes = [(zone, label + 1) for label, (zone, (minx, miny, maxx, maxy))
+                          in enumerate(zip(zone_geometries, zone_bounds))
+                          if minx <= right and maxx >= left and miny <= top and maxy >= bottom]
+                labels = rasterize(shapes, out_shape=(window.height, window.width), transform=strip_transform,
+                                   fill=0, dtype=profile["dtype"]) if shapes else 0
+                dst.write(np.broadcast_to(labels, (window.height, window.width)).astype(profile["dtype"]),
+                          1, window=window)
+        os.replace(temp_file, zone_file)
+
+    zone_cache[digest] = (zone_file, zone_regions)
+    return zone_file, zone_regions
+
+
+def zonal_stats(src, shape_file, missing_values, no_data_values, cache_size_mb=64):
+    """
+    Computes the statistics of all warn regions in one block-wise pass over a raster.
+
+    Instead of masking the raster once per region, the cached label raster (see get_zone_raster) is streamed
+    block by block along the internal (COG) blocks of the raster, keeping running aggregates for all regions
+    with np.bincount. For 8 and 16 bit integer rasters a single bincount per block gives the value histogram of
+    each zone, from which all statistics are derived. The histograms of the valid values are returned per region,
+    so percentiles and class shares need no further reads (see region_distribution).
+
+    Memory stays bounded by a few blocks and the GDAL block cache, so the extraction can run on small
+    runners next to the GDAL merges.
+
+    Args:
+        src: Opened rasterio dataset (single band)
+        shape_file: Path to the shapefile with the warn regions
+        missing_values: Value of pixels with missing data
+        no_data_values: Value of pixels without data according to the configuration
+        cache_size_mb: Size of the GDAL block cache during the extraction in MB
+
+    Returns:
+        Dict of arrays in the order of the shapefile features: count, valid_count, missing_count, sum, min, max
+        (min and max are NaN for regions without valid values), and histogram of shape (regions, values) with the
+        counts of the valid values listed in values. Both are None for other than 8 and 16 bit integer rasters.
+    """
+    zone_file, zone_regions = get_zone_raster(shape_file, src)
+    n_labels = zone_regions.shape[0]
+    dtype = np.dtype(src.dtypes[0])
+
+    if dtype.kind in "ui" and dtype.itemsize <= 2:
+        # Value histogram of each zone over the integer domain of the raster
+        offset = -int(np.iinfo(dtype).min)
+        span = int(np.iinfo(dtype).max) + offset + 1
+        histogram = np.zeros(n_labels * span, dtype=np.int64)
+
+        with rasterio.Env(GDAL_CACHEMAX=cache_size_mb), rasterio.open(zone_file) as zones:
+            for labels, values in get_blocks(src, zones):
+                key = labels.astype(np.intp)
+                key *= span
+                key += values
+                if offset:
+                    key += offset
+
+                # Only count the key range of the block
+                low = key.min()
+                block_histogram = np.bincount(key - low)
+                histogram[low:low + block_histogram.size] += block_histogram
+        histogram = histogram.reshape(n_labels, span)
+
+        # Remove NoData values and missing data values according to the configuration and the raster
+        values = np.arange(span) - offset
+        is_missing = values == missing_values
+        is_valid = (values != src.nodata) & ~is_missing & (values != no_data_values)
+
+        count = histogram.sum(axis=1)
+        missing_count = histogram[:, is_missing].sum(axis=1)
+        valid_histogram = histogram[:, is_valid]
+        valid_values = values[is_valid]
+        valid_count = valid_histogram.sum(axis=1)
+        total = valid_histogram @ valid_values.astype(np.float64)
+        present = valid_histogram > 0
+        has_valid = present.any(axis=1)
+        minimum = np.where(has_valid, valid_values[present.argmax(axis=1)], np.inf)
+        maximum = np.where(has_valid, valid_values[valid_values.size - 1 - present[:, ::-1].argmax(axis=1)], -np.inf)
+
+        # Drop the values not present in any zone, label 0 is outside all regions
+        present_values = present[1:].any(axis=0)
+        valid_values = valid_values[present_values]
+        valid_histogram = valid_histogram[1:, present_values]
+
+    else:
+        count = np.zeros(n_labels, dtype=np.int64)
+        valid_count = np.zeros(n_labels, dtype=np.int64)
+        missing_count = np.zeros(n_labels, dtype=np.int64)
+        total = np.zeros(n_labels, dtype=np.float64)
+        minimum = np.full(n_labels, np.inf)
+        maximum = np.full(n_labels, -np.inf)
+        valid_values = None
+        valid_histogram = None
+
+        with rasterio.Env(GDAL_CACHEMAX=cache_size_mb), rasterio.open(zone_file) as zones:
+            for labels, values in get_blocks(src, zones):
+                labels = labels.astype(np.intp)
+
+                count += np.bincount(labels, minlength=n_labels)
+
+                # Count the number of cells with the missing values
+                is_missing = values == missing_values
+                missing_count += np.bincount(labels[is_missing], minlength=n_labels)
+
+                # Remove NoData values and missing data values according to the configuration and the raster
+                is_valid = (values != src.nodata) & ~is_missing & (values != no_data_values)
+                valid_labels = labels[is_valid]
+                valid_values = values[is_valid].astype(np.float64)
+
+                valid_count += np.bincount(valid_labels, minlength=n_labels)
+                total += np.bincount(valid_labels, weights=valid_values, minlength=n_labels)
+                np.minimum.at(minimum, valid_labels, valid_values)
+                np.maximum.at(maximum, valid_labels, valid_values)
+
+    # Aggregate the zones to regions, label 0 is outside all regions
+    membership = zone_regions[1:]
+    labels = np.arange(1, n_labels)
+    minimum = np.array([minimum[labels[member]].min() for member in membership.T], dtype=np.float64)
+    maximum = np.array([maximum[labels[member]].max() for member in membership.T], dtype=np.float64)
+    return {
+        "count": count[1:] @ membership,
+        "valid_count": valid_count[1:] @ membership,
+        "missing_count": missing_count[1:] @ membership,
+        "sum": total[1:] @ membership,
+        "min": np.where(np.isinf(minimum), np.nan, minimum),
+        "max": np.where(np.isinf(maximum), np.nan, maximum),
+        "values": valid_values,
+        "histogram": None if valid_histogram is None else membership.T.astype(np.int64) @ valid_histogram
+    }
+
+
+def region_means(stats, missing_values):
+    """
+    Derives the rounded mean and the availability percentage of each region from the zonal statistics.
+
+    Args:
+        stats: Dict of zonal statistics (see zonal_stats)
+        missing_values: Value assigned to both for regions without valid values
+
+    Returns:
+        Tuple (raster_values, availability_percentages) of lists in the order of the regions
+    """
+    raster_values = []
+    availability_percentages = []
+    for valid_values_count, missing_values_count, values_sum in zip(
+            stats["valid_count"], stats["missing_count"], stats["sum"]):
+        if valid_values_count == 0:
+            # Handle empty intersection (assign missing_values)
+            raster_values.append(missing_values)
+            availability_percentages.append(missing_values)
+            continue
+
+        # Round mean value to the nearest integer
+        mean_value = np.float64(values_sum) / valid_values_count
+        mean_value_rounded = round(mean_value)
+
+        # Calculate percentage of availability
+        total_cells = valid_values_count+missing_values_count
+        availability_percentage = (
+            valid_values_count / total_cells) * 100
+
+        # Round availability percentage to two decimal places
+        availability_percentage_rounded = round(
+            availability_percentage, 1)
+        # Append rounded mean value and availability percentage to lists
+        raster_values.append(mean_value_rounded)
+        availability_percentages.append(
+            availability_percentage_rounded)
+
+    return raster_values, availability_percentages
+
+
+def histogram_percentiles(values, histogram, percentiles):
+    """
+    Computes percentiles per region from value histograms.
+
+    The percentile q is the smallest value with at least q % of the valid pixels at or below it, so it is always a
+    value of the raster (as np.percentile with method="inverted_cdf").
+
+    Args:
+        values: Sorted values of the histogram bins
+        histogram: Array of shape (regions, values) with the pixel counts
+        percentiles: List of percentiles between 0 and 100
+
+    Returns:
+        Array of shape (regions, percentiles), NaN for regions without valid values
+    """
+    cumulative = np.cumsum(histogram, axis=1)
+    total = cumulative[:, -1] if values.size else np.zeros(histogram.shape[0], dtype=np.int64)
+    result = np.full((histogram.shape[0], len(percentiles)), np.nan)
+    for index, percentile in enumerate(percentiles):
+        rank = np.maximum(np.ceil(total * percentile / 100), 1)
+        position = (cumulative < rank[:, None]).sum(axis=1)
+        result[total > 0, index] = values[position[total > 0]]
+    return result
+
+
+def region_distribution(stats, missing_values, classes):
+    """
+    Derives the percentiles and the class-area shares of each region from the histograms of the zonal statistics.
+
+    Args:
+        stats: Dict of zonal statistics (see zonal_stats)
+        missing_values: Value assigned for regions without valid values
+        classes: Dict of class names to inclusive (min, max) value ranges, e.g. vhi_classes
+
+    Returns:
+        Dict of lists in the order of the regions: the raster values of region_percentiles and the percentage of
+        valid pixels within each class as <class>_percentage rounded to one decimal. Empty if the raster has no
+        histograms.
+    """
+    if stats["histogram"] is None:
+        return {}
+
+    values = stats["values"]
+    histogram = stats["histogram"]
+    valid_count = histogram.sum(axis=1)
+    has_valid = valid_count > 0
+
+    distribution = {}
+    percentiles = histogram_percentiles(values, histogram, list(region_percentiles.values()))
+    for index, name in enumerate(region_percentiles):
+        distribution[name] = [int(value) if valid else missing_values
+                              for value, valid in zip(percentiles[:, index], has_valid)]
+
+    for name, (minimum, maximum) in classes.items():
+        class_count = histogram[:, (values >= minimum) & (values <= maximum)].sum(axis=1)
+        distribution[name + "_percentage"] = [round(count / valid * 100, 1) if valid else missing_values
+                                              for count, valid in zip(class_count, valid_count)]
+    return distribution
+
+
+def write_geojson(filename, shape_file, properties, dateISO8601):
+    """
+    Writes the warn regions with their properties as GeoJSON in WGS84.
+
+    The features are kept pre-serialized per shapefile with the rounded WGS84 geometries already encoded, so an
+    export only encodes the property values. The output is the same as json.dump of __geo_interface__.
+
+    Args:
+        filename: Path of the GeoJSON file
+        shape_file: Path to the shapefile with the warn regions
+        properties: DataFrame of the property columns in the order of the regions
+        dateISO8601: Date of the product as global_date
+
+    Returns:
+        None
+    """
+    digest = main_utils.shapefile_hash(shape_file)
+    if digest not in geojson_template_cache:
+        _, geometries_wgs84 = get_region_table(shape_file)
+        features = gpd.GeoDataFrame(geometry=geometries_wgs84).__geo_interface__["features"]
+
+        # Encode each feature once with a placeholder for the properties, split around it
+        placeholder = '"__properties__"'
+        geojson_template_cache[digest] = [
+            tuple(json.dumps(dict(feature, properties="__properties__")).split(placeholder))
+            for feature in features]
+    templates = geojson_template_cache[digest]
+
+    header = {
+        "type": "FeatureCollection",
+        "global_date": dateISO8601,
+        "crs": {"type": "name", "properties": {"name": "https://www.opengis.net/def/crs/OGC/1.3/CRS84"}}
+    }
+    columns = list(properties.columns)
+    rows = zip(*[properties[column].tolist() for column in columns])
+    features = [prefix + json.dumps(dict(zip(columns, row))) + suffix
+                for (prefix, suffix), row in zip(templates, rows)]
+
+    with open(filename, 'w') as outfile:
+        outfile.write(json.dumps(header)[:-1] + ', "features": [' + ", ".join(features) + "]}")
+
+
+def write_parquet(filename, shape_file, gdf):
+    """
+    Writes the warn regions with their attributes as GeoParquet.
+
+    The first export of a column layout is written by geopandas. Its Arrow schema, with the GeoParquet metadata,
+    and the encoded geometry column are kept, so the following exports only convert the attribute columns.
+
+    Args:
+        filename: Path of the GeoParquet file
+        shape_file: Path to the shapefile with the warn regions
+        gdf: GeoDataFrame of the regions with the geometries of get_region_table
+
+    Returns:
+        None
+    """
+    geometry_column = gdf.geometry.name
+    key = (main_utils.shapefile_hash(shape_file),
+           tuple((column, str(dtype)) for column, dtype in gdf.dtypes.items()))
+
+    if key not in parquet_template_cache:
+        gdf.to_parquet(filename, compression="gzip")
+        parquet_template_cache[key] = (pq.read_schema(filename),
+                                       pq.read_table(filename, columns=[geometry_column]).column(geometry_column))
+        return
+
+    schema, geometries = parquet_template_cache[key]
+    arrays = [geometries if field.name == geometry_column else pa.array(gdf[field.name], type=field.type)
+              for field in schema]
+    pq.write_table(pa.Table.from_arrays(arrays, schema=schema), filename, compression="gzip")
+
+
+def get_raster_date(raster_url):
+    """
+    Reads the date of a product from its file name, e.g. ch.swisstopo.swisseo_vhi_v100_mosaic_2023-07-13T235959_vegetation-10m.tif
+
+    Args:
+        raster_url: Path or URL of the raster
+
+    Returns:
+        Date as YYYY-MM-DD string, or None if the file name has no date
+    """
+    match = re.search(r"(\d{4}-\d{2}-\d{2})T\d{6}", os.path.basename(raster_url))
+    return match.group(1) if match else None
+
+
+def get_distribution_columns(stats, missing_values, scaling_factor, mean_type):
+    """
+    Names and scales the distribution statistics of the regions for the exports.
+
+    Args:
+        stats: Dict of zonal statistics (see zonal_stats)
+        missing_values: Value assigned for regions without valid values
+        scaling_factor: Factor to divide the percentile values by
+        mean_type: Name of the product, the class shares are only exported for "vhi"
+
+    Returns:
+        Dict of column names, e.g. vhi_median or extremely_dry_percentage, to lists of values
+    """
+    distribution = region_distribution(stats, missing_values, vhi_classes if mean_type == "vhi" else {})
+    columns = {}
+    for name, column_values in distribution.items():
+        if name in region_percentiles:
+            columns[mean_type + "_" + name] = scale_raster_values(column_values, scaling_factor)
+        else:
+            columns[name] = column_values
+    return columns
+
+
+def extract_stats(raster_url, shape_file, missing_values, no_data_values):
+    """
+    Computes the zonal statistics of one raster, run in the worker processes of export_batch.
+
+    Args:
+        raster_url: Path or URL of the raster
+        shape_file: Path to the shapefile with the warn regions
+        missing_values: Value of pixels with missing data
+        no_data_values: Value of pixels without data according to the configuration
+
+    Returns:
+        Dict of zonal statistics (see zonal_stats)
+    """
+    with rasterio.open(raster_url) as src:
+        return zonal_stats(src, shape_file, missing_values, no_data_values)
+
+
+def export_batch(raster_urls, shape_file, missing_values, no_data_values, scaling_factor, mean_type, max_workers=None):
+    """
+    Extracts the warn region statistics of many dates into one long-format table.
+
+    The zone raster is built once before the dates are distributed over a process pool, the workers only
+    stream their raster against it. Used to rebuild the archive of the regional statistics, e.g.
+    tools/available_ch.swisstopo.swisseo_vhi_v100.csv lists the available dates.
+
+    Args:
+        raster_urls: List of paths or URLs of the rasters, with the date in the file name
+        shape_file: Path to the shapefile with the warn regions
+        missing_values: Value of pixels with missing data
+        no_data_values: Value of pixels without data according to the configuration
+        scaling_factor: Factor to divide the mean values by
+        mean_type: Name of the product, e.g. "vhi", giving the column <mean_type>_mean
+        max_workers: Number of worker processes, defaults to the number of CPUs
+
+    Returns:
+        DataFrame with the columns date, REGION_NR, <mean_type>_mean, availability_percentage and the
+        distribution columns of export, sorted by date with the regions in the order of the shapefile. Rasters which cannot be read are reported and left out.
+
+    Example usage:
+        table = export_batch(vhi_urls, config.WARNREGIONS, 110, 255, 1, "vhi")
+        table.to_csv("warnregions_vhi.csv", index=False)
+    """
+    regionnr = "REGION_NR"  # depend on the  SHP file delivered by FOEN
+    mean_descriptor = mean_type + "_mean"
+    availpercen = "availability_percentage"
+    date_column = "date"
+
+    regions, _ = get_region_table(shape_file)
+    region_numbers = regions[regionnr].astype(int).tolist()
+
+    jobs = {}
+    for raster_url in raster_urls:
+        date = get_raster_date(raster_url)
+        if date is None:
+            print(f"Skipping {raster_url}: no date in the file name")
+            continue
+        jobs[raster_url] = date
+    if not jobs:
+        return pd.DataFrame(columns=[date_column, regionnr, mean_descriptor, availpercen])
+
+    # Build the zone raster once from the first readable raster, forked workers inherit it and workers on other
+    # grids (or all workers if no raster can be read here) build their own
+    for raster_url in jobs:
+        try:
+            with rasterio.open(raster_url) as src:
+                get_zone_raster(shape_file, src)
+            break
+        except Exception as e:
+            print(f"Could not build the zone raster from {raster_url}: {e}")
+
+    tables = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(extract_stats, raster_url, shape_file, missing_values, no_data_values): raster_url
+                   for raster_url in jobs}
+        for future in as_completed(futures):
+            raster_url = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"Error extracting {raster_url}: {e}")
+                continue
+
+            raster_values, availability_percentages = region_means(stats, missing_values)
+            table = pd.DataFrame({
+                date_column: jobs[raster_url],
+                regionnr: region_numbers,
+                mean_descriptor: scale_raster_values(raster_values, scaling_factor),
+                availpercen: availability_percentages
+            })
+            for column, column_values in get_distribution_columns(stats, missing_values, scaling_factor, mean_type).items():
+                table[column] = column_values
+            tables.append(table)
+
+    if not tables:
+        return pd.DataFrame(columns=[date_column, regionnr, mean_descriptor, availpercen])
+    return pd.concat(tables, ignore_index=True).sort_values(date_column, kind="stable", ignore_index=True)
+
+
 # ----------------------------------------
 def export(raster_url, shape_file, filename, dateISO8601, missing_values, no_data_values, scaling_factor, mean_type):
 
@@ -71,77 +746,28 @@ def export(raster_url, shape_file, filename, dateISO8601, missing_values, no_dat
     availpercen = "availability_percentage"
     date_column = "date"
 
-    gdf = gpd.read_file(shape_file)
+    # Regions with the geometries rounded once for all exports
+    regions, _ = get_region_table(shape_file)
+    gdf = regions.copy()
 
-    # Open the raster file from URL using rasterio
+    # Open the raster file from URL using rasterio and compute the statistics of all regions in one pass
     with rasterio.open(raster_url) as src:
-        # Iterate over each polygon
-        raster_values = []
-        availability_percentages = []
-        for idx, row in gdf.iterrows():
-
-            # Extract the geometry of the polygon
-            geom = row['geometry']
-            region = row[regionnr]
-            region_name = row[regionname]
-            try:
-                # Use rasterio to mask the raster with the polygon
-                out_image, out_transform = mask(src, [geom], crop=True)
-                # Extract the raster values
-                values = out_image[0].flatten()
-
-                # Count the number of cells with the missing values
-                missing_values_count = np.count_nonzero(
-                    values == missing_values)
+        stats = zonal_stats(src, shape_file, missing_values, no_data_values)
 
-                # Remove NoData values and missing data values according to the configuration and the raster
-                valid_values = values[(values != src.nodata)
-                                      & (values != missing_values)& (values != no_data_values)]
-
-                # Count the number of cells with the valid values
-                # valid_values_count = np.count_nonzero(valid_values)
-                valid_values_count = valid_values.size
-
-                # Store the mean value (or any other statistic you're interested in)
-                min_value = np.min(valid_values)
-                max_value = np.max(valid_values)
-                mean_value = np.mean(valid_values)
-
-                # Round mean value to the nearest integer
-                mean_value_rounded = round(mean_value)
-
-                # Calculate percentage of availability
-                total_cells = valid_values_count+missing_values_count
-                availability_percentage = (
-                    valid_values_count / total_cells) * 100
-
-                # Round availability percentage to two decimal places
-                availability_percentage_rounded = round(
-                    availability_percentage, 1)
-                # Append rounded mean value and availability percentage to lists
-                raster_values.append(mean_value_rounded)
-                availability_percentages.append(
-                    availability_percentage_rounded)
-
-                # Print statistics
-                # print(f"Region {region}: {region_name}")
-                # print(f"  Min value: {min_value}")
-                # print(f"  Max value: {max_value}")
-                # print(f"  Mean value: {mean_value_rounded}")
-                # print(
-                #     f"  Percentage of availability: {availability_percentage:.1f}%")
-            except ValueError:
-                # Handle empty intersection (assign missing_values)
-                raster_values.append(missing_values)
-                availability_percentages.append(missing_values)
+    raster_values, availability_percentages = region_means(stats, missing_values)
 
     # Add raster values and availability percentages to the GeoDataFrame
     
     gdf[mean_descriptor] = scale_raster_values(raster_values,scaling_factor)
     gdf[availpercen] = availability_percentages
 
+    # Add the percentiles and the class shares from the histograms of the same pass
+    distribution_columns = get_distribution_columns(stats, missing_values, scaling_factor, mean_type)
+    for column, column_values in distribution_columns.items():
+        gdf[column] = column_values
+
     # Save selected columns of the GeoDataFrame to a CSV file
-    gdf[[regionnr, mean_descriptor, availpercen]].to_csv(
+    gdf[[regionnr, mean_descriptor, availpercen] + list(distribution_columns)].to_csv(
         filename + '.csv', index=False)
 
     # Remove the "Name" column from the GeoDataFrame
@@ -149,42 +775,25 @@ def export(raster_url, shape_file, filename, dateISO8601, missing_values, no_dat
 
     # Convert "REGION_NR" and "vhi_mean" columns to UInt8 datatype
     gdf[regionnr] = gdf[regionnr].astype(int)
+    value_columns = [mean_descriptor] + [mean_type + "_" + name for name in region_percentiles
+                                         if mean_type + "_" + name in distribution_columns]
     if scaling_factor == 1:
-        gdf[mean_descriptor] = gdf[mean_descriptor].astype(int)
+        gdf[value_columns] = gdf[value_columns].astype(int)
     else:
-        gdf[mean_descriptor] = gdf[mean_descriptor].astype(float)
+        gdf[value_columns] = gdf[value_columns].astype(float)
     # print(gdf.dtypes)
 
-    # Round the coordinates to 0 decimals resulting in approx 0.2m displacement of the vertexes
-    gdf.geometry = shapely.wkt.loads(
-        shapely.wkt.dumps(gdf.geometry, rounding_precision=0))
-
     # Add the date to each region in UTC
     # gdf[date_column] = datetime.strptime(dateISO8601, "%Y-%m-%dT%H:%M:%SZ")
     gdf[date_column]= pd.to_datetime(dateISO8601).tz_convert('UTC').floor('s')
     # gdf[date_column] = gdf[date_column].astype()
 
     # Export the converted GeoDataFrame to a geoparquet file
-    gdf.to_parquet(filename+'.parquet', compression="gzip")
-
-    # Remove the "Name" column from the GeoDataFrame
-    gdf.drop(columns=[date_column], inplace=True)
+    write_parquet(filename+'.parquet', shape_file, gdf)
 
-    # Convert the GeoDataFrame to WGS84 (EPSG:4326)
-    gdf_wgs84 = gdf.to_crs(epsg=4326)
-
-    # Round the coordinates to 5 decimals resulting in approx 0.2-0.5m differences
-    gdf_wgs84.geometry = shapely.wkt.loads(
-        shapely.wkt.dumps(gdf_wgs84.geometry, rounding_precision=5))
-
-    # Construct the GeoJSON dictionary without features
-    geojson_dict = {
-        "type": "FeatureCollection",
-        "global_date": dateISO8601,
-        "crs": {"type": "name", "properties": {"name": "https://www.opengis.net/def/crs/OGC/1.3/CRS84"}},
-        "features": gdf_wgs84.__geo_interface__["features"]
-    }
+    # Export the properties without the date to a GeoJSON file with the rounded WGS84 (EPSG:4326) geometries
+    write_geojson(filename+'.geojson', shape_file,
+                  gdf.drop(columns=[gdf.geometry.name, date_column]), dateISO8601)
 
-    # Export the GeoJSON dictionary to a file
-    with open(filename+'.geojson', 'w') as outfile:
-        json.dump(geojson_dict, outfile)
+    # The percentile and class share columns written, e.g. for the metadata of the exports
+    return list(distribution_columns)
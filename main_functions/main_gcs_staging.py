@@ -0,0 +1,194 @@
+"""
+GCS Staging
+
+This module stages the files of the step0 raw imports and uploads. HTTP downloads are streamed to disk and resumed
+after a broken connection. Local files are uploaded to GCS with resumable chunked uploads, large files as parallel
+multipart uploads. All transfers are retried and verified with checksums.
+
+The raw files are downloaded to disk and not streamed into GCS, since every import converts them locally
+(netCDF to COG) and only uploads the result.
+
+The module is shared by the MSG LST processors, util_create_LSTMAX, util_upload_dxdy and util_upload_LST_MAX_DOY.
+
+License: MIT License
+
+Usage:
+    main_gcs_staging.download_file(url, "msg.LST_PMW.H_ch02.lonlat_20240412000000.nc")
+    main_gcs_staging.upload_file(bucket.blob("MSG_LST_2024-04-12T110000.tif"), "MSG_LST_2024-04-12T110000.tif")
+
+    For tests, google-cloud-storage uses a local GCS emulator if STORAGE_EMULATOR_HOST is set
+    (e.g. STORAGE_EMULATOR_HOST=http://localhost:9023), the downloads work with any local HTTP server.
+
+Dependencies:
+    - requests
+    - google-cloud-storage
+    - google-crc32c
+
+Functions:
+    - download_file(url: str, path: str, retries: int) -> str
+    - upload_file(blob: storage.Blob, path: str, chunk_size: int) -> storage.Blob
+"""
+
+import base64
+import hashlib
+import os
+import time
+import google_crc32c
+import requests
+from google.cloud.storage import transfer_manager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Chunk size of the resumable uploads, a multiple of 256 KiB
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Files from this size on are uploaded in parallel parts
+PARALLEL_UPLOAD_THRESHOLD = 256 * 1024 * 1024
+PARALLEL_UPLOAD_WORKERS = 8
+
+# Attempts of a download, a broken download is resumed from the partial file
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60  # seconds
+
+session = None
+
+
+def get_session():
+    """Returns the shared HTTP session with pooled connections, retrying on 429 and 5xx responses."""
+    global session
+    if session is None:
+        session = requests.Session()
+        retry = Retry(total=DOWNLOAD_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["HEAD", "GET"])
+        session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=16))
+        session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=16))
+    return session
+
+
+def get_crc32c(path):
+    """Returns the CRC32C of a file, base64 encoded as reported by GCS."""
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+def get_expected_md5(response):
+    """Returns the MD5 of the response body announced by the server (x-goog-hash or Content-MD5), None if unknown."""
+    hashes = [value.strip() for value in response.headers.get("x-goog-hash", "").split(",")]
+    md5 = next((value[len("md5="):] for value in hashes if value.startswith("md5=")),
+               response.headers.get("Content-MD5"))
+    return base64.b64decode(md5).hex() if md5 else None
+
+
+def download_file(url, path, retries=DOWNLOAD_RETRIES):
+    """
+    Streams a file from a URL to disk, resuming a broken download from the partial file.
+
+    The file is written to path + ".part" and moved to path when it is complete and its size and, if announced by
+    the server, its MD5 are verified.
+
+    Args:
+        url (str): URL of the file
+        path (str): Path of the downloaded file
+        retries (int): Number of attempts
+
+    Returns:
+        str: Path of the downloaded file
+
+    Raises:
+        requests.RequestException: If the download fails after all attempts, e.g. the file does not exist
+        IOError: If the downloaded file does not match its size or checksum
+    """
+    part_path = path + ".part"
+    expected_md5 = None
+
+    for attempt in range(1, retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # Without content encoding, the Content-Length and the checksum are those of the written bytes
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        try:
+            with get_session().get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 416:
+                    # Nothing left to download or the partial file is invalid, start over
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+
+                # Continue the partial file only if the server returns the requested range
+                resumed = response.status_code == 206
+                expected_size = int(response.headers["Content-Length"]) + (offset if resumed else 0) \
+                    if "Content-Length" in response.headers else None
+                if not resumed:
+                    expected_md5 = get_expected_md5(response)
+
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            print(f"Download of {url} interrupted (attempt {attempt}/{retries}): {str(e)}")
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+            continue
+
+        if expected_size is not None and os.path.getsize(part_path) != expected_size:
+            print(f"Download of {url} incomplete (attempt {attempt}/{retries}), resuming")
+            continue
+
+        if expected_md5 is not None:
+            md5 = hashlib.md5()
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    md5.update(chunk)
+            if md5.hexdigest() != expected_md5:
+                os.remove(part_path)
+                print(f"Checksum of {url} does not match (attempt {attempt}/{retries})")
+                continue
+
+        os.replace(part_path, path)
+        return path
+
+    raise IOError(f"Download of {url} failed after {retries} attempts")
+
+
+def verify_upload(blob, crc32c):
+    """Compares the CRC32C of an uploaded blob with the expected one."""
+    if blob.crc32c is not None and blob.crc32c != crc32c:
+        raise IOError(f"Checksum of gs://{blob.bucket.name}/{blob.name} does not match the source")
+
+
+def upload_file(blob, path, chunk_size=CHUNK_SIZE):
+    """
+    Uploads a local file to GCS with a resumable chunked upload and verifies its checksum.
+
+    Files from PARALLEL_UPLOAD_THRESHOLD on are uploaded as parallel multipart upload. The chunks and parts are
+    retried by google-cloud-storage.
+
+    Args:
+        blob (storage.Blob): Target blob
+        path (str): Path of the local file
+        chunk_size (int): Size of the chunks, a multiple of 256 KiB
+
+    Returns:
+        storage.Blob: Uploaded blob
+
+    Raises:
+        IOError: If the checksum of the uploaded blob does not match the file
+    """
+    if os.path.getsize(path) >= PARALLEL_UPLOAD_THRESHOLD:
+        transfer_manager.upload_chunks_concurrently(path, blob, chunk_size=max(chunk_size, 32 * 1024 * 1024),
+                                                    max_workers=PARALLEL_UPLOAD_WORKERS, worker_type="thread")
+    else:
+        blob.chunk_size = chunk_size
+        blob.upload_from_filename(path, checksum="crc32c")
+
+    blob.reload()
+    verify_upload(blob, get_crc32c(path))
+    return blob
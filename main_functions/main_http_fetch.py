@@ -0,0 +1,253 @@
+"""
+Conditional HTTP Fetch
+
+This module downloads the raw files of the step0 imports (e.g. the MeteoSwiss netCDF files on data.geo.admin.ch)
+into a local cache and keeps their validators (ETag and Last-Modified) in a persistent JSON file. A cached file is
+only revalidated with If-None-Match / If-Modified-Since, so repeated runs which check the same dates transfer
+nothing but a 304 response. The requests reuse the pooled connections of main_gcs_staging.
+
+The transfers are counted in stats (requests, downloads, not modified responses, bytes and seconds).
+
+The cache is kept between the runs: the step0 workflow on GitHub restores cache/http from one cache entry and,
+at the end of the run, deletes the raw files which the run did not use (evict with max_age) before it saves the
+entry again. Locally it stays on disk, and the least recently used files are evicted when a download exceeds
+FETCH_CACHE_MAX_BYTES.
+
+The validators file is shared by all processes using the cache and guarded by a file lock. Files which are in use,
+e.g. the monthly files of a running import, are pinned (fetch(url, pin=True)) and not evicted until unpin(path).
+
+License: MIT License
+
+Usage:
+    raw_file = main_http_fetch.fetch(url)  # path in the cache, None if the file does not exist
+    raw_file = main_http_fetch.fetch(url, pin=True)  # not evicted until main_http_fetch.unpin(raw_file)
+    print(main_http_fetch.get_stats())
+
+Dependencies:
+    - requests
+
+Functions:
+    - fetch(url: str, cache_path: str, pin: bool) -> str
+    - unpin(path: str)
+    - evict(cache_path: str, max_bytes: int, keep: iterable, max_age: float)
+    - get_stats() -> dict
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+from main_functions import main_gcs_staging
+
+# Cache of the downloaded files and their validators, the least recently used files are evicted above
+# FETCH_CACHE_MAX_BYTES
+FETCH_CACHE_PATH = os.path.join("cache", "http")
+FETCH_CACHE_MAX_BYTES = 2 * 1024**3
+VALIDATORS_FILE = "validators.json"
+
+stats = {"requests": 0, "downloads": 0, "not_modified": 0, "bytes": 0, "seconds": 0.0}
+lock = threading.Lock()
+
+# Absolute paths of the cached files which are in use and not evicted
+pinned_files = set()
+
+
+def get_cache_file(url, cache_path=FETCH_CACHE_PATH):
+    """Returns the path of a URL in the cache, the file name prefixed with a hash of the URL."""
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_path, f"{digest}_{os.path.basename(url)}")
+
+
+def load_validators(cache_path=FETCH_CACHE_PATH):
+    """Loads the validators of the cached files, an empty dict if there are none."""
+    try:
+        with open(os.path.join(cache_path, VALIDATORS_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def validators_lock(cache_path=FETCH_CACHE_PATH):
+    """Locks the validators file against the threads of this process and against other processes."""
+    with lock, open(os.path.join(cache_path, VALIDATORS_FILE + ".lock"), "a+") as lock_file:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_validators(url, validators, cache_path=FETCH_CACHE_PATH):
+    """
+    Stores the validators of a URL, merged with the validators written in the meantime by other processes.
+
+    Args:
+        url (str): URL of the file
+        validators (dict): ETag, Last-Modified and size of the cached file, None to remove the URL
+        cache_path (str): Directory of the cache
+    """
+    with validators_lock(cache_path):
+        all_validators = load_validators(cache_path)
+        if validators is None:
+            all_validators.pop(url, None)
+        else:
+            all_validators[url] = validators
+
+        validators_file = os.path.join(cache_path, VALIDATORS_FILE)
+        temp_file = f"{validators_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(all_validators, f, indent=1)
+        os.replace(temp_file, validators_file)
+
+
+def evict(cache_path=FETCH_CACHE_PATH, max_bytes=FETCH_CACHE_MAX_BYTES, keep=(), max_age=None):
+    """
+    Removes the least recently used files from the cache until it fits into max_bytes.
+
+    Args:
+        cache_path (str): Directory of the cache
+        max_bytes (int): Maximum size of the cache in bytes
+        keep (iterable): Paths which are not removed, in addition to the pinned files
+        max_age (float): Also remove the files which were not used (downloaded or revalidated) within max_age
+            seconds, e.g. the files a run did not use. None to only limit the size
+    """
+    if not os.path.isdir(cache_path):
+        return
+    with lock:
+        keep = {os.path.abspath(path) for path in keep} | pinned_files
+    files = []
+    for file_name in os.listdir(cache_path):
+        path = os.path.join(cache_path, file_name)
+        if not file_name.startswith(VALIDATORS_FILE) and not file_name.endswith(".tmp") and os.path.isfile(path):
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    oldest = time.time() - max_age if max_age is not None else None
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes and (oldest is None or mtime >= oldest):
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"Could not evict {path}: {str(e)}")
+
+
+def fetch(url, cache_path=FETCH_CACHE_PATH, pin=False):
+    """
+    Gets a file into the cache, downloading it only if it is not cached or has changed on the server.
+
+    Args:
+        url (str): URL of the file
+        cache_path (str): Directory of the cache
+        pin (bool): Keep the file from being evicted by this process until unpin is called
+
+    Returns:
+        str: Path of the current file in the cache, None if the file does not exist on the server (404 or 410)
+
+    Raises:
+        requests.RequestException: If the request fails
+        IOError: If the download is incomplete
+    """
+    os.makedirs(cache_path, exist_ok=True)
+    cache_file = get_cache_file(url, cache_path)
+
+    # Pin before the request, so a concurrent eviction cannot remove the file before it is returned
+    if pin:
+        with lock:
+            pinned_files.add(os.path.abspath(cache_file))
+    try:
+        result = fetch_to_cache(url, cache_file, cache_path)
+    except BaseException:
+        if pin:
+            unpin(cache_file)
+        raise
+    if result is None and pin:
+        unpin(cache_file)
+    return result
+
+
+def fetch_to_cache(url, cache_file, cache_path):
+    """Requests a file conditionally and updates the cached file and its validators, see fetch."""
+    # Revalidate the cached file if it is complete
+    headers = {"Accept-Encoding": "identity"}
+    validators = load_validators(cache_path).get(url)
+    if validators and os.path.exists(cache_file) and os.path.getsize(cache_file) == validators.get("size"):
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    start = time.time()
+    transferred = 0
+    with main_gcs_staging.get_session().get(url, headers=headers, stream=True,
+                                            timeout=main_gcs_staging.DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            # Mark as recently used
+            os.utime(cache_file)
+        elif response.status_code in (404, 410):
+            save_validators(url, None, cache_path)
+        else:
+            response.raise_for_status()
+            temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+                    transferred += len(chunk)
+            if "Content-Length" in response.headers and transferred != int(response.headers["Content-Length"]):
+                os.remove(temp_file)
+                raise IOError(f"Download of {url} incomplete")
+            os.replace(temp_file, cache_file)
+            save_validators(url, {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "size": transferred
+            }, cache_path)
+
+    with lock:
+        stats["requests"] += 1
+        stats["seconds"] += time.time() - start
+        stats["bytes"] += transferred
+        if response.status_code == 304:
+            stats["not_modified"] += 1
+        elif response.status_code not in (404, 410):
+            stats["downloads"] += 1
+
+    if response.status_code in (404, 410):
+        return None
+    if response.status_code == 304:
+        print(f"Not modified since the last download: {url}")
+    else:
+        print(f"Downloaded {transferred / 1024**2:.1f} MB in {time.time() - start:.1f} s: {url}")
+        evict(cache_path, keep=[cache_file])
+    return cache_file
+
+
+def unpin(path):
+    """Releases a file pinned by fetch, it can be evicted again."""
+    with lock:
+        pinned_files.discard(os.path.abspath(path))
+
+
+def get_stats():
+    """Returns a copy of the transfer stats of this process."""
+    with lock:
+        return dict(stats)
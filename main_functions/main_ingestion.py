@@ -0,0 +1,129 @@
+"""
+Earth Engine Manifest Ingestion
+
+This module ingests GeoTIFFs staged on GCS as EE image assets with ee.data.startIngestion, instead of loading them
+with ee.Image.loadGeoTIFF and exporting them with Export.image.toAsset. An ingestion does not run an EE compute
+task (no batch EECU time) and existing assets are overwritten, so they do not have to be deleted first.
+
+The manifests are built from the same properties as set with image.set(). Many manifests, e.g. the 366 reference
+DOYs, are submitted in bulk and tracked with main_task_tracker.
+
+License: MIT License
+
+Usage:
+    manifest = main_ingestion.get_manifest(asset_name, "gs://bucket/MSG_LST_2024-04-12T110000.tif", ["LST_PMW"], properties)
+    task_id = main_ingestion.start_ingestion(manifest, on_complete)
+    task_ids = main_ingestion.start_ingestions([(manifest, on_complete), ...])
+
+Dependencies:
+    - earthengine-api
+    - concurrent.futures
+
+Functions:
+    - get_manifest(asset_name: str, uri: str, band_names: list, properties: dict, pyramiding_policy: str, no_data: float) -> dict
+    - start_ingestion(manifest: dict, on_complete: callable, description: str) -> str
+    - start_ingestions(ingestions: list, max_workers: int) -> dict
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import ee
+from main_functions import main_task_tracker
+
+# Pyramiding policy of the bands, as the default of Export.image.toAsset
+PYRAMIDING_POLICY = "MEAN"
+
+# Parallel requests when submitting many ingestions
+INGESTION_WORKERS = 8
+
+
+def to_rfc3339(milliseconds):
+    """Converts milliseconds since the epoch (as system:time_start) to an RFC 3339 UTC timestamp."""
+    return datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_manifest(asset_name, uri, band_names, properties, pyramiding_policy=PYRAMIDING_POLICY, no_data=0):
+    """
+    Builds the ingestion manifest of a GeoTIFF on GCS.
+
+    system:time_start and system:time_end become the start and end time of the asset. The other system:
+    properties cannot be ingested and are dropped, e.g. system:name is given by the asset name.
+
+    Args:
+        asset_name (str): Asset ID, e.g. projects/satromo-int/assets/.../LST_2024-04-12T110000_bands-1721m
+        uri (str): GCS URI of the GeoTIFF
+        band_names (list): Names of the bands, in the order of the GeoTIFF bands
+        properties (dict): Properties as set with image.set()
+        pyramiding_policy (str): Pyramiding policy of the bands, e.g. "MEAN", "MODE" or "SAMPLE"
+        no_data (float): Value of the masked pixels, None to use the mask of the GeoTIFF
+
+    Returns:
+        dict: Manifest for ee.data.startIngestion
+    """
+    manifest = {
+        "name": asset_name,
+        "tilesets": [{"id": "0", "sources": [{"uris": [uri]}]}],
+        "bands": [
+            {"id": band_name, "tileset_id": "0", "tileset_band_index": index, "pyramiding_policy": pyramiding_policy}
+            for index, band_name in enumerate(band_names)
+        ],
+        "properties": {key: value for key, value in properties.items()
+                       if not key.startswith("system:") and value is not None}
+    }
+    if no_data is not None:
+        manifest["missing_data"] = {"values": [no_data]}
+    if "system:time_start" in properties:
+        manifest["start_time"] = to_rfc3339(properties["system:time_start"])
+    if "system:time_end" in properties:
+        manifest["end_time"] = to_rfc3339(properties["system:time_end"])
+    return manifest
+
+
+def start_ingestion(manifest, on_complete=None, description=None):
+    """
+    Starts the ingestion of a manifest, overwriting an existing asset.
+
+    Args:
+        manifest (dict): Manifest (see get_manifest)
+        on_complete (callable): Called by main_task_tracker with the status when the ingestion has finished,
+            None to not track the ingestion
+        description (str): Description for the log, None for the asset name
+
+    Returns:
+        str: Task ID of the ingestion
+
+    Raises:
+        ee.EEException: If the ingestion cannot be started
+    """
+    request_id = ee.data.newTaskId()[0]
+    task_id = ee.data.startIngestion(request_id, manifest, allow_overwrite=True)["id"]
+    print(f"Ingestion of {manifest['name']} started: {task_id}")
+
+    if on_complete is not None:
+        main_task_tracker.register(task_id, on_complete, description or manifest["name"])
+    return task_id
+
+
+def start_ingestions(ingestions, max_workers=INGESTION_WORKERS):
+    """
+    Starts the ingestion of many manifests in parallel requests.
+
+    Args:
+        ingestions (list): Tuples (manifest, on_complete), see start_ingestion
+        max_workers (int): Number of parallel requests
+
+    Returns:
+        dict: Task ID per asset name of the started ingestions, the failed ones are logged
+    """
+    task_ids = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(start_ingestion, manifest, on_complete): manifest["name"]
+                   for manifest, on_complete in ingestions}
+        for future in as_completed(futures):
+            try:
+                task_ids[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Error starting the ingestion of {futures[future]}: {str(e)}")
+
+    print(f"Started {len(task_ids)} of {len(futures)} ingestions")
+    return task_ids
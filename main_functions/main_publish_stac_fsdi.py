@@ -54,6 +54,9 @@ wgs84 = pyproj.CRS.from_epsg(4326)  # WGS84 EPSG code
 transformer_lv95_to_wgs84 = pyproj.Transformer.from_crs(
     lv95, wgs84, always_xy=True)
 
+# Footprints of already published items by orbit buffer, resolution and extent, see get_footprint
+footprint_cache = {}
+
 
 def determine_run_type():
     """
@@ -421,6 +424,42 @@ def create_asset(stac_asset_url, payload):
 
 
 
+def get_footprint(asset):
+    """
+    Returns the WGS84 footprint of a GeoTIFF asset.
+
+    Only the GeoTIFF header of the asset is read (no sidecar file lookup, no pixel data). The reprojected footprint
+    is cached by (orbit buffer, product resolution, extent): assets of a day merged with the same cutline and
+    resolution share it, while merged assets with a different extent get their own entry.
+
+    Args:
+        asset (str): The filename of the GeoTIFF asset, e.g. "..._bands-10m.tif".
+
+    Returns:
+        list: The closed ring of [lon, lat] coordinates of the footprint.
+    """
+    # Get the product resolution from the asset name, e.g. "10m"
+    match = re.search(r'-(\d+m)\.tif$', asset)
+    resolution = match.group(1) if match else None
+
+    # Read the bounds from the GeoTIFF header only
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+        with rasterio.open(asset) as ds:
+            bounds = tuple(ds.bounds)
+
+    # config.BUFFER is set per orbit by the publisher before merging
+    key = (getattr(config, 'BUFFER', None), resolution, bounds)
+
+    if key not in footprint_cache:
+        # Create a list of coordinates (in this case, a rectangle) and convert them in one call
+        left, bottom, right, top = bounds
+        lons, lats = transformer_lv95_to_wgs84.transform(
+            [left, right, right, left, left], [bottom, bottom, top, top, bottom])
+        footprint_cache[key] = [list(coord) for coord in zip(lons, lats)]
+
+    return footprint_cache[key]
+
+
 def publish_to_stac(raw_asset, raw_item, collection, geocat_id, current=None):
     """
     Publishes a STAC asset.
@@ -491,23 +530,8 @@ def publish_to_stac(raw_asset, raw_item, collection, geocat_id, current=None):
             if asset_type == 'TIF':
                 print(f"ITEM object {item}: creating")
                 # Create payload
-                # Getting the bounds
-                # Open the GeoTIFF file
-                with rasterio.open(asset) as ds:
-                    # Get the bounds of the raster
-                    left, bottom, right, top = ds.bounds
-
-                # Create a list of coordinates (in this case, a rectangle)
-                coordinates_lv95 = [
-                    [left, bottom],
-                    [right, bottom],
-                    [right, top],
-                    [left, top],
-                    [left, bottom]
-                ]
-                # Convert your coordinates
-                coordinates_wgs84 = [transformer_lv95_to_wgs84.transform(
-                    *coord) for coord in coordinates_lv95]
+                # Getting the footprint from the GeoTIFF header of the asset, cached per orbit buffer, resolution and extent
+                coordinates_wgs84 = get_footprint(asset)
 
                 # Check if raw_item ends with "240000", since python does not recognize the newest version of ISO8601 of October 2022: "An amendment was published in October 2022 featuring minor technical clarifications and attempts to remove ambiguities in definitions. The most significant change, however, was the reintroduction of the "24:00:00" format to refer to the instant at the end of a calendar day."
 
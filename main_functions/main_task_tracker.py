@@ -0,0 +1,201 @@
+"""
+Earth Engine Task Tracker
+
+This module tracks started EE export and ingestion tasks without blocking the caller. Each task is registered
+with a completion callback, e.g. to delete the staged file on GCS and to log the result. One background thread
+queries the status of the pending tasks per interval and calls the callbacks of the finished tasks, so the ingests
+of many days overlap instead of running one after the other. Up to LIST_THRESHOLD pending tasks are queried by ID
+(ee.data.getTaskStatus, one request per task), more are taken from one task list (ee.data.getTaskList, one request
+per page of 500 tasks).
+
+The callbacks receive the status in the format of task.status(): 'id', 'state' ('COMPLETED', 'FAILED' or
+'CANCELLED'), 'description' and, for failed tasks, 'error_message'. A task which EE does not know (anymore) is
+reported as 'FAILED'. The processors call wait_all at their end, which also logs the failed tasks. Before the
+process exits, it waits up to WAIT_TIMEOUT for tasks which are still pending, so their callbacks are called as well.
+
+License: MIT License
+
+Usage:
+    task.start()
+    main_task_tracker.register(task, on_complete)
+    ...
+    main_task_tracker.wait_all()  # e.g. before the assets are used and at the end of the processor
+
+Dependencies:
+    - earthengine-api
+    - threading
+
+Functions:
+    - register(task, on_complete: callable, description: str) -> str
+    - poll() -> int
+    - get_pending() -> list
+    - get_failed() -> list
+    - wait_all(timeout: float) -> int
+"""
+
+import atexit
+import threading
+import time
+import ee
+
+# Seconds between the status queries
+POLL_INTERVAL = 15
+
+# Seconds wait_all waits by default, also before the process exits, then the pending tasks are logged and left
+WAIT_TIMEOUT = 60 * 60
+
+# States of finished tasks
+FINISHED_STATES = ('COMPLETED', 'FAILED', 'CANCELLED')
+
+# Maximum pending tasks queried by ID, more are looked up in the task list
+LIST_THRESHOLD = 10
+
+# Pending tasks: task ID -> (description, callback)
+pending_tasks = {}
+
+# Failed and cancelled tasks since the last wait_all: (description, error message)
+failed_tasks = []
+lock = threading.Lock()
+poller = None
+exit_handler_registered = False
+
+
+def register(task, on_complete, description=None):
+    """
+    Registers a started task, the callback is called by the background poller when the task has finished.
+
+    Args:
+        task (ee.batch.Task or str): Started task or the ID of a started task, e.g. of an ingestion
+        on_complete (callable): Called with the status (format of task.status()) when the task has finished
+        description (str): Description for the log, None for the task ID
+
+    Returns:
+        str: Task ID
+    """
+    global poller, exit_handler_registered
+    task_id = task if isinstance(task, str) else task.id
+
+    with lock:
+        pending_tasks[task_id] = (description or task_id, on_complete)
+
+        if not exit_handler_registered:
+            atexit.register(wait_all, WAIT_TIMEOUT)
+            exit_handler_registered = True
+
+        if poller is None:
+            poller = threading.Thread(target=run_poller, name="ee-task-poller", daemon=True)
+            poller.start()
+
+    return task_id
+
+
+def poll():
+    """
+    Queries the status of the pending tasks and calls the callbacks of the finished tasks.
+
+    Returns:
+        int: Number of tasks which are still pending
+    """
+    with lock:
+        if not pending_tasks:
+            return 0
+        task_ids = list(pending_tasks)
+
+    try:
+        if len(task_ids) <= LIST_THRESHOLD:
+            statuses = ee.data.getTaskStatus(task_ids)
+        else:
+            # Tasks which are not listed (yet) stay pending
+            pending_ids = set(task_ids)
+            statuses = [status for status in ee.data.getTaskList() if status['id'] in pending_ids]
+    except Exception as e:
+        print(f"Error checking the status of {len(task_ids)} tasks: {str(e)}")
+        return len(task_ids)
+
+    for status in statuses:
+        if status['state'] == 'UNKNOWN':
+            # e.g. a lost task ID, it would never finish
+            status = dict(status, state='FAILED', error_message='Task not found')
+        if status['state'] not in FINISHED_STATES:
+            continue
+
+        with lock:
+            description, on_complete = pending_tasks.pop(status['id'], (None, None))
+        if on_complete is None:
+            # Already handled by a concurrent poll
+            continue
+        if status['state'] != 'COMPLETED':
+            with lock:
+                failed_tasks.append((description, status.get('error_message', status['state'])))
+        try:
+            on_complete(status)
+        except Exception as e:
+            print(f"Error in the completion callback of task {description}: {str(e)}")
+
+    with lock:
+        return len(pending_tasks)
+
+
+def get_pending():
+    """Returns the descriptions of the pending tasks."""
+    with lock:
+        return [description for description, _ in pending_tasks.values()]
+
+
+def get_failed():
+    """Returns the failed and cancelled tasks since the last wait_all as tuples (description, error message)."""
+    with lock:
+        return list(failed_tasks)
+
+
+def run_poller():
+    """Polls the pending tasks until there are none left."""
+    global poller
+    while True:
+        time.sleep(POLL_INTERVAL)
+        poll()
+        with lock:
+            if not pending_tasks:
+                poller = None
+                return
+
+
+def wait_all(timeout=WAIT_TIMEOUT):
+    """
+    Waits until all registered tasks have finished and their callbacks are called, then logs the failed tasks.
+
+    Args:
+        timeout (float): Maximum seconds to wait, then the pending tasks are logged. None to wait until all tasks
+            have finished
+
+    Returns:
+        int: Number of tasks which are still pending
+    """
+    start = time.time()
+    while True:
+        with lock:
+            remaining = len(pending_tasks)
+            running = poller is not None
+        if remaining == 0:
+            break
+        if timeout is not None and time.time() - start >= timeout:
+            print(f"Stopped waiting after {timeout} s for {remaining} tasks: {', '.join(get_pending())}")
+            break
+
+        if running:
+            time.sleep(1)
+        else:
+            # e.g. during interpreter shutdown, poll in this thread
+            time.sleep(POLL_INTERVAL)
+            poll()
+
+    # Log the failed tasks once
+    with lock:
+        failed = list(failed_tasks)
+        failed_tasks.clear()
+    if failed:
+        print(f"{len(failed)} tasks failed:")
+        for description, error_message in failed:
+            print(f"  {description}: {error_message}")
+
+    return remaining
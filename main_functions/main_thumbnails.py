@@ -1,21 +1,237 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import configuration as config
-import subprocess
+from main_functions import main_utils
 import rasterio
 import numpy as np
-from rasterio.transform import from_origin
+from rasterio.enums import Resampling
+from rasterio.errors import RasterioError
+from rasterio.features import rasterize
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+from rasterio.windows import from_bounds as window_from_bounds
+from rasterio.windows import transform as window_transform
 from shapely.geometry import shape
 import fiona
+from fiona.errors import FionaError
+
+
+# Rasterized base layers (Swiss fill, rivers and lakes), keyed by layer and output size
+base_layer_cache = {}
+base_layer_lock = threading.Lock()
+
+
+# Color maps per product: inclusive (min, max) value ranges to RGB, later ranges win where they overlap
+color_map_vhi = {
+    (0, 10): (181, 106, 41),    # [0,10] extremely dry - dark brown
+    (11, 20): (206, 133, 64),   # (10,20] severely dry - brown
+    (21, 30): (245, 205, 133),  # (20,30] moderately dry - beige
+    (31, 40): (255, 245, 186),  # (30,40] mild dry - yellow
+    (41, 50): (203, 255, 202),  # (40,50] normal - light green
+    (51, 60): (82, 189, 159),   # (50,60] good - green
+    (61, 100): (4, 112, 176),   # (60,100] excellent - blue
+    (110, 110): (128, 128, 128),  # 110 missing data values- gray
+    (255, 255): (255, 255, 255)  # 255 no data values- white
+}
+
+color_map_ndvi_z = {  # scaling factor 100
+    (-550, -450): (125, 102, 8),    # dark brown
+    (-449, -350): (169, 137, 11),
+    (-349, -250): (212, 172, 13),
+    (-249, -150): (230, 196, 62),
+    (-149, -50): (247, 220, 111),   # light yellow
+    (-49, 0.5): (245, 245, 245),    # light grey
+    (49, 150): (125, 206, 160),     # light green
+    (149, 250): (80, 180, 122),
+    (249, 350): (34, 153, 84),
+    (349, 450): (27, 122, 67),
+    (449, 550): (20, 90, 50),       # dark green
+}
+
+color_map_ndvi_diff = {  # scaling factor 1000
+    (-1000, -300): (183, 28, 28),    # dark red
+    (-299, -225): (205, 90, 72),
+    (-224, -150): (228, 153, 116),
+    (-149, -75): (250, 215, 160),   # light orange
+    (-74, 74): (245, 245, 245),    # light grey
+    (75, 149): (128, 203, 196),     # light turquoise2
+    (150, 224): (85, 161, 152),
+    (225, 299): (43, 119, 108),
+    (300, 1000): (0, 77, 64),       # dark turquoise
+}
+
+color_map_ndmi_z = {  # scaling factor 100
+    (-550, -450): (120, 66, 18),    # dark brown
+    (-449, -350): (161, 88, 24),   #
+    (-349, -250): (202, 111, 30),  #
+    (-249, -150): (221, 144, 76),  #
+    (-149, -50): (240, 178, 122),  # light brown
+    (-49, 0.5): (245, 245, 245),   # light grey
+    (49, 150): (133, 193, 233),   # light blue
+    (149, 250): (89, 163, 213),  #
+    (249, 350): (46, 134, 193),  #
+    (349, 450): (36, 106, 153),  #
+    (449, 550): (27, 79, 114),  # dark blue
+}
+
+# Missing data of the z-score / diff products: light grey, no data (32701) stays background
+special_colors_z = {32700: (220, 220, 220)}
+
+
+def build_color_lut(color_map, special_colors=None, background=(255, 255, 255)):
+    """
+    Turns a color map into a lookup table over the integer value domain.
+
+    The table covers all values from the smallest to the largest bound of the color map and the special values,
+    padded with one background entry on each side, so that values outside the domain can be clipped onto it.
+    Negative values (NDVIz, NDVIdiff) are handled by the returned offset.
+
+    Args:
+    color_map (dict): Inclusive (min, max) value ranges mapped to (R, G, B); later ranges win where they overlap.
+    special_colors (dict): Single values mapped to (R, G, B), applied after the ranges.
+    background (tuple): (R, G, B) of values not covered by any range.
+
+    Returns:
+    tuple: (lut, offset) with lut of shape (3, N) and dtype uint8, and the offset to add to a value to get its index.
+
+    Example usage:
+    lut, offset = build_color_lut(color_map_ndvi_z, special_colors_z)
+    """
+    special_colors = special_colors or {}
+
+    # Integer value domain of the color map
+    lows = [int(np.ceil(low)) for low, high in color_map] + list(special_colors)
+    highs = [int(np.floor(high)) for low, high in color_map] + list(special_colors)
+    domain_min = min(lows) - 1
+    domain_max = max(highs) + 1
+    offset = -domain_min
+
+    # Initialize the table with the background color
+    lut = np.empty((3, domain_max - domain_min + 1), dtype=np.uint8)
+    lut[:] = np.array(background, dtype=np.uint8)[:, np.newaxis]
+
+    # Fill ranges in order, then the special values. A range written as (max, min) matches no value
+    for (low, high), color in color_map.items():
+        low = int(np.ceil(low))
+        high = int(np.floor(high))
+        if low <= high:
+            lut[:, low + offset:high + offset + 1] = np.array(
+                color).astype(np.uint8)[:, np.newaxis]
+    for value, color in special_colors.items():
+        lut[:, value + offset] = np.array(color).astype(np.uint8)
+
+    return lut, offset
 
-import os
-import subprocess
-import fiona
-from shapely.geometry import shape
+
+def apply_color_lut(data, lut, offset):
+    """
+    Colorizes a single band with a lookup table from build_color_lut.
+
+    Values outside the table domain are clipped onto its background padding, the colors are then looked up with a
+    single np.take, so it also scales to large colorized previews.
+
+    Args:
+    data (numpy.ndarray): 2D array of integer values.
+    lut (numpy.ndarray): Lookup table of shape (3, N).
+    offset (int): Offset to add to a value to get its index in the table.
+
+    Returns:
+    numpy.ndarray: RGB array of shape (3, rows, cols) and dtype uint8.
+    """
+    index = np.clip(data.astype(np.int64) + offset, 0, lut.shape[1] - 1)
+    return np.take(lut, index, axis=1)
+
+
+def read_thumbnail_band(inputfile_name, width, height, band=1):
+    """
+    Reads one or several bands of a raster decimated to the thumbnail size.
+
+    The read is done with an out_shape, so GDAL serves it from the nearest COG overview level instead of
+    reading the full resolution band.
+
+    Args:
+    inputfile_name (str): The path of the input raster (COG).
+    width (int): The width of the thumbnail.
+    height (int): The height of the thumbnail.
+    band (int or list): The band or the list of bands to read.
+
+    Returns:
+    tuple: (data, profile) with the decimated band(s) and a GTiff profile with the matching transform.
+
+    Example usage:
+    data, profile = read_thumbnail_band("ch.swisstopo.swisseo_ndvi_z_v100_mosaic_2024-06-01T235959_forest-10m.tif", 256, 256)
+    """
+    with rasterio.open(inputfile_name) as src:
+        out_shape = (height, width) if isinstance(
+            band, int) else (len(band), height, width)
+        data = src.read(band, out_shape=out_shape,
+                        resampling=Resampling.nearest)
+
+        # Scale the transform to the decimated size
+        transform = src.transform * src.transform.scale(
+            src.width / width, src.height / height)
+
+        profile = {
+            "driver": "GTiff",
+            "dtype": data.dtype,
+            "count": 1 if isinstance(band, int) else len(band),
+            "width": width,
+            "height": height,
+            "crs": src.crs,
+            "transform": transform
+        }
+
+    return data, profile
+
+
+def rasterize_layer(shapefile_path, transform, out_shape):
+    """
+    Rasterizes all features of a shapefile onto a grid.
+
+    The result is stored in config.ASSET_CACHE under the content hash of the shapefile and the grid, so each
+    layer is only rendered once and reused across runs. A changed shapefile gets a new hash and is rendered again.
+
+    Args:
+    shapefile_path (str): The path of the shapefile (EPSG:2056).
+    transform (Affine): The transform of the grid.
+    out_shape (tuple): The (rows, cols) of the grid.
+
+    Returns:
+    numpy.ndarray: Boolean mask of the burned pixels.
+    """
+    layer_name = os.path.splitext(os.path.basename(shapefile_path))[0]
+    digest = main_utils.shapefile_hash(shapefile_path, tuple(transform), tuple(out_shape))
+    cache_file = os.path.join(
+        config.ASSET_CACHE, f"{layer_name}_{digest[:16]}.npy")
+
+    # Reuse the rendered layer
+    if os.path.exists(cache_file):
+        return np.load(cache_file)
+
+    with fiona.open(shapefile_path, 'r') as shp:
+        shapes = [(shape(feature['geometry']), 1)
+                  for feature in shp if feature['geometry'] is not None]
+
+    mask = rasterize(shapes, out_shape=out_shape, transform=transform,
+                     fill=0, dtype="uint8").astype(bool)
+
+    # Write to a temporary file first, so concurrent runs never read a partial layer
+    os.makedirs(config.ASSET_CACHE, exist_ok=True)
+    temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file, "wb") as f:
+        np.save(f, mask)
+    os.replace(temp_file, cache_file)
+
+    return mask
 
 
 def fill_buffer_switzerland(shapefile_dir, shapefile_name, target_width):
     """
-    Creates a raster file from the given shapefile with a buffer around Switzerland.
+    Renders the buffer around Switzerland as the RGB background of a thumbnail.
+
+    Pixels inside the buffer are light grey (220), outside white (255). The layer is rasterized once per
+    shapefile and target width (see rasterize_layer) and then served from memory.
 
     Args:
     shapefile_dir (str): The directory where the shapefile is located.
@@ -23,612 +239,261 @@ def fill_buffer_switzerland(shapefile_dir, shapefile_name, target_width):
     target_width (int): The target width of the output raster.
 
     Returns:
-    None
+    tuple: (data_rgb, transform) with a copy of the RGB background of shape (3, rows, cols) and its transform.
 
     Example usage:
-    fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
+    swissfill, transform = fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
     """
     # Path to your shapefile
     shapefile_path = os.path.join(shapefile_dir, shapefile_name)
+    key = ("swissfill", shapefile_path, target_width)
+
+    with base_layer_lock:
+        if key not in base_layer_cache:
+            # Open the shapefile and read the first feature to get its geometry
+            with fiona.open(shapefile_path, 'r') as shp:
+                first_feature = next(iter(shp))
+                geom = shape(first_feature['geometry'])
+                minx, miny, maxx, maxy = shp.bounds
+
+            # Calculate corresponding height to maintain aspect ratio
+            gminx, gminy, gmaxx, gmaxy = geom.bounds
+            target_height = int((gmaxy - gminy) /
+                                (gmaxx - gminx) * target_width)
+            transform = from_bounds(
+                minx, miny, maxx, maxy, target_width, target_height)
+
+            # Burn the buffer
+            inside = rasterize_layer(
+                shapefile_path, transform, (target_height, target_width))
+            swissfill = np.where(inside, 220, 255).astype(np.uint8)
+            base_layer_cache[key] = (
+                np.repeat(swissfill[np.newaxis], 3, axis=0), transform)
+
+    swissfill, transform = base_layer_cache[key]
+    return swissfill.copy(), transform
+
+
+def apply_overlay(data_rgb, transform):
+    """
+    Burns the rivers and lakes in white into an RGB thumbnail.
 
-    # Open the shapefile and read the first feature to get its geometry
-    with fiona.open(shapefile_path, 'r') as shp:
-        first_feature = next(iter(shp))
-        geom = shape(first_feature['geometry'])
-
-    # Calculate bounding box dimensions (width and height)
-    minx, miny, maxx, maxy = geom.bounds
-    orig_width = maxx - minx
-    orig_height = maxy - miny
-
-    # Calculate corresponding height to maintain aspect ratio
-    target_height = int(orig_height / orig_width * target_width)
-
-    # Prepare the command for gdal_rasterize
-    command = [
-        "gdal_rasterize",
-        "-burn", "220", "-burn", "220", "-burn", "220",
-        "-init", "255",
-        "-l", shapefile_name.replace(".shp", ""),
-        shapefile_path,
-        "-ot", "Byte",
-        "-of", "GTiff",
-        "-ts", str(target_width), str(target_height),
-        "output_thumbnailswissfill.tif"
-    ]
-
-    # Execute the command
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-
-    # # Check and print the command output
-    # if result.returncode == 0:
-    #     print("Rasterization successful!")
-    # else:
-    #     print(f"Error: {result.stderr}")
-
-
-def apply_overlay(input_file, output_file):
-    try:
-        # remove the filname extension:
-        input_file_without_extension = input_file.split('.')[0]
-        # Burn Rivers
-        command = [
-            "gdal_rasterize",
-            "-b", "1", "-b", "2", "-b", "3",
-            "-burn", "255", "-burn", "255", "-burn", "255",
-            "-l", "overview_rivers_2056",     # Specify layer name
-            config.OVERVIEW_RIVERS,
-            input_file_without_extension+".tif"
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
-
-        # Burn Lakes
-        command = [
-            "gdal_rasterize",
-            "-b", "1", "-b", "2", "-b", "3",
-            "-burn", "255", "-burn", "255", "-burn", "255",
-            "-l", "overview_lakes_2056",     # Specify layer name
-            config.OVERVIEW_LAKES,
-            input_file_without_extension+".tif"
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
-
-        # export to jpg
-        command = [
-            "gdal_translate",
-            "-of", "JPEG",
-            "--config", "GDAL_PAM_ENABLED", "NO",
-            input_file_without_extension+".tif",
-            output_file
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
-
-        # remove intermediate files
-        [os.remove(file) for file in os.listdir()
-            if file.startswith("output_thumbnail")]
-        return (output_file)
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error: {e}")
-        return False
+    The overlay is rasterized once per grid (see rasterize_layer) and then served from memory.
 
+    Args:
+    data_rgb (numpy.ndarray): RGB array of shape (3, rows, cols), modified in place.
+    transform (Affine): The transform of the array.
+
+    Returns:
+    numpy.ndarray: The RGB array with the overlay.
+    """
+    out_shape = data_rgb.shape[1:]
+    key = ("overlay", transform, out_shape)
+
+    with base_layer_lock:
+        if key not in base_layer_cache:
+            base_layer_cache[key] = rasterize_layer(config.OVERVIEW_RIVERS, transform, out_shape) | \
+                rasterize_layer(config.OVERVIEW_LAKES, transform, out_shape)
+
+    data_rgb[:, base_layer_cache[key]] = 255
+    return data_rgb
 
-def create_thumbnail(inputfile_name, product):
-    # product = metadata['SWISSTOPO']['PRODUCT']
-    # inputfile_name = "ch.swisstopo.swisseo_s2-sr_v100_mosaic_2023-10-28T102039_bands-10m.tif"
-    # thumbnail_name = "ch.swisstopo.swisseo_s2-sr_v100_mosaic_2023-10-28T102039_thumbnail.jpeg"
 
+def resample_to_grid(data, src_transform, dst_transform, dst_shape):
+    """
+    Resamples an array onto a north-up grid of the same CRS with nearest neighbour.
+
+    Args:
+    data (numpy.ndarray): Array of shape (bands, rows, cols).
+    src_transform (Affine): The transform of the array.
+    dst_transform (Affine): The transform of the grid.
+    dst_shape (tuple): The (rows, cols) of the grid.
+
+    Returns:
+    tuple: (resampled, valid) with the resampled array and a mask of the grid pixels covered by the array.
+    """
+    rows, cols = dst_shape
+
+    # Source pixel of each grid pixel center
+    xs = dst_transform.c + (np.arange(cols) + 0.5) * dst_transform.a
+    ys = dst_transform.f + (np.arange(rows) + 0.5) * dst_transform.e
+    src_cols = np.floor((xs - src_transform.c) /
+                        src_transform.a).astype(np.int64)
+    src_rows = np.floor((ys - src_transform.f) /
+                        src_transform.e).astype(np.int64)
+
+    valid_cols = (src_cols >= 0) & (src_cols < data.shape[-1])
+    valid_rows = (src_rows >= 0) & (src_rows < data.shape[-2])
+
+    resampled = data[:, np.clip(src_rows, 0, data.shape[-2] - 1)[:, np.newaxis],
+                     np.clip(src_cols, 0, data.shape[-1] - 1)[np.newaxis, :]]
+    return resampled, valid_rows[:, np.newaxis] & valid_cols[np.newaxis, :]
+
+
+def compose_thumbnail(data_rgb, transform, transparent=None, target_width=1024):
+    """
+    Places an RGB thumbnail on the Swiss background and applies the rivers and lakes overlay.
+
+    Args:
+    data_rgb (numpy.ndarray): RGB array of shape (3, rows, cols) of the product.
+    transform (Affine): The transform of the product array.
+    transparent (tuple): (R, G, B) of product pixels letting the background through, None to keep all pixels.
+    target_width (int): The width of the background grid.
+
+    Returns:
+    tuple: (data_rgb, transform) of the composed thumbnail on the background grid.
+    """
+    # Fill Buffer Switzerland
+    canvas, grid_transform = fill_buffer_switzerland(
+        "assets", "ch_buffer_5000m.shp", target_width)
+
+    # overlay on Switzerland
+    product, valid = resample_to_grid(
+        data_rgb, transform, grid_transform, canvas.shape[1:])
+    if transparent is not None:
+        valid &= ~np.all(product == np.array(
+            transparent, dtype=product.dtype)[:, np.newaxis, np.newaxis], axis=0)
+    canvas[:, valid] = product[:, valid]
+
+    # Apply overlay
+    return apply_overlay(canvas, grid_transform), grid_transform
+
+
+def write_thumbnail_jpeg(data_rgb, transform, thumbnail_name):
+    """
+    Writes an RGB array as JPEG, without auxiliary files.
+
+    Args:
+    data_rgb (numpy.ndarray): RGB array of shape (3, rows, cols) and dtype uint8.
+    transform (Affine): The transform of the array.
+    thumbnail_name (str): The path of the JPEG.
+
+    Returns:
+    str: The path of the JPEG.
+    """
+    with rasterio.Env(GDAL_PAM_ENABLED="NO"):
+        with rasterio.open(thumbnail_name, "w", driver="JPEG", width=data_rgb.shape[2], height=data_rgb.shape[1],
+                           count=3, dtype="uint8", crs=config.OUTPUT_CRS, transform=transform) as dst:
+            dst.write(data_rgb)
+    return thumbnail_name
+
+
+def render_thumbnail(inputfile_name, product):
+    """
+    Renders the thumbnail of a product in memory.
+
+    Args:
+    inputfile_name (str): The path of the merged product (COG).
+    product (str): The product name, e.g. metadata['SWISSTOPO']['PRODUCT'].
+
+    Returns:
+    tuple: (data_rgb, transform) with the RGB array of shape (3, rows, cols), or None if the asset does not need a thumbnail.
+    """
     # Thumbnail S2_SR 10m bands
     if product.startswith("ch.swisstopo.swisseo_s2-sr") and inputfile_name.endswith("bands-10m.tif"):
-        # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
-        # It should be called just   "thumbnail.jpg"
-        # thumbnail_name = inputfile_name.replace(
-        #     "bands-10m.tif", "thumbnail.jpeg")
-        thumbnail_name = "thumbnail.jpg"
-        try:
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1", "-b", "2", "-b", "3",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                inputfile_name,
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # to RGB
-            command = [
-                "gdal_translate",
-                "output_thumbnail.tif",
-                "output_thumbnailRGB.tif",
-                "-b", "1", "-b", "2", "-b", "3",
-                "-co", "COMPRESS=DEFLATE",
-                "-co", "PHOTOMETRIC=RGB"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Get Min Max Value to strecth the image
-            with rasterio.open("output_thumbnailRGB.tif") as rgb_range:
-                min_value = str(round(rgb_range.read().min()))
-                max_value = str(round(rgb_range.read().max()))
-
-            # scale the view, using a gamma correction of 0.5
-            command = [
-                "gdal_translate",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_scaled.tif",
-                "-scale", min_value, max_value, "0", "65535",
-                "-exponent", "0.5",
-                "-co", "COMPRESS=DEFLATE",
-                "-co", "PHOTOMETRIC=RGB"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # make a geotiff
-            command = [
-                "gdal_translate",
-                "-of", "GTiff",
-                "-ot", "Byte",
-                "-outsize", "256", "256",
-                "-scale", "0", "65535", "0", "255",
-                "output_thumbnailRGB_scaled.tif",
-                "output_thumbnailRGB_scaled255.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Fill Buffer Switzerland
-            fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
-
-            # Set 0 values to nodata
-            command = [
-                "gdal_translate",
-                # "-a_nodata", "0,0,0", #This step is only needed of you have additional data with nodata
-                "output_thumbnailRGB_scaled255.tif",
-                "output_thumbnailRGB_scaled255nodata.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-overwrite",
-                "-dstnodata", "255",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB_scaled255nodata.tif",
-                "output_thumbnailRGB_scaled255nodata_merged.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Get the dimensions/ As
-            # TODO should be output_thumbnailRGB_scaled255nodata_merged.tif then also add -ts below
-            with rasterio.open("output_thumbnailRGB_scaled255nodata.tif") as swiss:
-
-                # Calculate the new width to maintain the aspect ratio with a height of 256 pixels
-                new_width = str(int((swiss.width * 256) / swiss.height))
-
-            # clip to extent of products
-            with rasterio.open("output_thumbnailRGB.tif") as subset:
-                bboxl = str(int(subset.bounds.left))
-                bboxb = str(int(subset.bounds.bottom))
-                bboxr = str(int(subset.bounds.right))
-                bboxt = str(int(subset.bounds.top))
-            command = [
-                "gdalwarp",
-                "-overwrite",
-                "-te", bboxl, bboxb, bboxr, bboxt,
-                # "-ts", new_width, "256",
-                "output_thumbnailRGB_scaled255nodata_merged.tif",
-                "output_thumbnailRGB_scaled255nodata_clipped.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_scaled255nodata_clipped.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: {e}")
-            print("Output")
-            print(e.output)
-            return False
+        # Export thumbnail
+        data, profile = read_thumbnail_band(inputfile_name, 256, 256, [1, 2, 3])
+
+        # Get Min Max Value to strecth the image, using a gamma correction of 0.5
+        min_value = float(data.min())
+        max_value = float(data.max())
+        stretched = (np.clip(data, min_value, max_value) -
+                     min_value) / max(max_value - min_value, 1)
+        data_rgb = np.rint(np.sqrt(stretched) * 255).astype(np.uint8)
+
+        # overlay on Switzerland, the product covers the background
+        data_rgb, transform = compose_thumbnail(data_rgb, profile["transform"])
+
+        # clip to extent of products
+        left, top = profile["transform"] * (0, 0)
+        right, bottom = profile["transform"] * (256, 256)
+        window = window_from_bounds(left, bottom, right, top, transform).round_offsets(
+        ).round_lengths().intersection(Window(0, 0, data_rgb.shape[2], data_rgb.shape[1]))
+        return data_rgb[(slice(None),) + window.toslices()], window_transform(window, transform)
 
     # VHI Use case
     elif product.startswith("ch.swisstopo.swisseo_vhi") and (inputfile_name.endswith("forest-10m.tif") or inputfile_name.endswith("forest-30m.tif")):
-        # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
-        # It should be called just "thumbnail.jpg"
-        # thumbnail_name = inputfile_name.replace(
-        #     "bands-10m.tif", "thumbnail.jpeg")
-        thumbnail_name = "thumbnail.jpg"
-
-        try:
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                inputfile_name,
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Define color map
-            color_map = {
-                (0, 10): (181, 106, 41),    # [0,10] extremely dry - dark brown
-                (11, 20): (206, 133, 64),   # (10,20] severely dry - brown
-                (21, 30): (245, 205, 133),  # (20,30] moderately dry - beige
-                (31, 40): (255, 245, 186),  # (30,40] mild dry - yellow
-                (41, 50): (203, 255, 202),  # (40,50] normal - light green
-                (51, 60): (82, 189, 159),   # (50,60] good - green
-                (61, 100): (4, 112, 176),   # (60,100] excellent - blue
-                (110, 110): (128, 128, 128),  # 110 missing data values- gray
-                (255, 255): (255, 255, 255)  # 255 no data values- white
-            }
-
-            # Load TIFF file
-            with rasterio.open('output_thumbnail.tif') as src:
-                data = src.read(1)  # Assuming single band
-                profile = src.profile
-                # Update profile for 3 bands and uint8 dtype
-                profile.update(count=3, dtype=rasterio.uint8)
-
-            # Apply color mapping
-            data_rgb = np.zeros(
-                (3, data.shape[0], data.shape[1]), dtype=np.uint8)
-            for value_range, color in color_map.items():
-                mask = np.logical_and(
-                    data >= value_range[0], data <= value_range[1])
-                for i in range(3):
-                    data_rgb[i][mask] = color[i]
-
-            # Write RGB image
-            with rasterio.open('output_thumbnailRGB.tif', 'w', **profile) as dst:
-                dst.write(data_rgb)
-
-            # Fill Buffer Switzerland
-            fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
-
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-s_srs", "EPSG:2056",
-                "-overwrite",
-                "-dstnodata", "255,255,255",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_merged.tif",
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_merged.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: {e}")
-            return False
+        # Export thumbnail
+        data, profile = read_thumbnail_band(inputfile_name, 256, 256)
 
+        # Apply color mapping, values outside the color map stay black
+        lut, offset = build_color_lut(color_map_vhi, background=(0, 0, 0))
+        data_rgb = apply_color_lut(data, lut, offset)
 
-    # NDVIz Use case
-    elif product.startswith("swisseo_ndvi_z") and (inputfile_name.endswith("forest-10m.tif")):
-        # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
-        # It should be called just "thumbnail.jpg"
-        # thumbnail_name = inputfile_name.replace(
-        #     "bands-10m.tif", "thumbnail.jpeg")
-        thumbnail_name = "thumbnail.jpg"
-
-        try:
-            # Pre-process to combine no-data values
-            with rasterio.open(inputfile_name) as src:
-                data = src.read(1)
-                profile = src.profile.copy()
-
-                # Convert both 32700 and 32701 to 32701
-                # data[(data == 32700) | (data == 32701)] = 32701
-
-                # Update profile to set no-data value
-                profile.update(nodata=32701)
-
-                # Write preprocessed file
-                with rasterio.open('output_thumbnail_preprocessed.tif', 'w', **profile) as dst:
-                    dst.write(data, 1)
-
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                "-a_nodata", "32701",
-                "output_thumbnail_preprocessed.tif",
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Define color map
-            color_map = {  # scaling factor 100
-                (-550, -450): (125, 102, 8),    # dark brown
-                (-449, -350): (169, 137, 11),
-                (-349, -250): (212, 172, 13),
-                (-249, -150): (230, 196, 62),
-                (-149, -50): (247, 220, 111),   # light yellow
-                (-49, 0.5): (245, 245, 245),    # light grey
-                (49, 150): (125, 206, 160),     # light green
-                (149, 250): (80, 180, 122),
-                (249, 350): (34, 153, 84),
-                (349, 450): (27, 122, 67),
-                (449, 550): (20, 90, 50),       # dark green
-            }
-
-            # Load TIFF file
-            with rasterio.open('output_thumbnail.tif') as src:
-                data = src.read(1)
-                profile = src.profile
-                profile.update(count=3, dtype=rasterio.uint8)
-                if 'nodata' in profile:
-                    del profile['nodata']
-
-            # Initialize RGB array with white
-            data_rgb = np.full((3, data.shape[0], data.shape[1]), 255, dtype=np.uint8)
-
-            # Handle special values only if they exist
-            for special_value, color in [(32700, (220, 220, 220))]: #, (32701, (255, 255, 255))
-                mask = (data == special_value)
-                if np.any(mask):
-                    data_rgb[:, mask] = np.array(color)[:, np.newaxis]
-
-            # Apply color mapping for elevation data
-            valid_data_mask = ~np.isin(data, [32700, 32701])
-            for value_range, color in color_map.items():
-                range_mask = np.logical_and(
-                    np.logical_and(data >= value_range[0], data <= value_range[1]),
-                    valid_data_mask
-                )
-                if np.any(range_mask):
-                    data_rgb[:, range_mask] = np.array(color)[:, np.newaxis]
-
-            # Write RGB image
-            profile.update(nodata=255)  # Set white as nodata
-            with rasterio.open('output_thumbnailRGB.tif', 'w', **profile) as dst:
-                dst.write(data_rgb)
-
-            # Fill Buffer Switzerland
-            fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-s_srs", "EPSG:2056",
-                "-overwrite",
-                "-dstnodata", "255,255,255",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_merged.tif",
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_merged.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: {e}")
-            return False
+        # overlay on Switzerland, no data (white) lets the background through
+        return compose_thumbnail(
+            data_rgb, profile["transform"], transparent=(255, 255, 255))
 
-    # NDVIdiff Use case
-    elif product.startswith("swisseo_ndvi_diff") and (inputfile_name.endswith("forest-10m.tif")):
-        # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
-        # It should be called just "thumbnail.jpg"
-        # thumbnail_name = inputfile_name.replace(
-        #     "bands-10m.tif", "thumbnail.jpeg")
-        thumbnail_name = "thumbnail.jpg"
-
-        try:
-            # Pre-process to combine no-data values
-            with rasterio.open(inputfile_name) as src:
-                data = src.read(1)
-                profile = src.profile.copy()
-
-                # Convert both 32700 and 32701 to 32701
-                # data[(data == 32700) | (data == 32701)] = 32701
-
-                # Update profile to set no-data value
-                profile.update(nodata=32701)
-
-                # Write preprocessed file
-                with rasterio.open('output_thumbnail_preprocessed.tif', 'w', **profile) as dst:
-                    dst.write(data, 1)
-
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                "-a_nodata", "32701",
-                "output_thumbnail_preprocessed.tif",
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Define color map
-            color_map = {  # scaling factor 1000
-                (-300, -1000): (183, 28, 28),    # dark red
-                (-225, -299): (205, 90, 72),
-                (-150, -224): (228, 153, 116),
-                (-75, -149): (250, 215, 160),   # light orange
-                (-74, 74): (245, 245, 245),    # light grey
-                (75, 149): (128, 203, 196),     # light turquoise2
-                (150, 224): (85, 161, 152),
-                (225, 299): (43, 119, 108),
-                (300, 1000): (0, 77, 64),       # dark turquoise
-            }
-
-            # Load TIFF file
-            with rasterio.open('output_thumbnail.tif') as src:
-                data = src.read(1)
-                profile = src.profile
-                profile.update(count=3, dtype=rasterio.uint8)
-                if 'nodata' in profile:
-                    del profile['nodata']
-
-            # Initialize RGB array with white
-            data_rgb = np.full((3, data.shape[0], data.shape[1]), 255, dtype=np.uint8)
-
-            # Handle special values only if they exist
-            for special_value, color in [(32700, (220, 220, 220))]: #, (32701, (255, 255, 255))
-                mask = (data == special_value)
-                if np.any(mask):
-                    data_rgb[:, mask] = np.array(color)[:, np.newaxis]
-
-            # Apply color mapping for elevation data
-            valid_data_mask = ~np.isin(data, [32700, 32701])
-            for value_range, color in color_map.items():
-                range_mask = np.logical_and(
-                    np.logical_and(data >= value_range[0], data <= value_range[1]),
-                    valid_data_mask
-                )
-                if np.any(range_mask):
-                    data_rgb[:, range_mask] = np.array(color)[:, np.newaxis]
-
-            # Write RGB image
-            profile.update(nodata=255)  # Set white as nodata
-            with rasterio.open('output_thumbnailRGB.tif', 'w', **profile) as dst:
-                dst.write(data_rgb)
-
-            # Fill Buffer Switzerland
-            fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-s_srs", "EPSG:2056",
-                "-overwrite",
-                "-dstnodata", "255,255,255",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_merged.tif",
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_merged.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: {e}")
-            return False
+    # NDVIz, NDVIdiff and NDMIz Use case
+    elif product.startswith(("swisseo_ndvi_z", "swisseo_ndvi_diff", "swisseo_ndmi_z")) and (inputfile_name.endswith("forest-10m.tif")):
+        if product.startswith("swisseo_ndvi_z"):
+            color_map = color_map_ndvi_z
+        elif product.startswith("swisseo_ndvi_diff"):
+            color_map = color_map_ndvi_diff
+        else:
+            color_map = color_map_ndmi_z
+
+        # Read the thumbnail from the nearest COG overview, no data (32701) is kept in memory
+        data, profile = read_thumbnail_band(inputfile_name, 256, 256)
+
+        # Apply color mapping, special values included, values outside the color map stay white
+        lut, offset = build_color_lut(color_map, special_colors_z)
+        data_rgb = apply_color_lut(data, lut, offset)
+
+        # overlay on Switzerland, white lets the background through
+        return compose_thumbnail(
+            data_rgb, profile["transform"], transparent=(255, 255, 255))
+
+    return None
+
+
+def create_thumbnail(inputfile_name, product, thumbnail_name="thumbnail.jpg"):
+    """
+    Creates the JPEG thumbnail of a merged product, if the product needs one.
+
+    All intermediates stay in memory, so several thumbnails can be created concurrently as long as they are
+    written to different paths.
+
+    Args:
+    inputfile_name (str): The path of the merged product (COG).
+    product (str): The product name, e.g. metadata['SWISSTOPO']['PRODUCT'].
+    thumbnail_name (str): The path of the JPEG. For STAC it should be called just "thumbnail.jpg", see
+        https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
 
-    # NDMIz Use case
-    elif product.startswith("swisseo_ndmi_z") and (inputfile_name.endswith("forest-10m.tif")):
-        # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
-        # It should be called just "thumbnail.jpg"
-        # thumbnail_name = inputfile_name.replace(
-        #     "bands-10m.tif", "thumbnail.jpeg")
-        thumbnail_name = "thumbnail.jpg"
-
-        try:
-            # Pre-process to combine no-data values
-            with rasterio.open(inputfile_name) as src:
-                data = src.read(1)
-                profile = src.profile.copy()
-
-                # Convert both 32700 and 32701 to 32701
-                # data[(data == 32700) | (data == 32701)] = 32701
-
-                # Update profile to set no-data value
-                profile.update(nodata=32701)
-
-                # Write preprocessed file
-                with rasterio.open('output_thumbnail_preprocessed.tif', 'w', **profile) as dst:
-                    dst.write(data, 1)
-
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                "-a_nodata", "32701",
-                "output_thumbnail_preprocessed.tif",
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Define color map
-            color_map = { #scaling factor 100
-                (-550, -450): (120, 66, 18),    #dark brown
-                (-449, -350): (161, 88, 24),   #
-                (-349, -250): (202, 111, 30),  #
-                (-249, -150): (2221, 144, 76),  #
-                (-149, -50): (240, 178, 122),  # light brown
-                (-49, 0.5): (245, 245, 245),   # light grey
-                (49, 150): (133, 193, 233),   # light blue
-                (149, 250): (89, 163, 213),  #
-                (249, 350): (46, 134, 193),  #
-                (349, 450): (36, 106, 153),  #
-                (449, 550): (27, 79, 114),  # dark blue
-            }
-
-            # Load TIFF file
-            with rasterio.open('output_thumbnail.tif') as src:
-                data = src.read(1)
-                profile = src.profile
-                profile.update(count=3, dtype=rasterio.uint8)
-                if 'nodata' in profile:
-                    del profile['nodata']
-
-            # Initialize RGB array with white
-            data_rgb = np.full((3, data.shape[0], data.shape[1]), 255, dtype=np.uint8)
-
-            # Handle special values only if they exist
-            for special_value, color in [(32700, (220, 220, 220))]: #, (32701, (255, 255, 255))
-                mask = (data == special_value)
-                if np.any(mask):
-                    data_rgb[:, mask] = np.array(color)[:, np.newaxis]
-
-            # Apply color mapping for elevation data
-            valid_data_mask = ~np.isin(data, [32700, 32701])
-            for value_range, color in color_map.items():
-                range_mask = np.logical_and(
-                    np.logical_and(data >= value_range[0], data <= value_range[1]),
-                    valid_data_mask
-                )
-                if np.any(range_mask):
-                    data_rgb[:, range_mask] = np.array(color)[:, np.newaxis]
-
-            # Write RGB image
-            profile.update(nodata=255)  # Set white as nodata
-            with rasterio.open('output_thumbnailRGB.tif', 'w', **profile) as dst:
-                dst.write(data_rgb)
-
-            # Fill Buffer Switzerland
-            fill_buffer_switzerland("assets", "ch_buffer_5000m.shp", 1024)
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-s_srs", "EPSG:2056",
-                "-overwrite",
-                "-dstnodata", "255,255,255",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_merged.tif",
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_merged.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: {e}")
+    Returns:
+    str or bool: The path of the thumbnail, or False if no thumbnail is needed or the creation failed.
+
+    Example usage:
+    thumbnail = create_thumbnail("ch.swisstopo.swisseo_s2-sr_v100_mosaic_2023-10-28T102039_bands-10m.tif", "ch.swisstopo.swisseo_s2-sr_v100")
+    """
+    try:
+        rendered = render_thumbnail(inputfile_name, product)
+        if rendered is None:
             return False
 
-    else:
+        # create JPG
+        data_rgb, transform = rendered
+        return write_thumbnail_jpeg(data_rgb, transform, thumbnail_name)
+
+    except (RasterioError, FionaError) as e:
+        print(f"Error: {e}")
         return False
 
 
+def create_thumbnails(jobs, max_workers=4):
+    """
+    Creates several thumbnails in parallel in one process.
 
-    # return the thumbnail
-    return thumbnail_name
+    Args:
+    jobs (list): Tuples of (inputfile_name, product, thumbnail_name), with distinct thumbnail names.
+    max_workers (int): The number of threads.
+
+    Returns:
+    list: The results of create_thumbnail, in the order of the jobs.
+
+    Example usage:
+    create_thumbnails([(file_vhi, product_vhi, os.path.join("vhi", "thumbnail.jpg")),
+                       (file_s2, product_s2, os.path.join("s2", "thumbnail.jpg"))])
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: create_thumbnail(*job), jobs))
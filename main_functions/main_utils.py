@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 import csv
 import os
 import json
+import hashlib
 import pandas as pd
 import dateutil
 
@@ -617,4 +618,25 @@ def get_collection_info_landsat(collection):
     last_date = max(dates_list) if image_count>0 else None
 
     # Return the first date, last date, and total number of scenes
-    return first_date, last_date, image_count
\ No newline at end of file
+    return first_date, last_date, image_count
+
+
+def shapefile_hash(shapefile_path, *grid):
+    """
+    Computes a content hash of a shapefile and the grid it is rendered on.
+
+    Args:
+    shapefile_path (str): The path of the shapefile, its .shx, .dbf and .prj files are included.
+    *grid: Values describing the target grid, e.g. the transform and the shape.
+
+    Returns:
+    str: The hexadecimal SHA-256 digest.
+    """
+    sha = hashlib.sha256()
+    basename = os.path.splitext(shapefile_path)[0]
+    for extension in (".shp", ".shx", ".dbf", ".prj"):
+        if os.path.exists(basename + extension):
+            with open(basename + extension, "rb") as f:
+                sha.update(f.read())
+    sha.update(repr(grid).encode())
+    return sha.hexdigest()
\ No newline at end of file
@@ -1,11 +1,17 @@
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
-from fsspec.implementations.http import HTTPFileSystem
 from datetime import datetime
 import os
+import sys
 import numpy as np
 
+# Project root on sys.path for the warn region store
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from main_functions import util_warnregions_store, util_region_maps
+
 """
 CDI and VHI Maps Generator
 
@@ -24,16 +30,17 @@ Dependencies:
     - pandas
     - geopandas
     - matplotlib
-    - fsspec
     - os
     - numpy
+    - util_warnregions_store (VHI warn region statistics, refreshed from STAC)
+    - util_region_maps (grid rendering, years in parallel processes)
 
 Functions:
     - get_color_for_cdi(cdi: float) -> str
     - get_color_for_vhi(vhi: float, availability: float) -> str
-    - process_cdi_data(date_data: pd.DataFrame, regions: gpd.GeoDataFrame) -> gpd.GeoDataFrame
-    - get_vhi_from_geoparquet(date: datetime) -> gpd.GeoDataFrame
-    - create_annual_maps(output_folder: str, regions_shapefile: str, cdi_csv_path: str, shift_region: int, start_year: int, end_year: int)
+    - get_vhi_from_store(start_date: datetime, end_date: datetime) -> dict
+    - get_region_colors(regions: gpd.GeoDataFrame, region_ids: pd.Series, colors: pd.Series) -> list
+    - create_annual_maps(output_folder: str, regions_shapefile: str, cdi_csv_path: str, shift_region: int, start_year: int, end_year: int, max_workers: int)
     - main()
 
 Example:
@@ -87,69 +94,53 @@ def get_color_for_vhi(vhi, availability):
             return color
     return '#ffffff'
 
-def process_cdi_data(date_data, regions):
+def get_vhi_from_store(start_date, end_date):
     """
-    Process CDI data for a specific date and merge with regions.
+    Fetch the VHI data of a date range from the warn region store with one query.
+
+    The store is refreshed from STAC first, so only the days not stored yet are downloaded.
 
     Args:
-        date_data (pd.DataFrame): CDI data for a specific date
-        regions (gpd.GeoDataFrame): Regions base geometry
+        start_date (datetime): First date
+        end_date (datetime): Last date
 
     Returns:
-        gpd.GeoDataFrame: Processed and merged data with colors
+        dict: VHI data with colors per date (pd.Timestamp), dates without data are missing
     """
-    # Create a fresh copy of the data
-    processed_data = date_data.copy()
-
-    # Create color column
-    processed_data.loc[:, 'color'] = processed_data['CDI'].apply(get_color_for_cdi)
-
-    # Merge with regions
-    merged_data = regions.merge(
-        processed_data[['Region_ID', 'color']],
-        left_on='REGION_NR',
-        right_on='Region_ID',
-        how='left'
-    )
-
-    # Fill any missing colors with white
-    merged_data.loc[:, 'color'] = merged_data['color'].fillna('#ffffff')
+    util_warnregions_store.refresh_from_stac(SURFACE_TYPE, start_date, end_date)
+    vhi_data = util_warnregions_store.read(
+        SURFACE_TYPE, start_date, end_date, columns=['date', 'REGION_NR', 'vhi_mean', 'availability_percentage'])
+
+    vhi_data = vhi_data.rename(columns={
+        'REGION_NR': 'region_id',
+        'vhi_mean': 'vhi',
+        'availability_percentage': 'availability'
+    })
+    vhi_data['vhi'] = pd.to_numeric(vhi_data['vhi'], errors='coerce')
+    vhi_data['availability'] = pd.to_numeric(vhi_data['availability'], errors='coerce')
+    vhi_data['color'] = [get_color_for_vhi(vhi, availability)
+                         for vhi, availability in zip(vhi_data['vhi'], vhi_data['availability'])]
+    vhi_data['date'] = pd.to_datetime(vhi_data['date'])
+
+    return {date: date_data for date, date_data in vhi_data.groupby('date')}
+
+def get_region_colors(regions, region_ids, colors):
+    """
+    Orders the colors of a day by the regions, regions without data are white.
 
-    return merged_data
+    Args:
+        regions (gpd.GeoDataFrame): Regions base geometry
+        region_ids (pd.Series): Region IDs of the day
+        colors (pd.Series): Colors of the day
 
-def get_vhi_from_geoparquet(date):
-    """Fetch VHI data from geoparquet for a specific date."""
-    date_str = date.strftime('%Y-%m-%d')
-    url = f"{STAC_PATH}ch.swisstopo.swisseo_vhi_v100/{date_str}t235959/ch.swisstopo.swisseo_vhi_v100_{date_str}t235959_{SURFACE_TYPE}-warnregions.parquet"
+    Returns:
+        list: Colors in the order of the regions
+    """
+    color_by_region = dict(zip(region_ids, colors))
+    return [color_by_region.get(region, '#ffffff') for region in regions['REGION_NR']]
 
-    try:
-        filesystem = HTTPFileSystem()
-        gdf = gpd.read_parquet(url, filesystem=filesystem)
-
-        processed_gdf = gdf.copy()
-        processed_gdf = processed_gdf.rename(columns={
-            'REGION_NR': 'region_id',
-            'vhi_mean': 'vhi',
-            'availability_percentage': 'availability'
-        })
-
-        processed_gdf['region_id'] = pd.to_numeric(processed_gdf['region_id'], errors='coerce')
-        processed_gdf['vhi'] = pd.to_numeric(processed_gdf['vhi'], errors='coerce')
-        processed_gdf['availability'] = pd.to_numeric(processed_gdf['availability'], errors='coerce')
-        processed_gdf['color'] = processed_gdf.apply(
-            lambda row: get_color_for_vhi(row['vhi'], row['availability']),
-            axis=1
-        )
-        processed_gdf['date'] = pd.to_datetime(date)
-
-        return processed_gdf
-
-    except Exception as e:
-        print(f"No VHI data for {date_str}: {str(e)}")
-        return None
-
-def create_annual_maps(output_folder, regions_shapefile, cdi_csv_path, shift_region,start_year=2018, end_year=2022):
-    """Create annual maps for both VHI and CDI data."""
+def create_annual_maps(output_folder, regions_shapefile, cdi_csv_path, shift_region,start_year=2018, end_year=2022, max_workers=None):
+    """Create annual maps for both VHI and CDI data, the years are rendered in parallel processes."""
     # Create output folder
     os.makedirs(output_folder, exist_ok=True)
 
@@ -173,71 +164,53 @@ def create_annual_maps(output_folder, regions_shapefile, cdi_csv_path, shift_reg
         (cdi_data['Datum'].dt.year >= start_year) &
         (cdi_data['Datum'].dt.year <= end_year)
     ].copy()  # Make a copy to avoid chained assignment warnings
+    cdi_data['color'] = cdi_data['CDI'].apply(get_color_for_cdi)
+    cdi_by_date = {date: date_data for date, date_data in cdi_data.groupby('Datum')}
 
     years = list(range(start_year, end_year + 1))
 
+    # Load the VHI data of all years at once
+    print("Loading VHI data...")
+    vhi_by_date = get_vhi_from_store(datetime(start_year, 1, 1), datetime(end_year, 12, 31))
+
     # Create separate figures for VHI and CDI
     for data_type in [ "VHI",'CDI']:
         print(f"\nProcessing {data_type} maps...")
-        fig, axes = plt.subplots(nrows=48, ncols=len(years), figsize=(5 * len(years), 100))
-        axes = axes.flatten()
 
-        for col, year in enumerate(years):
-            print(f"Processing year {year}...")
+        # Cells of each year column: title, font size and region colors
+        columns = []
+        for year in years:
+            cells = []
             for month in range(1, 13):
                 # Get dates for this month
                 month_mask = (cdi_data['Datum'].dt.year == year) & (cdi_data['Datum'].dt.month == month)
-                month_data = cdi_data[month_mask].copy()
-                dates = sorted(month_data['Datum'].unique())
+                dates = sorted(cdi_data.loc[month_mask, 'Datum'].unique())
 
                 for week in range(4):
-                    ax_idx = col + len(years) * ((month - 1) * 4 + week)
-                    ax = axes[ax_idx]
-
                     if week < len(dates):
-                        date = dates[week]
+                        date = pd.Timestamp(dates[week])
 
                         if data_type == 'VHI':
-                            # Process VHI data (unchanged)
-                            date_data = get_vhi_from_geoparquet(date)
+                            date_data = vhi_by_date.get(date)
                             if date_data is not None:
-                                regions_copy = regions.copy()
-                                merged_data = regions_copy.merge(
-                                    date_data[['region_id', 'color']],
-                                    left_on='REGION_NR',
-                                    right_on='region_id',
-                                    how='left'
-                                )
-                                merged_data.loc[:, 'color'] = merged_data['color'].fillna('#ffffff')
+                                colors = get_region_colors(regions, date_data['region_id'], date_data['color'])
                             else:
-                                merged_data = regions.copy()
-                                merged_data.loc[:, 'color'] = '#ffffff'
+                                colors = ['#ffffff'] * len(regions)
                         else:
-                            # Process CDI data
-                            date_mask = (month_data['Datum'] == date)
-                            date_cdi = month_data[date_mask].copy()
-                            merged_data = process_cdi_data(date_cdi, regions.copy())
-
-                        # Plot the data
-                        merged_data.plot(
-                            ax=ax,
-                            color=merged_data['color'],
-                            edgecolor='black',
-                            linewidth=0.5
-                        )
-                        ax.set_title(date.strftime('%Y-%m-%d'), fontsize=15)
-                    else:
-                        # Empty plot for missing weeks
-                        regions.plot(ax=ax, color='#ffffff', edgecolor='black', linewidth=0.5)
-                        ax.set_title(f"{year}-{month:02d} Week {week+1}", fontsize=6)
+                            date_data = cdi_by_date[date]
+                            colors = get_region_colors(regions, date_data['Region_ID'], date_data['color'])
 
-                    ax.axis('off')
+                        cells.append((date.strftime('%Y-%m-%d'), 15, colors))
+                    else:
+                        # Empty map for missing weeks
+                        cells.append((f"{year}-{month:02d} Week {week+1}", 6, ['#ffffff'] * len(regions)))
+            columns.append(cells)
 
-        # Add overall title and save
-        fig.suptitle(f"{data_type} Maps {start_year}-{end_year}", fontsize=16)
+        # Render the year columns and save
+        print(f"Rendering {len(years)} years...")
         output_path = os.path.join(output_folder, f"{data_type.lower()}_annual_maps_{start_year}_{end_year}.png")
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        util_region_maps.render_grid(columns, regions, f"{data_type} Maps {start_year}-{end_year}", output_path,
+                                     max_workers=max_workers)
         print(f"Saved {data_type} maps to {output_path}")
 
 def main():
@@ -1,24 +1,25 @@
 import pandas as pd
-import geopandas as gpd
-from fsspec.implementations.http import HTTPFileSystem
 from datetime import datetime
 import os
+import sys
 
-def get_vhi_for_date(date):
-    """Lädt die VHI-Daten für ein bestimmtes Datum aus dem Geoparquet."""
-    STAC_PATH = "https://sys-data.int.bgdi.ch/"
-    SURFACE_TYPE = "vegetation"
-    date_str = date.strftime('%Y-%m-%d')
-    url = f"{STAC_PATH}ch.swisstopo.swisseo_vhi_v100/{date_str}t235959/ch.swisstopo.swisseo_vhi_v100_{date_str}t235959_{SURFACE_TYPE}-warnregions.parquet"
-
-    try:
-        filesystem = HTTPFileSystem()
-        gdf = gpd.read_parquet(url, filesystem=filesystem)
-        gdf = gdf.rename(columns={'REGION_NR': 'Region_ID', 'vhi_mean': 'VHI'})
-        return gdf[['Region_ID', 'VHI']]
-    except Exception as e:
-        print(f"Keine VHI-Daten für {date_str}: {e}")
-        return None
+# Projekt-Root für den Warnregionen-Store zu sys.path hinzufügen
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from main_functions import util_warnregions_store
+
+SURFACE_TYPE = "vegetation"
+
+def get_vhi_for_dates(start_date, end_date):
+    """Lädt die VHI-Daten eines Zeitraums mit einer Abfrage aus dem Warnregionen-Store (vorher von STAC ergänzt)."""
+    util_warnregions_store.refresh_from_stac(SURFACE_TYPE, start_date, end_date)
+    vhi_data = util_warnregions_store.read(
+        SURFACE_TYPE, start_date, end_date, columns=['date', 'REGION_NR', 'vhi_mean'])
+    vhi_data = vhi_data.rename(columns={'date': 'Datum', 'REGION_NR': 'Region_ID', 'vhi_mean': 'VHI'})
+    vhi_data['Datum'] = pd.to_datetime(vhi_data['Datum'])
+    return vhi_data
 
 def merge_cdi_vhi(cdi_csv_path, shift_region,output_csv_path):
     """Erstellt eine neue Datei mit CDI- und VHI-Daten."""
@@ -29,19 +30,12 @@ def merge_cdi_vhi(cdi_csv_path, shift_region,output_csv_path):
     # Füge shift_region zum Region_ID hinzu
     cdi_data['Region_ID'] = cdi_data['Region_ID'] + shift_region
 
-    # Liste zur Speicherung der Ergebnisse
-    merged_rows = []
-
-    for date in cdi_data['Datum'].unique():
-        vhi_data = get_vhi_for_date(date)
-        if vhi_data is not None:
-            date_cdi = cdi_data[cdi_data['Datum'] == date]
-            merged_data = date_cdi.merge(vhi_data, on='Region_ID', how='inner')
-            merged_rows.append(merged_data)
+    # VHI-Daten des ganzen Zeitraums laden und in einem Schritt zusammenführen
+    vhi_data = get_vhi_for_dates(cdi_data['Datum'].min(), cdi_data['Datum'].max())
+    final_data = cdi_data.merge(vhi_data, on=['Datum', 'Region_ID'], how='inner')
 
     # Alle Daten zusammenfügen
-    if merged_rows:
-        final_data = pd.concat(merged_rows, ignore_index=True)
+    if not final_data.empty:
         final_data.to_csv(output_csv_path, sep=';', encoding='latin1', index=False)
         print(f"Neue Datei gespeichert: {output_csv_path}")
     else:
@@ -1,37 +1,125 @@
 from pathlib import Path
 import xarray as xr
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
 import requests
 import os
 import tempfile
-from io import BytesIO
 import netCDF4
+import h5netcdf
 import subprocess
+import sys
 
-def download_netcdf_to_memory(url):
+# Project root on sys.path for the GCS staging
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from main_functions import main_gcs_staging
+
+# Disk cache of the monthly netCDF files, the least recently used files are evicted above MONTHLY_CACHE_MAX_BYTES
+MONTHLY_CACHE_PATH = os.path.join("cache", "lst_monthly")
+MONTHLY_CACHE_MAX_BYTES = 4 * 1024**3
+
+# Chunks for the lazy access to the cached monthly files
+MONTHLY_CHUNKS = {'time': 24}
+
+def evict_monthly_cache(cache_path=MONTHLY_CACHE_PATH, max_bytes=MONTHLY_CACHE_MAX_BYTES, keep=()):
+    """
+    Removes the least recently used files from the monthly cache until it fits into max_bytes
+
+    Args:
+        cache_path: Directory of the cache
+        max_bytes: Maximum size of the cache in bytes
+        keep: Paths which are not removed, e.g. the files in use
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    files = []
+    for file_name in os.listdir(cache_path):
+        path = os.path.join(cache_path, file_name)
+        if file_name.endswith(".nc") and os.path.isfile(path):
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            # e.g. still opened by another process
+            print(f"Could not evict {path}: {e}")
+
+def is_readable_netcdf(path):
+    """
+    Check that a netCDF file can be opened with h5netcdf, as the cached monthly files are read
+
+    A truncated file fails, since HDF5 compares the file size with the end of file stored in the header.
+
+    Args:
+        path: Path of the netCDF file
+
+    Returns:
+        True if the file can be opened
+    """
+    try:
+        with h5netcdf.File(path, 'r'):
+            return True
+    except Exception:
+        return False
+
+def get_cached_netcdf(url, cache_path=MONTHLY_CACHE_PATH, max_bytes=MONTHLY_CACHE_MAX_BYTES, keep=()):
     """
-    Download a netCDF file from a URL and return as a BytesIO object
+    Get a netCDF file from the disk cache, downloading it if it is not cached yet
+
+    The file name of the URL (satellite, parameter, channel and month) is the cache key.
 
     Args:
         url: URL to download
+        cache_path: Directory of the cache
+        max_bytes: Maximum size of the cache in bytes
+        keep: Paths which must not be evicted by this download
 
     Returns:
-        BytesIO object containing the file data or None if download failed
+        Path of the cached file or None if download failed
     """
+    os.makedirs(cache_path, exist_ok=True)
+    cache_file = os.path.join(cache_path, os.path.basename(url))
+
+    if os.path.exists(cache_file):
+        if is_readable_netcdf(cache_file):
+            # Mark as recently used
+            os.utime(cache_file)
+            return cache_file
+        # e.g. truncated by a crash of an older version, download it again
+        print(f"Removing unreadable cached file {cache_file}")
+        os.remove(cache_file)
+
+    # Streamed to a partial file which is resumed if the download breaks, the cache file is only created by an
+    # atomic rename once the size and checksum are verified
     try:
-        #print(f"Streaming {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        return BytesIO(response.content)
-    except requests.exceptions.RequestException as e:
+        main_gcs_staging.download_file(url, cache_file)
+    except (requests.exceptions.RequestException, IOError) as e:
         print(f"Error downloading {url}: {e}")
         return None
 
+    if not is_readable_netcdf(cache_file):
+        print(f"Error downloading {url}: not a readable netCDF file")
+        os.remove(cache_file)
+        return None
+
+    evict_monthly_cache(cache_path, max_bytes, keep=[cache_file, *keep])
+    return cache_file
+
 def get_monthly_files_for_date(parameters, satellite, channel, date_str, base_url):
     """
-    Get monthly files that contain data for the specified date using streaming
+    Get monthly files that contain data for the specified date from the disk cache
 
     Args:
         parameters: List of parameters to get (e.g. ['SOL', 'SDL'])
@@ -41,7 +129,7 @@ def get_monthly_files_for_date(parameters, satellite, channel, date_str, base_ur
         base_url: Base URL for the data
 
     Returns:
-        Dictionary of BytesIO objects with parameter as key
+        Dictionary of cached file paths with parameter as key
     """
     # Parse the date
     date_obj = datetime.strptime(date_str, '%Y-%m-%d')
@@ -68,12 +156,8 @@ def get_monthly_files_for_date(parameters, satellite, channel, date_str, base_ur
         # Correct filename format: msg.SOL.H_ch02.lonlat_20040101000000.nc
         url = f"{base_url}/{dir_name}/{satellite.lower()}.{param}.H_{channel}.lonlat_{first_day_str}000000.nc"
 
-        # Download file into memory
-        data = download_netcdf_to_memory(url)
-        if data is not None:
-            data_dict[param] = data
-        else:
-            data_dict[param] = None
+        # Get the file from the cache, the files of the other parameters of the month are kept
+        data_dict[param] = get_cached_netcdf(url, keep=[path for path in data_dict.values() if path])
 
     return data_dict
 
@@ -142,7 +226,7 @@ def export_geotiff(netcdf_path):
     dataset.close()
     print(f"COG Geotiff created at: {output_path}")
 
-def export_netcdf(ds, satellite, parameter, channel, date_str, output_path):
+def export_netcdf(ds, satellite, parameter, channel, date_str, output_path, title=None):
     """
     Export dataset to netCDF with proper metadata
 
@@ -153,6 +237,7 @@ def export_netcdf(ds, satellite, parameter, channel, date_str, output_path):
         channel: Channel name
         date_str: Date string in YYYY-MM-DD format
         output_path: Output path
+        title: Title of the dataset, None for the daily title of date_str
 
     Returns:
         Path to output file
@@ -170,7 +255,7 @@ def export_netcdf(ds, satellite, parameter, channel, date_str, output_path):
 
     # Add metadata
     ds.attrs.update({
-        'title': f'Maximum Land Surface Temperature for {date_str}',
+        'title': title or f'Maximum Land Surface Temperature for {date_str}',
         'source': f'{satellite.upper()} satellite {channel} data',
         'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'parameter': parameter,
@@ -214,6 +299,7 @@ def calc_LST_for_date(date_str, satellite, channel, base_url, output_path):
     """
     # Get data for the monthly files
     data_dict = get_monthly_files_for_date(['SOL', 'SDL'], satellite, channel, date_str, base_url)
+    sol_ds = sdl_ds = None
 
     try:
         # Check if we have data for both parameters
@@ -221,9 +307,9 @@ def calc_LST_for_date(date_str, satellite, channel, base_url, output_path):
             print(f"No data found for {date_str}, {satellite}, {channel}")
             return None
 
-        # Open datasets from BytesIO objects
-        sol_ds = xr.open_dataset(data_dict['SOL'], engine='h5netcdf')
-        sdl_ds = xr.open_dataset(data_dict['SDL'], engine='h5netcdf')
+        # Open the cached files lazily, only the time steps of the date are read
+        sol_ds = xr.open_dataset(data_dict['SOL'], engine='h5netcdf', chunks=MONTHLY_CHUNKS)
+        sdl_ds = xr.open_dataset(data_dict['SDL'], engine='h5netcdf', chunks=MONTHLY_CHUNKS)
 
         # Parse target date
         target_date = pd.to_datetime(date_str)
@@ -263,16 +349,143 @@ def calc_LST_for_date(date_str, satellite, channel, base_url, output_path):
         # Export to netCDF with enhanced metadata
         output_file = export_netcdf(ds_max, satellite, 'LST1max', channel, date_str, output_path)
 
-        # Close input datasets to free up resources
-        sol_ds.close()
-        sdl_ds.close()
-
         return output_file
 
     except Exception as e:
         print(f"Error processing data for {date_str}, {satellite}, {channel}: {e}")
         return None
 
+    finally:
+        # Close input datasets to free up resources, the cached files can be evicted afterwards
+        for input_ds in (sol_ds, sdl_ds):
+            if input_ds is not None:
+                input_ds.close()
+
+def calc_LST_for_month(date_str, satellite, channel, base_url, output_path, start_date=None, end_date=None,
+                       single_file=False):
+    """
+    Calculate MAX LST for all days of a month in one pass
+
+    The LST is calculated chunk-wise with dask on the cached monthly files and reduced with a daily resample, so
+    the monthly files are opened and read once instead of once per day.
+
+    Args:
+        date_str: Date string in format YYYY-MM-DD of any day of the month
+        satellite: Satellite name (e.g. 'msg', 'mfg')
+        channel: Channel name (e.g. 'ch02', 'ch05h')
+        base_url: Base URL for the data
+        output_path: Path to save output
+        start_date: First date (YYYY-MM-DD) to calculate, None for the first day of the month
+        end_date: Last date (YYYY-MM-DD) to calculate, None for the last day of the month
+        single_file: Export one netCDF with all days, named with the first day of the month as the monthly input
+            files, instead of one netCDF per day as calc_LST_for_date
+
+    Returns:
+        List of paths to the output files
+    """
+    # Get data for the monthly files
+    data_dict = get_monthly_files_for_date(['SOL', 'SDL'], satellite, channel, date_str, base_url)
+    sol_ds = sdl_ds = None
+
+    try:
+        # Check if we have data for both parameters
+        if data_dict['SOL'] is None or data_dict['SDL'] is None:
+            print(f"No data found for the month of {date_str}, {satellite}, {channel}")
+            return []
+
+        # Open the cached files lazily
+        sol_ds = xr.open_dataset(data_dict['SOL'], engine='h5netcdf', chunks=MONTHLY_CHUNKS)
+        sdl_ds = xr.open_dataset(data_dict['SDL'], engine='h5netcdf', chunks=MONTHLY_CHUNKS)
+
+        # Only the days with data in both files are calculated, as in calc_LST_for_date
+        days = np.intersect1d(sol_ds.time.values.astype('datetime64[D]'), sdl_ds.time.values.astype('datetime64[D]'))
+        if start_date is not None:
+            days = days[days >= np.datetime64(start_date, 'D')]
+        if end_date is not None:
+            days = days[days <= np.datetime64(end_date, 'D')]
+        if len(days) == 0:
+            print(f"No data found for the month of {date_str} in the monthly files")
+            return []
+
+        # Merge datasets
+        ds = xr.merge([sol_ds, sdl_ds], compat='override')
+
+        # Calculate LST, evaluated chunk by chunk
+        Boltzmann = 5.670374419e-8
+        Emissivity = 0.98
+        lst1 = ((ds['SOL']-(1-Emissivity)*ds['SDL'])/Boltzmann/(Emissivity))**(1/4)
+
+        # Calculate the daily maximum of all days in one pass
+        daily_max = lst1.resample(time='1D').max().sel(time=days.astype('datetime64[ns]'))
+        daily_max = daily_max.transpose('time', 'lat', 'lon').compute()
+
+        if single_file:
+            ds_max = xr.Dataset(
+                data_vars={
+                    'LST1max': (('time', 'lat', 'lon'), daily_max.values)
+                },
+                coords={
+                    'time': daily_max.time.values,
+                    'lat': ds.lat,
+                    'lon': ds.lon
+                }
+            )
+            first_day = pd.Timestamp(days[0]).replace(day=1).strftime('%Y-%m-%d')
+            title = (f"Maximum Land Surface Temperature from {pd.Timestamp(days[0]).strftime('%Y-%m-%d')} "
+                     f"to {pd.Timestamp(days[-1]).strftime('%Y-%m-%d')}")
+            return [export_netcdf(ds_max, satellite, 'LST1max', channel, first_day, output_path, title=title)]
+
+        # Export each day as calc_LST_for_date
+        output_files = []
+        for i, day in enumerate(daily_max.time.values):
+            target_date = pd.Timestamp(day)
+            ds_max = xr.Dataset(
+                data_vars={
+                    'LST1max': (('lat', 'lon'), daily_max.values[i])
+                },
+                coords={
+                    'time': [target_date],
+                    'lat': ds.lat,
+                    'lon': ds.lon
+                }
+            )
+            output_files.append(export_netcdf(ds_max, satellite, 'LST1max', channel,
+                                              target_date.strftime('%Y-%m-%d'), output_path))
+        return output_files
+
+    except Exception as e:
+        print(f"Error processing data for the month of {date_str}, {satellite}, {channel}: {e}")
+        return []
+
+    finally:
+        # Close input datasets to free up resources, the cached files can be evicted afterwards
+        for input_ds in (sol_ds, sdl_ds):
+            if input_ds is not None:
+                input_ds.close()
+
+def calc_LST_for_period(start_date, end_date, satellite, channel, base_url, output_path, single_file=False):
+    """
+    Calculate MAX LST for all days of a period (e.g. a whole archive), one month at a time
+
+    Args:
+        start_date: First date in format YYYY-MM-DD
+        end_date: Last date in format YYYY-MM-DD
+        satellite: Satellite name (e.g. 'msg', 'mfg')
+        channel: Channel name (e.g. 'ch02', 'ch05h')
+        base_url: Base URL for the data
+        output_path: Path to save output
+        single_file: Export one netCDF per month instead of one per day
+
+    Returns:
+        List of paths to the output files
+    """
+    output_files = []
+    first_month = pd.Timestamp(start_date).replace(day=1)
+    for month in pd.date_range(first_month, pd.Timestamp(end_date), freq='MS'):
+        output_files.extend(calc_LST_for_month(month.strftime('%Y-%m-%d'), satellite, channel, base_url, output_path,
+                                               start_date=start_date, end_date=end_date, single_file=single_file))
+    return output_files
+
 def main():
     # Define paths
     BASE_URL = "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur"
@@ -281,35 +494,36 @@ def main():
     # Define parameters with new YYYY-MM-DD format
     date_str = "2018-06-15"  # Changed from "20180615" to "2018-06-15"
 
+    # Calculate all days of the month of date_str in one pass instead of date_str only
+    MONTH_MODE = False
+
     # Convert dates for comparison
     date_obj = datetime.strptime(date_str, '%Y-%m-%d')
 
+    def calc(satellite, channel):
+        if MONTH_MODE:
+            return calc_LST_for_month(date_str, satellite, channel, BASE_URL, OUTPUT_PATH)
+        result = calc_LST_for_date(date_str, satellite, channel, BASE_URL, OUTPUT_PATH)
+        return [result] if result else []
+
     # Calculate MAX LST for different satellite/channel combinations
     results = []
 
     # MSG CH02
     if date_obj >= datetime(2004, 1, 1) and date_obj <= datetime(2023, 12, 31):
-        result = calc_LST_for_date(date_str, 'msg', 'ch02', BASE_URL, OUTPUT_PATH)
-        if result:
-            results.append(result)
+        results.extend(calc('msg', 'ch02'))
 
     # MSG CH05H
     if date_obj >= datetime(2004, 1, 1) and date_obj <= datetime(2023, 12, 31):
-        result = calc_LST_for_date(date_str, 'msg', 'ch05h', BASE_URL, OUTPUT_PATH)
-        if result:
-            results.append(result)
+        results.extend(calc('msg', 'ch05h'))
 
     # MFG CH02
     if date_obj >= datetime(1991, 1, 1) and date_obj <= datetime(2005, 12, 31):
-        result = calc_LST_for_date(date_str, 'mfg', 'ch02', BASE_URL, OUTPUT_PATH)
-        if result:
-            results.append(result)
+        results.extend(calc('mfg', 'ch02'))
 
     # MFG CH05H
     if date_obj >= datetime(1991, 1, 1) and date_obj <= datetime(2005, 12, 31):
-        result = calc_LST_for_date(date_str, 'mfg', 'ch05h', BASE_URL, OUTPUT_PATH)
-        if result:
-            results.append(result)
+        results.extend(calc('mfg', 'ch05h'))
 
     print(f"Processed MAX LST for {date_str}. Output files:")
     for result in results:
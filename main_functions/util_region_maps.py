@@ -0,0 +1,145 @@
+"""
+Region Map Grid Renderer
+
+This script renders the annual map grids of the warn regions (one column per year, one row per week) for
+util_cdi_vhi_maps and util_vhi_meteoswiss_maps.
+
+The region geometries are converted to matplotlib paths once. Each cell only adds one PathCollection with the
+facecolors of the day, instead of a GeoPandas plot per cell. The year columns are rendered in parallel
+processes and composed into the grid with numpy.
+
+License: MIT License
+
+Usage:
+    columns = [[(title, fontsize, colors), ...], ...]  # per year, cells from top to bottom
+    util_region_maps.render_grid(columns, regions, "VHI Maps 2018-2022", "vhi_annual_maps_2018_2022.png")
+
+Dependencies:
+    - matplotlib
+    - numpy
+    - geopandas
+    - concurrent.futures
+    - PIL (Pillow)
+
+Functions:
+    - get_region_paths(regions: gpd.GeoDataFrame) -> list
+    - render_column(paths: list, cells: list, cell_size: tuple, dpi: int) -> np.ndarray
+    - render_grid(columns: list, regions: gpd.GeoDataFrame, title: str, output_path: str, cell_size: tuple, dpi: int, max_workers: int)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.collections import PathCollection
+from matplotlib.path import Path
+from PIL import Image
+
+
+def get_region_paths(regions):
+    """
+    Converts the region geometries to matplotlib paths, with holes and multipolygon parts.
+
+    Args:
+        regions (gpd.GeoDataFrame): Regions base geometry
+
+    Returns:
+        list: One compound path per region, in the order of the regions
+    """
+    paths = []
+    for geometry in regions.geometry:
+        polygons = getattr(geometry, "geoms", [geometry])
+        rings = [ring for polygon in polygons for ring in [polygon.exterior, *polygon.interiors]]
+        paths.append(Path.make_compound_path(
+            *[Path(np.asarray(ring.coords)[:, :2], closed=True) for ring in rings]))
+    return paths
+
+
+def render_column(paths, cells, cell_size=(5, 100 / 48), dpi=300):
+    """
+    Renders one column of the grid.
+
+    Args:
+        paths (list): Region paths (see get_region_paths)
+        cells (list): Tuples (title, fontsize, colors) from top to bottom, colors per region
+        cell_size (tuple): Size of a cell in inches
+        dpi (int): Resolution
+
+    Returns:
+        np.ndarray: RGB image of the column
+    """
+    fig, axes = plt.subplots(nrows=len(cells), ncols=1,
+                             figsize=(cell_size[0], cell_size[1] * len(cells)), dpi=dpi, squeeze=False)
+
+    for ax, (title, fontsize, colors) in zip(axes[:, 0], cells):
+        # Only the facecolors change between the cells
+        ax.add_collection(PathCollection(paths, facecolors=colors, edgecolors='black', linewidths=0.5))
+        ax.autoscale_view()
+        ax.set_aspect('equal')
+        ax.set_title(title, fontsize=fontsize)
+        ax.axis('off')
+
+    fig.canvas.draw()
+    image = np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+    plt.close(fig)
+    return image
+
+
+def crop_white(image):
+    """Crops the white margins of an image, as bbox_inches='tight' does when saving."""
+    content = np.nonzero((image < 255).any(axis=2))
+    if content[0].size == 0:
+        return image
+    return image[content[0].min():content[0].max() + 1, content[1].min():content[1].max() + 1]
+
+
+def render_grid(columns, regions, title, output_path, cell_size=(5, 100 / 48), dpi=300, max_workers=None):
+    """
+    Renders and saves a grid of region maps.
+
+    Args:
+        columns (list): Cells per column (see render_column), e.g. one column per year
+        regions (gpd.GeoDataFrame): Regions base geometry, in the order of the cell colors
+        title (str): Title of the grid
+        output_path (str): Path of the PNG file
+        cell_size (tuple): Size of a cell in inches
+        dpi (int): Resolution
+        max_workers (int): Number of processes for the columns, 1 to render in this process
+
+    Returns:
+        None
+    """
+    paths = get_region_paths(regions)
+    title_height = int(round(0.5 * dpi))
+
+    executor = None if max_workers == 1 else ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        if executor is None:
+            images = (render_column(paths, cells, cell_size, dpi) for cells in columns)
+        else:
+            images = executor.map(render_column, [paths] * len(columns), columns,
+                                  [cell_size] * len(columns), [dpi] * len(columns))
+
+        # Place each column into the grid as soon as it is rendered, below a band for the title
+        grid = None
+        for col, image in enumerate(images):
+            height, width = image.shape[:2]
+            if grid is None:
+                grid = np.full((title_height + height, width * len(columns), 3), 255, dtype=np.uint8)
+            grid[title_height:title_height + height, col * width:(col + 1) * width] = image
+            del image
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    title_figure = plt.figure(figsize=(grid.shape[1] / dpi, title_height / dpi), dpi=dpi)
+    title_figure.suptitle(title, fontsize=16, y=0.5, va='center')
+    title_figure.canvas.draw()
+    title_image = np.asarray(title_figure.canvas.buffer_rgba())[:title_height, :grid.shape[1], :3]
+    grid[:title_image.shape[0], :title_image.shape[1]] = title_image
+    plt.close(title_figure)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    Image.fromarray(np.ascontiguousarray(crop_white(grid))).save(output_path)
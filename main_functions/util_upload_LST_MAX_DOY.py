@@ -1,20 +1,27 @@
 import ee
 import netCDF4
-import subprocess
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling
 sys.path.append(os.path.abspath(r"C:\temp\topo-satromo\step0_processors"))
 sys.path.append(os.path.abspath(r"C:\temp\topo-satromo"))
 # from step0_utils import write_asset_as_empty
 from main_functions import main_utils
+from main_functions import main_task_tracker
+from main_functions import main_gcs_staging
+from main_functions import main_ingestion
 import numpy as np
 from datetime import datetime, timezone
 from pydrive.auth import GoogleAuth
 import json
-import time
 from oauth2client.service_account import ServiceAccountCredentials
 from google.cloud import storage
-import tempfile
 """
 util_upload_LST_MAX_DOY.py
 
@@ -29,12 +36,22 @@ Functions:
 
 2. generate_lst_mosaic_for_single_doy(doy_to_process, collection, netcdf_path, task_description, set_timeframe, set_scale, tiffpath, percentiles):
     - Generates a MSG MFG LST mosaic for a single date and uploads it to Google Cloud Storage and Google Earth Engine.
-    - Manages metadata, checks for existing assets, and starts task execution for upload to GEE collection as an asset.
+    - Manages metadata and ingests the GeoTIFF into the GEE collection as an asset, overwriting an existing asset.
 
 3. export_doy_bands_to_geotiff(netcdf_path, output_path, percentiles, doy):
-    - Exports all 4 percentile bands for a specific day of year (DOY) from a NetCDF file to a GeoTIFF using subprocess calls to GDAL utilities.
+    - Exports all 4 percentile bands for a specific day of year (DOY) from a NetCDF file to a GeoTIFF.
     - Multiplies values by 100 and converts to UInt16.
 
+4. export_all_doy_bands_to_geotiff(netcdf_path, tiffpath, percentiles, doys, max_workers):
+    - Reads the percentile bands of all DOYs with one read of the NetCDF file and scales them in numpy.
+    - Writes the reprojected 4-band COG of each DOY from worker processes.
+
+5. get_doy_manifest(doy_to_process, asset_name, uri, netcdf_path, set_timeframe, set_scale, band_names, processor_version):
+    - Builds the ingestion manifest of a DOY GeoTIFF on GCS with its metadata properties.
+
+6. ingest_all_doys(collection, netcdf_path, set_timeframe, set_scale, tiffpath, percentiles, doys, export_tiff, max_workers):
+    - Exports and uploads the GeoTIFFs of many DOYs and submits their ingestion manifests in bulk (no EE compute tasks).
+
 Example Usage:
 --------------
 python util_upload_LST_MAX_DOY.py -d "/path/to/your/dx file.tif"
@@ -108,7 +125,7 @@ def determine_run_type():
 
 
 
-def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netcdf_path, task_description: str,set_timeframe,set_scale, tiffpath,percentiles) -> None:
+def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netcdf_path, task_description: str,set_timeframe,set_scale, tiffpath,percentiles, export_tiff=True) -> None:
     """
     Generates a MSG MFG LST mosaic for a single date and uploads it to Google Cloud Storage and Google Earth Engine.
 
@@ -121,6 +138,7 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
         set_scale (int): Scale for the asset.
         tiffpath (str): Path to save the output GeoTIFF.
         percentiles (list): List of percentiles to process.
+        export_tiff (bool): Export the GeoTIFF, False if it is already exported by export_all_doy_bands_to_geotiff.
     """
 
     # Band name
@@ -140,7 +158,8 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
 
     output_path = tiffpath+doy_to_process+"_percentiles_CH1903.tif"
     # Create the TIFF dataset
-    export_doy_bands_to_geotiff(netcdf_path, output_path, percentiles, doy_to_process)
+    if export_tiff:
+        export_doy_bands_to_geotiff(netcdf_path, output_path, percentiles, doy_to_process)
 
     # check if we are on a local machine or on github
     determine_run_type()
@@ -154,8 +173,8 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
     try:
         blob = bucket.blob("M_LST_"+doy_to_process +
                            "_percentiles_CH1903.tif")
-        blob.upload_from_filename(
-            output_path)
+        main_gcs_staging.upload_file(
+            blob, output_path)
         print(f"File M_LST_"+doy_to_process +
                            "_percentiles_CH1903.tif" +
               " uploaded to gs://"+bucket_name+"/M_LST_"+doy_to_process+"_percentiles_CH1903.tif")
@@ -166,12 +185,51 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
     # Define the asset name for Earth Engine
     asset_name = collection+"/"+asset_prefix+doy_to_process.zfill(3)
 
-    # Load the GeoTIFF file as an Earth Engine Image
-    image = ee.Image.loadGeoTIFF(
-        f"gs://{bucket_name}/M_LST_"+doy_to_process+"_percentiles_CH1903.tif")
+    # Ingest the GeoTIFF on GCS as asset, without an EE compute task. An existing asset is overwritten
+    manifest = get_doy_manifest(
+        doy_to_process, asset_name, f"gs://{bucket_name}/M_LST_"+doy_to_process+"_percentiles_CH1903.tif",
+        netcdf_path, set_timeframe, set_scale, band_names, main_utils.get_github_info())
+    task_id = main_ingestion.start_ingestion(manifest, description=task_description)
+
+    if wait_for_upload is True:
+        # Track the ingestion in the background, GCS is cleaned up when it has finished
+        def on_complete(status):
+            # If the task is completed, continue with cleaning up GCS
+            if status['state'] == 'COMPLETED':
+                print("upload finished:" + asset_prefix+doy_to_process )
+
+                # delete file on GCS
+                blob.delete()
+
+            # If the task has failed, print the error message
+            elif status['state'] == 'FAILED':
+                print("Ingestion failed with error message:", status.get('error_message'))
+
+        main_task_tracker.register(task_id, on_complete, task_description)
 
-    # rename band
-    image = image.rename(band_names)
+    # remove the local file
+    os.remove(output_path)
+
+
+def get_doy_manifest(doy_to_process, asset_name, uri, netcdf_path, set_timeframe, set_scale, band_names, processor_version):
+    """
+    Builds the ingestion manifest of the percentile GeoTIFF of a DOY with its metadata properties.
+
+    Args:
+        doy_to_process (str): The day of year (format: DDD).
+        asset_name (str): Asset ID.
+        uri (str): GCS URI of the GeoTIFF.
+        netcdf_path (str): Path to the NetCDF file, for the orig_filename property.
+        set_timeframe (int): Timeframe in days.
+        set_scale (int): Scale for the asset.
+        band_names (list): Names of the percentile bands.
+        processor_version (dict): Processor version from main_utils.get_github_info().
+
+    Returns:
+        dict: Manifest for main_ingestion.start_ingestion
+    """
+    # GEE asset NAME prefix
+    asset_prefix = "LST_Stats_DOY"
 
     # Fixed start and end dates
     start_date = "1991-01-01"  # Start date (fixed)
@@ -191,12 +249,8 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
     # Convert to milliseconds since epoch for 'system:time_end'
     end_timestamp = int(end_datetime.timestamp()) * 1000  # Convert seconds to milliseconds
 
-    # Getting swisstopo Processor Version
-    processor_version = main_utils.get_github_info()
-
     # Set metadata properties
-
-    image = image.set({
+    properties = {
         # Convert to milliseconds Start timestamp
         'system:time_start': start_timestamp,
         # Assuming single timestamp Convert to milliseconds End timestamp
@@ -214,55 +268,180 @@ def generate_lst_mosaic_for_single_doy(doy_to_process: str, collection: str,netc
         'scale': set_scale,
         # timeframeInDays
         'timeframeInDays': set_timeframe
+    }
 
-    })
+    return main_ingestion.get_manifest(asset_name, uri, band_names, properties)
 
-    # Check if the asset already exists
-    asset_exists = ee.data.getInfo(asset_name)
 
-    # If the asset exists, delete it, otherwise upload fails
-    if asset_exists:
-        ee.data.deleteAsset(asset_name)
-        print(f"Deleted existing asset: {asset_name}")
+def ingest_all_doys(collection, netcdf_path, set_timeframe, set_scale, tiffpath, percentiles, doys=range(1, 367),
+                    export_tiff=True, max_workers=8):
+    """
+    Exports, uploads and ingests the percentile GeoTIFFs of many DOYs at once, see generate_lst_mosaic_for_single_doy.
 
-    # Export the image to the asset folder
-    task = ee.batch.Export.image.toAsset(
-        image, assetId=asset_name,
-        description=task_description)  # force Enable overwrite
-    task.start()
+    The GeoTIFFs are uploaded to GCS in parallel and all manifests are submitted in bulk. The ingestions are
+    tracked by main_task_tracker, which deletes the file on GCS when an ingestion has finished.
 
-    if wait_for_upload is True:
-        # Wait for 15 seconds
-        time.sleep(15)
+    Args:
+        collection (str): The collection name for the assets.
+        netcdf_path (str): Path to the NetCDF file.
+        set_timeframe (int): Timeframe in days.
+        set_scale (int): Scale for the assets.
+        tiffpath (str): Prefix of the GeoTIFFs, the DOY and "_percentiles_CH1903.tif" are appended.
+        percentiles (list): List of percentiles, the bands of each DOY.
+        doys (iterable): Days of year to ingest (1-366).
+        export_tiff (bool): Export the GeoTIFFs, False if they are already exported by export_all_doy_bands_to_geotiff.
+        max_workers (int): Number of parallel uploads and ingestion requests.
+
+    Returns:
+        dict: Task ID per asset name of the started ingestions
+    """
+    band_names = [f"p{int(p * 100):02d}" for p in percentiles]  # Ensures 2-digit formatting
+
+    # GCS Google cloud storage bucket
+    bucket_name = "viirs_lst_meteoswiss"
+
+    # GEE asset NAME prefix
+    asset_prefix = "LST_Stats_DOY"
 
-        # Check the export task status:
-        # If bulk upload is required: no while loop is required, you need to parse thet stats in dict and then check for FAILED tasks
-        while task.active():
-            print("Export task is still active. Waiting...")
-            time.sleep(5)  # Check status every 5 seconds
+    doys = [str(doy) for doy in doys]
+    if export_tiff:
+        export_all_doy_bands_to_geotiff(netcdf_path, tiffpath, percentiles, doys=[int(doy) for doy in doys])
 
-        # If the task is completed, continue with cleaning up GCS
-        if task.status()['state'] == 'COMPLETED':
-            # Continue with your code here
-            pass
-            print("upload finished:" + asset_prefix+doy_to_process )
+    # check if we are on a local machine or on github, once for all DOYs
+    determine_run_type()
+    bucket = storage_client.bucket(bucket_name)
+    processor_version = main_utils.get_github_info()
+
+    # Upload the GeoTIFFs in parallel
+    def upload(doy):
+        blob = bucket.blob("M_LST_"+doy+"_percentiles_CH1903.tif")
+        main_gcs_staging.upload_file(blob, tiffpath+doy+"_percentiles_CH1903.tif")
+        os.remove(tiffpath+doy+"_percentiles_CH1903.tif")
+        return blob
+
+    blobs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(upload, doy): doy for doy in doys}
+        for future in as_completed(futures):
+            try:
+                blobs[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Error uploading DOY {futures[future]} to GCS: {e}")
+    print(f"Uploaded {len(blobs)} GeoTIFFs to gs://{bucket_name}")
+
+    # Submit the manifests of all uploaded DOYs in bulk
+    def get_on_complete(doy, blob):
+        def on_complete(status):
+            if status['state'] == 'COMPLETED':
+                print("upload finished:" + asset_prefix+doy)
+                blob.delete()
+            elif status['state'] == 'FAILED':
+                print(f"Ingestion of DOY {doy} failed with error message:", status.get('error_message'))
+        return on_complete
+
+    ingestions = [
+        (get_doy_manifest(doy, collection+"/"+asset_prefix+doy.zfill(3), "gs://"+bucket_name+"/"+blob.name,
+                          netcdf_path, set_timeframe, set_scale, band_names, processor_version),
+         get_on_complete(doy, blob))
+        for doy, blob in sorted(blobs.items(), key=lambda item: int(item[0]))
+    ]
+    return main_ingestion.start_ingestions(ingestions, max_workers=max_workers)
+
+
+def get_percentile_variable(dataset):
+    """
+    Returns the percentile variable of the NetCDF file, the only variable with dimensions besides lat and lon.
 
-            # delete file on GCS
-            blob.delete()
+    Args:
+        dataset (netCDF4.Dataset): Opened NetCDF file
 
-        # If the task has failed, print the error message
-        elif task.status()['state'] == 'FAILED':
-            error_message = task.status()['error_message']
-            print("Export task failed with error message:", error_message)
+    Returns:
+        netCDF4.Variable: Percentile variable, the bands are the values of its leading dimensions (as GDAL numbers them)
+    """
+    candidates = [var for var in dataset.variables.values() if var.ndim >= 3]
+    if len(candidates) != 1:
+        raise ValueError(f"Expected one percentile variable in the NetCDF file, found {len(candidates)}")
+    return candidates[0]
 
-    # remove the local file
-    os.remove(output_path)
+
+def get_north_up_transform(dataset):
+    """
+    Computes the transform of the lon/lat grid of the NetCDF file from its pixel centers.
+
+    Args:
+        dataset (netCDF4.Dataset): Opened NetCDF file
+
+    Returns:
+        tuple: Affine transform of the north up grid, whether the rows have to be flipped and whether the columns
+        have to be flipped
+    """
+    lon = np.asarray(dataset.variables['lon'][:], dtype=np.float64)
+    lat = np.asarray(dataset.variables['lat'][:], dtype=np.float64)
+    x_res = (lon[-1] - lon[0]) / (lon.size - 1)
+    y_res = (lat[-1] - lat[0]) / (lat.size - 1)
+    transform = from_origin(lon.min() - abs(x_res) / 2, lat.max() + abs(y_res) / 2, abs(x_res), abs(y_res))
+    return transform, y_res > 0, x_res < 0
+
+
+def scale_bands(bands, flip_rows, flip_columns):
+    """
+    Multiplies the bands by 100 and converts them to UInt16 (as gdal_calc numpy.uint16(A*100)), nodata is 0.
+
+    Args:
+        bands (np.ma.MaskedArray): Bands (band, lat, lon)
+        flip_rows (bool): Flip the rows to north up
+        flip_columns (bool): Flip the columns to west to east
+
+    Returns:
+        np.ndarray: Scaled bands
+    """
+    data = np.ma.filled(np.ma.asarray(bands, dtype=np.float32), np.nan)
+    with np.errstate(invalid='ignore'):
+        scaled = (data * 100).astype(np.uint16)
+    scaled[np.isnan(data)] = 0
+    if flip_rows:
+        scaled = scaled[:, ::-1, :]
+    if flip_columns:
+        scaled = scaled[:, :, ::-1]
+    return np.ascontiguousarray(scaled)
+
+
+def write_doy_cog(bands, transform, output_path):
+    """
+    Reprojects the scaled bands of a DOY in memory to EPSG:2056 (bilinear) and writes them as COG.
+
+    Args:
+        bands (np.ndarray): Scaled UInt16 bands (band, lat, lon), north up
+        transform (Affine): Transform of the bands in EPSG:4326
+        output_path (str): Path of the COG
+
+    Returns:
+        str: Path of the COG
+    """
+    profile = {
+        'driver': 'GTiff',
+        'height': bands.shape[1],
+        'width': bands.shape[2],
+        'count': bands.shape[0],
+        'dtype': rasterio.uint16,
+        'crs': 'EPSG:4326',
+        'transform': transform,
+        'nodata': 0
+    }
+
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(bands)
+        with memfile.open() as src, WarpedVRT(src, crs='EPSG:2056', resampling=Resampling.bilinear) as vrt:
+            rio_copy(vrt, output_path, driver='COG', compress='DEFLATE', predictor=2)
+
+    return output_path
 
 
 def export_doy_bands_to_geotiff(netcdf_path, output_path, percentiles, doy):
     """
-    Export all 4 percentile bands for a specific day of year (DOY) from a NetCDF file to a GeoTIFF
-    using subprocess calls to GDAL utilities. Multiplies values by 100 and converts to UInt16.
+    Export all 4 percentile bands for a specific day of year (DOY) from a NetCDF file to a GeoTIFF.
+    Multiplies values by 100 and converts to UInt16.
 
     Parameters:
     -----------
@@ -275,113 +454,64 @@ def export_doy_bands_to_geotiff(netcdf_path, output_path, percentiles, doy):
     doy : int
         The day of year to extract (1-366)
     """
-    # Open the NetCDF file to get information
-    dataset = netCDF4.Dataset(netcdf_path, 'r')
-
-
-
-    # Create a temporary directory for intermediate files
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Process each percentile separately
-        temp_files = []
-
-        for i, percentile in enumerate(percentiles):
-            # Calculate the band index (starting from 1)
-            band_idx = (int(doy) - 1) * 4 + (i + 1)
-
-            # Create a temporary file for this band
-            temp_file = os.path.join(temp_dir, f"doy{doy}_percentile{percentile}.tif")
-
-            # Create an intermediate file for scaled data
-            temp_scaled_file = os.path.join(temp_dir, f"doy{doy}_percentile{percentile}_scaled.tif")
-
-            # Construct gdal_translate command to extract the specific band
-            gdal_translate_cmd = [
-                'gdal_translate',
-                '-b', str(band_idx),
-                '-a_srs', 'EPSG:4326',  # Source coordinate system
-                netcdf_path,
-                temp_file
-            ]
-
-            print(f"Extracting band {band_idx} (DOY {doy}, percentile {percentile})")
-
-            # Execute gdal_translate
-            result = subprocess.run(gdal_translate_cmd, check=True,
-                                   capture_output=True, text=True)
-
-            # Process with gdal_calc to multiply by 100 and convert to UInt16
-            gdal_calc_cmd = [
-                'gdal_calc',
-                '-A', temp_file,
-                '--outfile=' + temp_scaled_file,
-                '--calc=numpy.uint16(A*100)',  # Multiply by 100 and convert to UInt16
-                '--NoDataValue=0',
-                '--type=UInt16'
-            ]
-
-            print(f"Scaling band {band_idx} by 100 and converting to UInt16")
-
-            result = subprocess.run(gdal_calc_cmd, check=True,
-                                  capture_output=True, text=True)
-
-            if result.stderr and 'Warning' not in result.stderr:
-                print(f"Warning in gdal_calc: {result.stderr}")
-
-            temp_files.append(temp_scaled_file)
-
-        # Now merge all 4 scaled band files into one multi-band GeoTIFF
-        temp_merged = os.path.join(temp_dir, "merged.tif")
-        gdal_buildvrt_cmd = [
-            'gdalbuildvrt',
-            '-separate',
-            os.path.join(temp_dir, "merged.vrt"),
-        ] + temp_files
-
-        # Execute gdalbuildvrt
-        subprocess.run(gdal_buildvrt_cmd, check=True,
-                       capture_output=True, text=True)
-
-        # Convert VRT to GeoTIFF with UInt16 type
-        gdal_translate_vrt_cmd = [
-            'gdal_translate',
-            '-ot', 'UInt16',  # Ensure output type is UInt16
-            os.path.join(temp_dir, "merged.vrt"),
-            temp_merged
-        ]
-
-        subprocess.run(gdal_translate_vrt_cmd, check=True,
-                      capture_output=True, text=True)
-
-        # Finally, warp the merged file to EPSG:2056
-        gdalwarp_cmd = [
-            'gdalwarp',
-            '-s_srs', 'EPSG:4326',
-            '-t_srs', 'EPSG:2056',
-            '-of', 'COG',
-            '-srcnodata', '0',
-            '-co', 'COMPRESS=DEFLATE',
-            '-co', 'PREDICTOR=2',
-            '-ot', 'UInt16',  # Ensure output type is UInt16
-            '-r', 'bilinear',  # Resampling method
-            temp_merged,
-            output_path
-        ]
-
-        print(f"Reprojecting to EPSG:2056 and saving to {output_path}")
-        result = subprocess.run(gdalwarp_cmd, check=True,
-                               capture_output=True, text=True)
-
-        # For debugging
-        if result.stderr:
-            print(f"Warning: {result.stderr}")
-
-    # Close the dataset
-    dataset.close()
+    # Open the NetCDF file and read only the bands of the DOY
+    with netCDF4.Dataset(netcdf_path, 'r') as dataset:
+        variable = get_percentile_variable(dataset)
+        transform, flip_rows, flip_columns = get_north_up_transform(dataset)
+        band_indices = [(int(doy) - 1) * len(percentiles) + i for i in range(len(percentiles))]
+        bands = np.ma.stack([variable[np.unravel_index(band_idx, variable.shape[:-2])]
+                             for band_idx in band_indices])
+
+    print(f"Reprojecting to EPSG:2056 and saving to {output_path}")
+    write_doy_cog(scale_bands(bands, flip_rows, flip_columns), transform, output_path)
 
     print(f"GeoTIFF with 4 percentile bands for DOY {doy} created at: {output_path}")
     print(f"Bands contain percentiles: {percentiles} (multiplied by 100 and stored as UInt16)")
 
+
+def export_all_doy_bands_to_geotiff(netcdf_path, tiffpath, percentiles, doys=range(1, 367), max_workers=None):
+    """
+    Export the percentile bands of all DOYs from a NetCDF file to GeoTIFFs, see export_doy_bands_to_geotiff.
+
+    The NetCDF file is opened and read once, all bands are scaled in numpy and the COGs are reprojected and
+    written by worker processes.
+
+    Args:
+        netcdf_path (str): Path to the NetCDF file
+        tiffpath (str): Prefix of the output GeoTIFFs, the DOY and "_percentiles_CH1903.tif" are appended
+        percentiles (list): List of percentiles, the bands of each DOY
+        doys (iterable): Days of year to export (1-366)
+        max_workers (int): Number of worker processes, None for the number of CPUs
+
+    Returns:
+        dict: Path of the GeoTIFF per DOY
+    """
+    # Read all bands with one read, e.g. 1464 bands for 366 DOYs and 4 percentiles
+    with netCDF4.Dataset(netcdf_path, 'r') as dataset:
+        variable = get_percentile_variable(dataset)
+        transform, flip_rows, flip_columns = get_north_up_transform(dataset)
+        cube = variable[:]
+    cube = scale_bands(cube.reshape((-1,) + cube.shape[-2:]), flip_rows, flip_columns)
+    cube = cube.reshape((-1, len(percentiles)) + cube.shape[-2:])
+    print(f"Read {cube.shape[0] * cube.shape[1]} bands of {netcdf_path}")
+
+    output_paths = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(write_doy_cog, cube[int(doy) - 1], transform,
+                            tiffpath + str(doy) + "_percentiles_CH1903.tif"): doy
+            for doy in doys
+        }
+        for future in as_completed(futures):
+            doy = futures[future]
+            try:
+                output_paths[doy] = future.result()
+            except Exception as e:
+                print(f"Error exporting DOY {doy}: {str(e)}")
+
+    print(f"GeoTIFFs with {len(percentiles)} percentile bands created for {len(output_paths)} DOYs")
+    return output_paths
+
 if __name__ == "__main__":
     global config_GDRIVE_SECRETS
     config_GDRIVE_SECRETS = r'C:\temp\topo-satromo\secrets\geetest-credentials-int.secret'
@@ -400,22 +530,12 @@ if __name__ == "__main__":
 
     #generate_lst_mosaic_for_single_doy(doy_to_process, collection,netcdf_path, task_description,set_timeframe,set_scale,tiff_path,percentiles)
 
-        # Loop through all days of the year (1-366 to include leap years)
-    for doy_to_process in range(1, 367):
-        task_description = f"{doy_to_process} 2004-2021_LST_MAX_AS_SWISS"
-        print(f"Processing day {doy_to_process}...")
-        
-        # Call your processing function for each day
-        generate_lst_mosaic_for_single_doy(
-            str(doy_to_process),  # Convert to string as your function seems to expect a string
-            collection,
-            netcdf_path,
-            task_description,
-            set_timeframe,
-            set_scale,
-            tiff_path,
-            percentiles
-        )
+    # Export the GeoTIFFs of all days of the year (1-366 to include leap years) with one read of the NetCDF file,
+    # upload them and submit the ingestions of all days in bulk
+    ingest_all_doys(collection, netcdf_path, set_timeframe, set_scale, tiff_path, percentiles, doys=range(1, 367))
+
+    # Wait for the ingests of all days, they run in parallel
+    main_task_tracker.wait_all()
 
 
 
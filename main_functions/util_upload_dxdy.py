@@ -5,11 +5,18 @@ import numpy as np
 from datetime import datetime, timezone
 from pydrive.auth import GoogleAuth
 import json
-import time
 import subprocess
 from oauth2client.service_account import ServiceAccountCredentials
 from google.cloud import storage
 import re
+import sys
+
+# Project root on sys.path for the task tracker and the GCS staging
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from main_functions import main_task_tracker, main_gcs_staging
 
 """
 Header:
@@ -182,8 +189,8 @@ def upload_dx_dy_mosaic_for_single_date(day_to_process: str, collection: str) ->
     # Upload the file to the bucket
     try:
         blob = bucket.blob(asset_name+".tif")
-        blob.upload_from_filename(
-            asset_name+".tif")
+        main_gcs_staging.upload_file(
+            blob, asset_name+".tif")
         print("SUCCESS: uploaded to gs://"+bucket_name+"/"+asset_name+".tif")
 
         # delete file on GCS
@@ -245,29 +252,21 @@ def upload_dx_dy_mosaic_for_single_date(day_to_process: str, collection: str) ->
     task.start()
 
     if wait_for_upload is True:
-        # Wait for 60 seconds
-        time.sleep(60)
-
-        # Check the export task status:
-        # If bulk upload is required: no while loop is required, you need to parse thet stats in dict and then check for FAILED tasks
-        while task.active():
-            print("Export task "+asset_name+" is still active. Waiting...")
-            time.sleep(60)  # Check status every 5 seconds
-
-        # If the task is completed, continue with cleaning up GCS
-        if task.status()['state'] == 'COMPLETED':
-            # Continue with your code here
-            pass
-            print("SUCCESS: uploaded to collection "+collection+" finished")
-
-            # delete file on GCS
-            blob.delete()
-
-        # If the task has failed, print the error message
-        elif task.status()['state'] == 'FAILED':
-            error_message = task.status()['error_message']
-            print("ERROR: Export task "+asset_name +
-                  " failed with error message:", error_message)
+        # Track the export task in the background, GCS is cleaned up when it has finished
+        def on_complete(status):
+            # If the task is completed, continue with cleaning up GCS
+            if status['state'] == 'COMPLETED':
+                print("SUCCESS: uploaded to collection "+collection+" finished")
+
+                # delete file on GCS
+                blob.delete()
+
+            # If the task has failed, print the error message
+            elif status['state'] == 'FAILED':
+                print("ERROR: Export task "+asset_name +
+                      " failed with error message:", status.get('error_message'))
+
+        main_task_tracker.register(task, on_complete)
 
     # remove the local file
     if delete_local is True:
@@ -297,3 +296,6 @@ if __name__ == "__main__":
 
     # Call the function with the appropriate day_to_process value
     upload_dx_dy_mosaic_for_single_date(day_to_process, collection)
+
+    # Wait for the ingest and the clean up on GCS
+    main_task_tracker.wait_all()
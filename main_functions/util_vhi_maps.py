@@ -13,6 +13,10 @@ Usage:
     change in code the
     VHI_TYPE = "vegetation" or "forest"
 
+The warn region GeoJSONs are cached in cache/vhi_warnregions/<VHI_TYPE>, so regenerating the grids after a
+style change needs no downloads. Set revalidate = True to check the cached days against the server (ETag)
+and to request the days without data again.
+
 Dependencies:
     - requests
     - numpy
@@ -25,6 +29,7 @@ Dependencies:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
 from datetime import datetime, timedelta
 import os
@@ -34,6 +39,7 @@ from tqdm import tqdm
 import logging
 import json
 import calendar
+import threading
 
 
 
@@ -42,7 +48,16 @@ class VHIMapGridGenerator:
         self.years = range(2017, 2025)
         self.base_url = "https://data.geo.admin.ch/ch.swisstopo.swisseo_vhi_v100"
         self.map_size = (100, 100)
-        self.max_workers = 4
+        self.max_workers = 16
+        self.cache_dir = os.path.join("cache", "vhi_warnregions")
+        self.revalidate = False
+
+        # Rasterized region layers by geometry, shared by all days with the same regions
+        self.map_layers = {}
+
+        # One pooled session for all fetch threads
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.max_workers, max_retries=3))
 
         self.bbox = {
             'min_lon': 5.9559,
@@ -103,66 +118,179 @@ class VHIMapGridGenerator:
             date_str = date.strftime("%Y-%m-%d")
             url = f"{self.base_url}/{date_str}t235959/ch.swisstopo.swisseo_vhi_v100_{date_str}t235959_{VHI_TYPE}-warnregions.geojson"
 
-            response = requests.get(url)
+            # Cached responses by VHI type and date, with the ETag of the server next to them
+            cache_file = os.path.join(self.cache_dir, VHI_TYPE, f"{date_str}.geojson")
+            etag_file = cache_file + ".etag"
+            missing_file = cache_file + ".missing"
+            if not self.revalidate:
+                if os.path.exists(cache_file):
+                    with open(cache_file) as f:
+                        return json.load(f)
+                if os.path.exists(missing_file):
+                    return None
+
+            headers = {}
+            if os.path.exists(cache_file) and os.path.exists(etag_file):
+                with open(etag_file) as f:
+                    headers["If-None-Match"] = f.read().strip()
+
+            response = self.session.get(url, headers=headers, timeout=60)
+            if response.status_code == 304:
+                with open(cache_file) as f:
+                    return json.load(f)
+            if response.status_code == 404:
+                # Remember days without data, they are only requested again when revalidating
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                open(missing_file, "w").close()
+                return None
             if response.status_code != 200:
                 return None
 
+            # Write to a temporary file first, so an interrupted run never leaves a partial response
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, "wb") as f:
+                f.write(response.content)
+            os.replace(temp_file, cache_file)
+            if os.path.exists(missing_file):
+                os.remove(missing_file)
+            if response.headers.get("ETag"):
+                with open(etag_file, "w") as f:
+                    f.write(response.headers["ETag"])
+
             return response.json()
 
         except Exception as e:
             self.logger.error(f"Error fetching data for {date_str}: {str(e)}")
             return None
 
-    def process_coordinates(self, coordinates):
-        pixel_coords = []
+    def project_coordinates(self, coordinates):
+        """
+        Converts the outline of a geometry to pixel coordinates with numpy, as convert_to_pixel_coords does for one
+        vertex. Multipolygons are joined into one outline.
+
+        Args:
+            coordinates: GeoJSON coordinates of the geometry
+
+        Returns:
+            Array of shape (vertices, 2) with the pixel coordinates, empty if the coordinates cannot be read
+        """
         try:
             if isinstance(coordinates[0][0], (int, float)):
-                lon, lat = coordinates
-                return [self.convert_to_pixel_coords(lon, lat, self.map_size[0], self.map_size[1])]
+                points = np.array([coordinates], dtype=float)
             elif isinstance(coordinates[0][0][0], (int, float)):
-                for coord in coordinates[0]:
-                    lon, lat = coord
-                    pixel_coords.append(
-                        self.convert_to_pixel_coords(lon, lat, self.map_size[0], self.map_size[1])
-                    )
+                points = np.array(coordinates[0], dtype=float)
             else:
-                for poly in coordinates:
-                    for coord in poly[0]:
-                        lon, lat = coord
-                        pixel_coords.append(
-                            self.convert_to_pixel_coords(lon, lat, self.map_size[0], self.map_size[1])
-                        )
+                points = np.concatenate([np.array(poly[0], dtype=float) for poly in coordinates])
+
+            # Same conversion as convert_to_pixel_coords for all vertices at once
+            x = ((points[:, 0] - self.bbox['min_lon']) / (self.bbox['max_lon'] - self.bbox['min_lon'])
+                 * self.map_size[0]).astype(int)
+            y = ((self.bbox['max_lat'] - points[:, 1]) / (self.bbox['max_lat'] - self.bbox['min_lat'])
+                 * self.map_size[1]).astype(int)
         except Exception as e:
             self.logger.error(f"Error processing coordinates: {str(e)}")
-            return []
+            return np.empty((0, 2), dtype=int)
 
-        return pixel_coords
+        return np.stack([x, y], axis=1)
 
-    def create_map_image(self, geojson_data):
+    def process_coordinates(self, coordinates):
+        return [tuple(point) for point in self.project_coordinates(coordinates).tolist()]
+
+    def get_map_layers(self, features):
+        """
+        Rasterizes the regions once for all days with the same geometries.
+
+        The regions are drawn in order, each with its fill and then its black outline, and only the fill depends
+        on the day. So each pixel shows the last filled region painted after the last outline covering it, or
+        the outline (black) or the background (white) if none of them is filled that day. These fill candidates
+        are stored per pixel, last painted first, so a day is a lookup instead of drawing the polygons.
+
+        Args:
+            features: List of GeoJSON features of the regions
+
+        Returns:
+            Tuple (candidates, base) with the region indices of shape (depth, height, width), -1 where there is no
+            candidate, and the index of the color without a filled candidate: len(features) for the outline and
+            len(features) + 1 for the background
+        """
+        # The pixel outlines fully define the layers and are cheap to compare
+        outlines = [self.project_coordinates(feature['geometry']['coordinates']) for feature in features]
+        key = tuple(outline.tobytes() for outline in outlines)
+        if key in self.map_layers:
+            return self.map_layers[key]
+
+        n_features = len(features)
+        width, height = self.map_size
+        fills = np.zeros((n_features, height, width), dtype=bool)
+        last_outline = np.full((height, width), -1)
+        for index, outline in enumerate(outlines):
+            if len(outline) <= 2:
+                continue
+            pixel_coords = [tuple(point) for point in outline.tolist()]
+
+            fill = Image.new('1', self.map_size, 0)
+            ImageDraw.Draw(fill).polygon(pixel_coords, fill=1)
+            fills[index] = np.array(fill)
+
+            outline = Image.new('1', self.map_size, 0)
+            ImageDraw.Draw(outline).polygon(pixel_coords, outline=1)
+            last_outline[np.array(outline)] = index
+
+        # Fills painted after the last outline of a pixel, last painted first
+        fills &= np.arange(n_features)[:, None, None] > last_outline
+        candidates = np.full((max(int(fills.sum(axis=0).max(initial=0)), 1), height, width), -1)
+        depth = np.zeros((height, width), dtype=int)
+        for index in range(n_features - 1, -1, -1):
+            rows, cols = np.nonzero(fills[index])
+            candidates[depth[rows, cols], rows, cols] = index
+            depth[rows, cols] += 1
+
+        base = np.where(last_outline >= 0, n_features, n_features + 1)
+        self.map_layers[key] = (candidates, base)
+        return candidates, base
+
+    def create_map_array(self, geojson_data):
+        """
+        Renders the map of one day as RGB array from the rasterized regions (see get_map_layers).
+
+        Args:
+            geojson_data: Warn region GeoJSON of the day
+
+        Returns:
+            Array of shape (height, width, 3), or None without features
+        """
         if not geojson_data or 'features' not in geojson_data:
             return None
 
-        image = Image.new('RGB', self.map_size, (255, 255, 255))
-        draw = ImageDraw.Draw(image)
-
-        for feature in geojson_data['features']:
-            if 'geometry' not in feature or 'properties' not in feature:
-                continue
+        features = [feature for feature in geojson_data['features']
+                    if 'geometry' in feature and 'properties' in feature]
+        candidates, base = self.get_map_layers(features)
 
+        # Colors of the regions for the day, followed by the outline and the background
+        lut = np.zeros((len(features) + 2, 3), dtype=np.uint8)
+        filled = np.zeros(len(features) + 1, dtype=bool)
+        for index, feature in enumerate(features):
             vhi = feature['properties'].get('vhi_mean')
             availability = feature['properties'].get('availability_percentage')
+            if not (vhi == 110 or availability < 20):
+                filled[index] = True
+                lut[index] = self.get_color_for_vhi(vhi)
+        lut[len(features) + 1] = (255, 255, 255)
 
-            coordinates = feature['geometry']['coordinates']
-            pixel_coords = self.process_coordinates(coordinates)
+        # The last painted filled candidate wins, index -1 maps to the unfilled slot
+        labels = base.copy()
+        for layer in candidates[::-1]:
+            is_filled = filled[layer]
+            labels[is_filled] = layer[is_filled]
 
-            if len(pixel_coords) > 2:
-                if vhi == 110 or availability < 20:
-                    draw.polygon(pixel_coords, outline=(0, 0, 0))
-                else:
-                    color = self.get_color_for_vhi(vhi)
-                    draw.polygon(pixel_coords, fill=color, outline=(0, 0, 0))
+        return lut[labels]
 
-        return image
+    def create_map_image(self, geojson_data):
+        map_array = self.create_map_array(geojson_data)
+        if map_array is None:
+            return None
+        return Image.fromarray(map_array)
 
     def create_grid_image(self, maps_data, month):
         n_cols = len(self.years)
@@ -192,16 +320,19 @@ class VHIMapGridGenerator:
             y = padding_top + (day-1) * self.map_size[1] + self.map_size[1]//2 - 5
             draw.text((20, y), str(day), fill='black', font=font)
 
-        # Add maps
+        # Add maps as array slices
+        grid = np.array(grid_image)
         for day in range(1, num_days + 1):
             for col, year in enumerate(self.years):
                 current_date = datetime(year, month, day)
                 if (current_date, year) in maps_data:
-                    map_image = self.create_map_image(maps_data[(current_date, year)])
-                    if map_image:
+                    map_array = self.create_map_array(maps_data[(current_date, year)])
+                    if map_array is not None:
                         x = padding_left + col * self.map_size[0]
                         y = padding_top + (day-1) * self.map_size[1]
-                        grid_image.paste(map_image, (x, y))
+                        grid[y:y + self.map_size[1], x:x + self.map_size[0]] = map_array
+        grid_image = Image.fromarray(grid)
+        draw = ImageDraw.Draw(grid_image)
 
         # Add the type  at the footer
         draw.text((10, total_height - self.map_size[1] + 10), f"{VHI_TYPE}", fill='black', font=font)
@@ -22,11 +22,11 @@ Dependencies:
     - geopandas
     - matplotlib
     - os
+    - util_region_maps (grid rendering, years in parallel processes)
 
 Functions:
     - get_color_for_vhi(vhi: float) -> str
-    - process_date_data(date_data: pd.DataFrame, regions: gpd.GeoDataFrame, data_type: str) -> gpd.GeoDataFrame
-    - create_annual_maps(output_folder: str, regions_shapefile: str, vhi_csv_path: str, start_year: int, end_year: int)
+    - create_annual_maps(output_folder: str, regions_shapefile: str, vhi_csv_path: str, start_year: int, end_year: int, max_workers: int)
     - main()
 
 Example:
@@ -37,8 +37,15 @@ Example:
 
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import os
+import sys
+
+# Project root on sys.path for the grid renderer
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from main_functions import util_region_maps
 
 
 # Constants
@@ -78,38 +85,8 @@ def get_color_for_vhi(vhi):
 
 
 
-def process_date_data(date_data, regions):
-    """
-    Process either VHI
-
-    Args:
-        date_data (pd.DataFrame): Data for a specific date
-        regions (gpd.GeoDataFrame): Regions base geometry
-
-    """
-    processed_data = date_data.copy()
-
-
-    processed_data.loc[:, 'color'] = processed_data.apply(
-        lambda row: get_color_for_vhi(row['VHI']),
-        axis=1)
-
-    # Merge with regions
-    merged_data = regions.merge(
-        processed_data[['Region_ID', 'color']],
-        left_on='REGION_NR',
-        right_on='Region_ID',
-        how='left'
-    )
-
-    # Fill any missing colors with white
-    merged_data.loc[:, 'color'] = merged_data['color'].fillna('#ffffff')
-
-
-    return merged_data
-
-def create_annual_maps(output_folder, regions_shapefile, vhi_csv_path,  start_year=2018, end_year=2022):
-    """Create annual maps for VHI."""
+def create_annual_maps(output_folder, regions_shapefile, vhi_csv_path,  start_year=2018, end_year=2022, max_workers=None):
+    """Create annual maps for VHI, the years are rendered in parallel processes."""
     # Create output folder
     os.makedirs(output_folder, exist_ok=True)
 
@@ -131,6 +108,8 @@ def create_annual_maps(output_folder, regions_shapefile, vhi_csv_path,  start_ye
         (vhi_data['Datum'].dt.year >= start_year) &
         (vhi_data['Datum'].dt.year <= end_year)
     ].copy()
+    vhi_data['color'] = vhi_data['VHI'].apply(get_color_for_vhi)
+    vhi_by_date = {date: date_data for date, date_data in vhi_data.groupby('Datum')}
 
 
     years = list(range(start_year, end_year + 1))
@@ -138,50 +117,37 @@ def create_annual_maps(output_folder, regions_shapefile, vhi_csv_path,  start_ye
     # Create  figures
     for data_type in ['VHI']:
         print(f"\nProcessing {data_type} maps...")
-        fig, axes = plt.subplots(nrows=48, ncols=len(years), figsize=(5 * len(years), 100))
-        axes = axes.flatten()
 
         data_source = vhi_data
 
-        for col, year in enumerate(years):
-            print(f"Processing year {year}...")
+        # Cells of each year column: title, font size and region colors
+        columns = []
+        for year in years:
+            cells = []
             for month in range(1, 13):
                 # Get dates for this month
                 month_mask = (data_source['Datum'].dt.year == year) & (data_source['Datum'].dt.month == month)
-                month_data = data_source[month_mask].copy()
-                dates = sorted(month_data['Datum'].unique())
+                dates = sorted(data_source.loc[month_mask, 'Datum'].unique())
 
                 for week in range(4):
-                    ax_idx = col + len(years) * ((month - 1) * 4 + week)
-                    ax = axes[ax_idx]
-
                     if week < len(dates):
-                        date = dates[week]
-                        date_mask = (month_data['Datum'] == date)
-                        date_data = month_data[date_mask].copy()
-
-                        merged_data = process_date_data(date_data, regions.copy())
-
-                        # Plot the data
-                        merged_data.plot(
-                            ax=ax,
-                            color=merged_data['color'],
-                            edgecolor='black',
-                            linewidth=0.5
-                        )
-                        ax.set_title(date.strftime('%Y-%m-%d'), fontsize=15)
-                    else:
-                        # Empty plot for missing weeks
-                        regions.plot(ax=ax, color='#ffffff', edgecolor='black', linewidth=0.5)
-                        ax.set_title(f"{year}-{month:02d} Week {week+1}", fontsize=15)
+                        date = pd.Timestamp(dates[week])
+                        date_data = vhi_by_date[date]
 
-                    ax.axis('off')
+                        # Colors in the order of the regions, white without data
+                        color_by_region = dict(zip(date_data['Region_ID'], date_data['color']))
+                        colors = [color_by_region.get(region, '#ffffff') for region in regions['REGION_NR']]
+                        cells.append((date.strftime('%Y-%m-%d'), 15, colors))
+                    else:
+                        # Empty map for missing weeks
+                        cells.append((f"{year}-{month:02d} Week {week+1}", 15, ['#ffffff'] * len(regions)))
+            columns.append(cells)
 
-        # Add overall title and save
-        fig.suptitle(f"{data_type} Maps {start_year}-{end_year}", fontsize=16)
+        # Render the year columns and save
+        print(f"Rendering {len(years)} years...")
         output_path = os.path.join(output_folder, f"{data_type.lower()}_annual_maps_{start_year}_{end_year}.png")
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        util_region_maps.render_grid(columns, regions, f"{data_type} Maps {start_year}-{end_year}", output_path,
+                                     max_workers=max_workers)
         print(f"Saved {data_type} maps to {output_path}")
 
 def main():
@@ -0,0 +1,273 @@
+"""
+Warn Region Statistics Store
+
+This script keeps the daily warn region statistics of ch.swisstopo.swisseo_vhi_v100 in a local Parquet dataset,
+partitioned by surface type and year (cache/warnregions_store/type=forest/year=2024/2024-06-01.parquet).
+The map and merge utilities query it once for a date range instead of downloading one Parquet file per date.
+
+The store is refreshed incrementally from STAC: only the days which are not stored yet are downloaded.
+
+License: MIT License
+
+Usage:
+    python util_warnregions_store.py
+    change in code the
+    SURFACE_TYPE = "vegetation" or "forest"
+
+    From the utilities:
+    util_warnregions_store.refresh_from_stac("forest", "2018-01-01", "2022-12-31")
+    vhi_data = util_warnregions_store.read("forest", "2018-01-01", "2022-12-31", regions=[31, 32])
+
+Dependencies:
+    - pandas
+    - pyarrow
+    - pystac_client
+    - fsspec
+
+Functions:
+    - append(table: pd.DataFrame, surface_type: str, store_path: str)
+    - read(surface_type: str, start_date: str, end_date: str, regions: list, columns: list, store_path: str) -> pd.DataFrame
+    - get_stored_dates(surface_type: str, store_path: str) -> set
+    - refresh_from_stac(surface_type: str, start_date: str, end_date: str, overwrite: bool, max_workers: int, store_path: str) -> int
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pystac_client
+from fsspec.implementations.http import HTTPFileSystem
+
+# Constants
+STAC_PATH = "https://sys-data.int.bgdi.ch/"
+STAC_API = STAC_PATH + "api/stac/v0.9/"
+COLLECTION_ID = "ch.swisstopo.swisseo_vhi_v100"
+STORE_PATH = os.path.join("cache", "warnregions_store")
+SURFACE_TYPE = "forest"
+
+# Columns of the store, statistics missing in older exports are stored as nulls
+STORE_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("REGION_NR", pa.int64()),
+    ("vhi_mean", pa.int64()),
+    ("availability_percentage", pa.float64()),
+    ("vhi_p10", pa.int64()),
+    ("vhi_median", pa.int64()),
+    ("vhi_p90", pa.int64()),
+    ("extremely_dry_percentage", pa.float64()),
+    ("severely_dry_percentage", pa.float64()),
+    ("moderately_dry_percentage", pa.float64()),
+    ("mildly_dry_percentage", pa.float64()),
+    ("normal_percentage", pa.float64()),
+    ("good_percentage", pa.float64()),
+    ("excellent_percentage", pa.float64())
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("type", pa.string()), ("year", pa.int32())]), flavor="hive")
+
+
+def to_date(value):
+    """Converts a date string, datetime or Timestamp to a date."""
+    return pd.Timestamp(value).date()
+
+
+def get_partition_path(surface_type, year, store_path=STORE_PATH):
+    """Returns the directory of the partition of a surface type and year."""
+    return os.path.join(store_path, f"type={surface_type}", f"year={year}")
+
+
+def append(table, surface_type, store_path=STORE_PATH):
+    """
+    Appends the statistics of one or more days to the store.
+
+    Each day is written as its own file, replacing a stored version of the day, so appending is idempotent.
+
+    Args:
+        table (pd.DataFrame): Statistics with a date column and the columns of STORE_SCHEMA, e.g. a warn region
+            export or the result of main_extract_warnregions.export_batch
+        surface_type (str): Surface type of the statistics, "vegetation" or "forest"
+        store_path (str): Directory of the store
+
+    Returns:
+        None
+    """
+    table = table.copy()
+    table["date"] = pd.to_datetime(table["date"]).dt.date
+    for column in STORE_SCHEMA.names:
+        if column not in table.columns:
+            table[column] = None
+
+    for day, day_table in table.groupby("date", sort=True):
+        partition_path = get_partition_path(surface_type, day.year, store_path)
+        os.makedirs(partition_path, exist_ok=True)
+        arrow_table = pa.Table.from_pandas(day_table[STORE_SCHEMA.names], schema=STORE_SCHEMA, preserve_index=False)
+
+        # Write to a hidden temporary file first, the dataset discovery ignores it
+        day_file = os.path.join(partition_path, f"{day.isoformat()}.parquet")
+        temp_file = os.path.join(partition_path, f".{day.isoformat()}.parquet.{os.getpid()}.tmp")
+        pq.write_table(arrow_table, temp_file)
+        os.replace(temp_file, day_file)
+
+
+def read(surface_type=None, start_date=None, end_date=None, regions=None, columns=None, store_path=STORE_PATH):
+    """
+    Reads the statistics of a date range with one query.
+
+    The surface type and the years are resolved from the partitions, the dates and regions are pushed down to
+    the Parquet row groups.
+
+    Args:
+        surface_type (str): Surface type, None for all
+        start_date: First date (inclusive), None for no limit
+        end_date: Last date (inclusive), None for no limit
+        regions (list): REGION_NR values, None for all
+        columns (list): Columns to read, None for all including the partition columns type and year
+        store_path (str): Directory of the store
+
+    Returns:
+        pd.DataFrame: Statistics sorted by date and region, empty if nothing is stored
+    """
+    schema = pa.unify_schemas([STORE_SCHEMA, PARTITIONING.schema])
+    if not os.path.isdir(store_path):
+        table = schema.empty_table()
+        return (table if columns is None else table.select(columns)).to_pandas()
+
+    dataset = ds.dataset(store_path, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+    expression = None
+    conditions = []
+    if surface_type is not None:
+        conditions.append(ds.field("type") == surface_type)
+    if start_date is not None:
+        start = to_date(start_date)
+        conditions.append(ds.field("year") >= start.year)
+        conditions.append(ds.field("date") >= pa.scalar(start, pa.date32()))
+    if end_date is not None:
+        end = to_date(end_date)
+        conditions.append(ds.field("year") <= end.year)
+        conditions.append(ds.field("date") <= pa.scalar(end, pa.date32()))
+    if regions is not None:
+        conditions.append(ds.field("REGION_NR").isin(list(regions)))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    sort_keys = [(key, "ascending") for key in ("date", "REGION_NR") if key in table.column_names]
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+    return table.to_pandas()
+
+
+def get_stored_dates(surface_type, store_path=STORE_PATH):
+    """
+    Lists the stored days of a surface type from the file names, without reading the files.
+
+    Args:
+        surface_type (str): Surface type
+        store_path (str): Directory of the store
+
+    Returns:
+        set: Stored dates
+    """
+    dates = set()
+    type_path = os.path.join(store_path, f"type={surface_type}")
+    if not os.path.isdir(type_path):
+        return dates
+
+    for year_directory in os.listdir(type_path):
+        for file_name in os.listdir(os.path.join(type_path, year_directory)):
+            if file_name.endswith(".parquet") and not file_name.startswith("."):
+                dates.add(date.fromisoformat(file_name[:-len(".parquet")]))
+    return dates
+
+
+def get_item_date(item):
+    """Returns the date of a STAC item of the collection, e.g. 2024-06-01t235959."""
+    if item.datetime:
+        return item.datetime.date()
+    return datetime.strptime(item.id[:10], "%Y-%m-%d").date()
+
+
+def download_statistics(href, day):
+    """
+    Downloads the warn region statistics of one day without the geometries.
+
+    Args:
+        href (str): URL of the warn region Parquet file
+        day (date): Date of the statistics
+
+    Returns:
+        pd.DataFrame: Statistics of the day
+    """
+    filesystem = HTTPFileSystem()
+    with filesystem.open(href, "rb") as f:
+        parquet_file = pq.ParquetFile(f)
+        columns = [name for name in parquet_file.schema_arrow.names if name in STORE_SCHEMA.names]
+        table = parquet_file.read(columns=columns).to_pandas()
+
+    table["date"] = day
+    return table
+
+
+def refresh_from_stac(surface_type, start_date=None, end_date=None, overwrite=False, max_workers=8,
+                      store_path=STORE_PATH):
+    """
+    Downloads the days of a date range from STAC which are not stored yet.
+
+    Args:
+        surface_type (str): Surface type, "vegetation" or "forest"
+        start_date: First date (inclusive), None for the start of the collection
+        end_date: Last date (inclusive), None for today
+        overwrite (bool): Download stored days again, e.g. after a reprocessing
+        max_workers (int): Number of parallel downloads
+        store_path (str): Directory of the store
+
+    Returns:
+        int: Number of days added to the store
+    """
+    client = pystac_client.Client.open(STAC_API)
+    client.add_conforms_to("ITEM_SEARCH")
+
+    start = to_date(start_date).isoformat() + "T00:00:00Z" if start_date is not None else ".."
+    end = to_date(end_date).isoformat() + "T23:59:59Z" if end_date is not None else ".."
+    search = client.search(collections=[COLLECTION_ID],
+                           datetime=None if start_date is None and end_date is None else f"{start}/{end}")
+
+    stored_dates = set() if overwrite else get_stored_dates(surface_type, store_path)
+    suffix = f"_{surface_type}-warnregions.parquet"
+    jobs = {}
+    for item in search.items():
+        day = get_item_date(item)
+        if day in stored_dates:
+            continue
+        for asset in item.assets.values():
+            if asset.href.endswith(suffix):
+                jobs[asset.href] = day
+                break
+
+    print(f"Downloading {len(jobs)} days of {surface_type} warn region statistics...")
+    added = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download_statistics, href, day): href for href, day in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                append(future.result(), surface_type, store_path)
+                added += 1
+            except Exception as e:
+                print(f"Error downloading {futures[future]}: {str(e)}")
+
+    return added
+
+
+def main():
+    added = refresh_from_stac(SURFACE_TYPE)
+    print(f"Added {added} days to {STORE_PATH}")
+    print(read(SURFACE_TYPE).tail())
+
+
+if __name__ == "__main__":
+    main()
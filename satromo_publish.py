@@ -957,7 +957,7 @@ if __name__ == "__main__":
 
                             # Extracting warnregions
 
-                            main_extract_warnregions.export(file_merged, config.WARNREGIONS, warnregionfilename,
+                            distribution_columns = main_extract_warnregions.export(file_merged, config.WARNREGIONS, warnregionfilename,
                                                             metadata['SWISSTOPO']['DATEITEMGENERATION']+"T23:59:59Z", product_missing_data, product_no_data, scaling_factor, mean_type)
 
                             # Pushing  CSV , GEOJSON and PARQUET
@@ -978,6 +978,15 @@ if __name__ == "__main__":
                                     mean_type+"Mean": mean_type.upper()+" Mean Region",
                                     "availabilityPercentage": "percentage of available pixels with information within region"
                                 }
+                                # The percentiles and class shares are described by their exported column names, only if
+                                # the product has written them
+                                for name, label in {"p10": "10th percentile", "median": "Median", "p90": "90th percentile"}.items():
+                                    if mean_type + "_" + name in distribution_columns:
+                                        new_entry_value[mean_type + "_" + name] = mean_type.upper() + " " + label + " Region"
+                                for class_name, (class_min, class_max) in main_extract_warnregions.vhi_classes.items():
+                                    if class_name + "_percentage" in distribution_columns:
+                                        new_entry_value[class_name + "_percentage"] = "percentage of pixels with information within region classified as " + \
+                                            class_name.replace("_", " ") + f" (VHI {class_min}-{class_max})"
 
                                 # Update the metadata dictionary with the new entry
                                 metadata[new_entry_key] = new_entry_value
@@ -5,6 +5,7 @@ import ee
 from datetime import datetime, timedelta
 from step0_processors import *
 from satromo_publish import write_file
+from main_functions import main_task_tracker
 
 
 def step0_main(step0_product_dict, current_date_str):
@@ -18,6 +19,9 @@ def step0_main(step0_product_dict, current_date_str):
         if ok:
             collections_ready.append(step0_collection)
 
+    # Wait for the ingestions started by the step0 processors and log the failed ones
+    main_task_tracker.wait_all()
+
     return collections_ready
 
 
@@ -1,19 +1,18 @@
 import ee
 from main_functions import main_utils
 from main_functions import util_create_LSTMAX
-from .step0_utils import write_asset_as_empty
+from main_functions import main_task_tracker
+from main_functions import main_gcs_staging
+from main_functions import main_http_fetch
+from main_functions import main_ingestion
+from .step0_utils import write_asset_as_empty, write_lst_band_to_cog, find_time_index, read_netcdf_metadata
 import netCDF4
-import subprocess
-import rasterio
 import os
-import numpy as np
 from datetime import datetime, timezone
 import requests
-import urllib.request
 import configuration as config
 from pydrive.auth import GoogleAuth
 import json
-import time
 from oauth2client.service_account import ServiceAccountCredentials
 from google.cloud import storage
 
@@ -39,7 +38,7 @@ from google.cloud import storage
 # 3. Export NetCDF band data to GeoTIFF format.
 # 4. Generate MSG LST mosaic for a single date.
 # 5. Upload the GeoTIFF file to Google Cloud Storage (GCS).
-# 6. Export the image to Google Earth Engine as an asset.
+# 6. Ingest the image into Google Earth Engine as an asset.
 
 ###########################################
 # FUNCTIONS
@@ -104,7 +103,7 @@ def determine_run_type():
 
 def get_netcdf_info(file_path, epoch_time=None):
     """
-    Extracts information from a NetCDF file.
+    Extracts the information of the LST band from a NetCDF file which is needed for the image properties.
 
     Args:
         file_path (str): Path to the NetCDF file.
@@ -113,82 +112,12 @@ def get_netcdf_info(file_path, epoch_time=None):
     Returns:
         dict: A dictionary containing global attributes, dimensions, and variables of the NetCDF file.
     """
-
-    # Open the NetCDF file
-    dataset = netCDF4.Dataset(file_path, 'r')
-
-    # Extract global attributes
-    global_attributes = {attr: dataset.getncattr(
-        attr) for attr in dataset.ncattrs()}
-
-    # Extract dimensions
-    dimensions = {dim: len(dataset.dimensions[dim])
-                  for dim in dataset.dimensions}
-
-    # Extract variables and their attributes
-    variables = {}
-    for var_name in dataset.variables:
-        var = dataset.variables[var_name]
-        variables[var_name] = {
-            'dimensions': var.dimensions,
-            'shape': var.shape,
-            'attributes': {attr: var.getncattr(attr) for attr in var.ncattrs()},
-            'data': var[:].tolist()
-        }
-
-    # If epoch_time is provided, find the index corresponding to that time
-    time_var = dataset.variables['time']
-    time_index = None
-    if epoch_time is not None:
-        for i, t in enumerate(time_var[:]):
-            if t == epoch_time:
-                time_index = i
-                break
-
-    # Close the dataset if no epoch_time is provided
-    if epoch_time is None:
-        dataset.close()
-        return {
-            'global_attributes': global_attributes,
-            'dimensions': dimensions,
-            'variables': variables
-        }
-
-    # If epoch_time is provided and found in the file, get the variables for that time
-    if time_index is not None:
-        time_variables = {}
-        for var_name in dataset.variables:
-            var = dataset.variables[var_name]
-            var_data = var[time_index].tolist()
-            time_variables[var_name] = {
-                'dimensions': var.dimensions,
-                'shape': var.shape,
-                'attributes': {attr: var.getncattr(attr) for attr in var.ncattrs()},
-                'data': var_data
-            }
-
-        # Close the dataset
-        dataset.close()
-        return {
-            'global_attributes': global_attributes,
-            'dimensions': dimensions,
-            'time': epoch_time,
-            'variables': time_variables
-        }
-    else:
-        # Close the dataset
-        dataset.close()
-        return {
-            'global_attributes': global_attributes,
-            'dimensions': dimensions,
-            'time': epoch_time,
-            'variables': None
-        }
+    return read_netcdf_metadata(file_path, ['LST_PMW'], epoch_time=epoch_time)
 
 
 def export_netcdf_band_to_geotiff(file_path, time_value, output_tiff):
     """
-    Exports a specific band from a NetCDF file to a GeoTIFF file.
+    Exports a specific band from a NetCDF file to a Cloud Optimized GeoTIFF in EPSG:2056.
 
     Args:
         file_path (str): Path to the NetCDF file.
@@ -205,107 +134,15 @@ def export_netcdf_band_to_geotiff(file_path, time_value, output_tiff):
     # Open the NetCDF file
     dataset = netCDF4.Dataset(file_path, 'r')
 
-    # Extract the time variable
-    time_var = dataset.variables['time']
-
     # Find the index corresponding to the specified time value
-    time_index = None
-    for i, t in enumerate(time_var[:]):
-        if t == time_value:
-            time_index = i
-            break
+    time_index = find_time_index(dataset.variables['time'][:], time_value)
 
     if time_index is None:
         raise ValueError("Time value not found in the NetCDF file.")
 
-    # Extract the specific band for the given time
-    lst_var = dataset.variables['LST_PMW']
-    lst_band = lst_var[time_index, :, :]
-
-    # Write the band to a temporary GeoTIFF file
-    temp_nc_file = 'temp.nc'
-    with netCDF4.Dataset(temp_nc_file, 'w') as temp_dataset:
-        # Create dimensions
-        temp_dataset.createDimension('lon', lst_band.shape[1])
-        temp_dataset.createDimension('lat', lst_band.shape[0])
-
-        # Create variables
-        lon_var = temp_dataset.createVariable('lon', 'f4', ('lon',))
-        lon_var[:] = dataset.variables['lon'][:]
-        lat_var = temp_dataset.createVariable('lat', 'f4', ('lat',))
-        lat_var[:] = dataset.variables['lat'][:]
-        lst_temp_var = temp_dataset.createVariable(
-            'LST', 'f4', ('lat', 'lon',))
-        lst_temp_var[:] = lst_band
-
-        # Set variable attributes
-        lst_temp_var.units = lst_var.units
-        lst_temp_var.long_name = lst_var.long_name
-
-    # Use gdal_translate to export the temporary NetCDF file to GeoTIFF
-    temp_tiff = 'temp.tif'
-    command = [
-        'gdal_translate',
-        f'NETCDF:"{temp_nc_file}":LST',
-        temp_tiff
-    ]
-    # print(result.stdout))
-
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    # print(result.stdout)
-    print(result.stderr)
-
-    # Multiply the band values by 100 and change the data type to 16-bit integer using Rasterio
-    scaled_tiff = 'scaled_temp.tif'
-
-    # Open the temporary GeoTIFF file
-    with rasterio.open(temp_tiff) as src:
-        # Read the band data and the nodata value
-        data = src.read(1)
-        nodata_value = src.nodata
-
-        # Set nodata values to 0
-        data[data == nodata_value] = 0
-
-        # Multiply the data by 100
-        scaled_data = np.clip(data * 100, -32767, 32767).astype(np.int16)
-
-        # Update the profile to set the data type to int16 and compress using LZW
-        profile = src.profile
-        profile.update(
-            dtype=rasterio.int16,
-            compress='lzw',
-            nodata=None  # Reset nodata value
-        )
-
-        # Write the scaled data to a new GeoTIFF file
-        with rasterio.open(scaled_tiff, 'w', **profile) as dst:
-            dst.write(scaled_data, 1)
-
-    # Reproject the GeoTIFF to EPSG:2056
-    command = [
-        'gdalwarp',
-        '-s_srs', 'EPSG:4326',
-        '-t_srs', 'EPSG:2056',
-        '-of', 'COG',
-        # '-cutline', config.BUFFER,
-        '-srcnodata', '0',
-        '-co', 'COMPRESS=DEFLATE',
-        '-co', 'PREDICTOR=2',
-        scaled_tiff,
-        output_tiff
-    ]
-
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    # print(result.stdout)
-    print(result.stderr)
-
-    # Clean up the temporary files
-    os.remove(temp_nc_file)
-    os.remove(temp_tiff)
-    os.remove(scaled_tiff)
+    # Extract the specific band for the given time, scale it and reproject it in memory to the COG
+    lst_band = dataset.variables['LST_PMW'][time_index, :, :]
+    write_lst_band_to_cog(lst_band, dataset.variables['lon'][:], dataset.variables['lat'][:], output_tiff)
 
     # Close the dataset
     dataset.close()
@@ -358,22 +195,16 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
 
     # Convert the string to an ee.Date object
 
-    # Send a HEAD request to check if the file exists
+    # Download the file, a file downloaded by an earlier run is only revalidated (ETag / Last-Modified)
     try:
-        # Send a HEAD request to check if the file exists
-        response = requests.head(data_import_url)
+        raw_filename = main_http_fetch.fetch(data_import_url)
 
-    # Check if the response status code indicates the file exists (status code 200)
-        if response.status_code == 200:
-
-            #  download the file
-            urllib.request.urlretrieve(data_import_url, raw_filename)
-
-        else:
+        # Check if the file exists
+        if raw_filename is None:
             write_asset_as_empty(
                 collection, day_to_process, 'No candidate scene')
             return False  # File does not exist
-    except requests.RequestException as e:
+    except (requests.RequestException, IOError) as e:
         print(f"An error occurred: {e}")
         return False  # An error occurred
 
@@ -405,8 +236,8 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
     try:
         blob = bucket.blob("MSG_LST_"+day_to_process +
                            "T"+str(LST_hour)+"0000.tif")
-        blob.upload_from_filename(
-            "MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
+        main_gcs_staging.upload_file(
+            blob, "MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
         print(f"File MSG_LST_"+day_to_process+"T"+str(LST_hour) +
               "0000.tif uploaded to gs://"+bucket_name+"/MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
     except Exception as e:
@@ -417,13 +248,6 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
     asset_name = config.PRODUCT_VHI['LST_current_data']+"/"+asset_prefix+day_to_process + \
         "T"+str(LST_hour)+"0000"+'_bands-1721m'
 
-    # Load the GeoTIFF file as an Earth Engine Image
-    image = ee.Image.loadGeoTIFF(
-        f"gs://{bucket_name}/MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
-
-    # rename band
-    image = image.rename([band_name])
-
     # Parse the datetime in UTC
     date_time = datetime.strptime(
         day_to_process + "T" + str(LST_hour).zfill(2) + "0000Z", '%Y-%m-%dT%H%M%SZ')
@@ -431,7 +255,7 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
 
     # Set metadata properties
 
-    image = image.set({
+    properties = {
         # Convert to milliseconds Start timestamp
         'system:time_start': int(date_time.timestamp()) * 1000,
         # Assuming single timestamp Convert to milliseconds End timestamp
@@ -457,49 +281,31 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
         # Set the no data value, you can add more properties like baselines  etc
         # '_FillValue': str(info_raw_file['variables']['LST_PMW']['attributes']['_FillValue'])
         'no_data': str(config.PRODUCT_MSG_CLIMA["no_data"])
-    })
+    }
 
-    # Check if the asset already exists
-    asset_exists = ee.data.getInfo(asset_name)
+    # Ingest the GeoTIFF on GCS as asset, without an EE compute task. An existing asset is overwritten
+    manifest = main_ingestion.get_manifest(
+        asset_name, f"gs://{bucket_name}/MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif", [band_name], properties)
+    task_id = main_ingestion.start_ingestion(manifest, description=task_description)
 
-    # If the asset exists, delete it, otherwise upload failes
-    if asset_exists:
-        ee.data.deleteAsset(asset_name)
-        print(f"Deleted existing asset: {asset_name}")
+    if wait_for_upload is True:
+        # Track the ingestion in the background, GCS is cleaned up when it has finished
+        def on_complete(status):
+            # If the task is completed, continue with cleaning up GCS
+            if status['state'] == 'COMPLETED':
+                print("upload finished:" + asset_prefix+day_to_process +
+                      "T"+str(LST_hour)+"0000"+'_bands-1721m')
 
-    # Export the image to the asset folder
-    task = ee.batch.Export.image.toAsset(
-        image,
-        assetId=asset_name,
-        description=task_description)  # force Enable overwrite
-    task.start()
+                # delete file on GCS
+                blob.delete()
 
-    if wait_for_upload is True:
-        # Wait for 15 seconds
-        time.sleep(15)
-
-        # Check the export task status:
-        # If bulk upload is required: no while loop is required, you need to parse thet stats in dict and then check for FAILED tasks
-        while task.active():
-            print("Export task is still active. Waiting...")
-            time.sleep(5)  # Check status every 5 seconds
-
-        # If the task is completed, continue with cleaning up GCS
-        if task.status()['state'] == 'COMPLETED':
-            # Continue with your code here
-            pass
-            print("upload finished:" + asset_prefix+day_to_process +
-                  "T"+str(LST_hour)+"0000"+'_bands-1721m')
-
-            # delete file on GCS
-            blob.delete()
-
-        # If the task has failed, print the error message
-        elif task.status()['state'] == 'FAILED':
-            error_message = task.status()['error_message']
-            print("Export task failed with error message:", error_message)
+            # If the task has failed, print the error message
+            elif status['state'] == 'FAILED':
+                print("Ingestion failed with error message:", status.get('error_message'))
+
+        main_task_tracker.register(task_id, on_complete, task_description)
 
     # remove the local file
     os.remove("MSG_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
-    os.remove(raw_filename)
+    # the raw file stays in the fetch cache
     return True
@@ -1,20 +1,20 @@
 import ee
 from main_functions import main_utils
 from main_functions import util_create_LSTMAX
-from .step0_utils import write_asset_as_empty
+from main_functions import main_task_tracker
+from main_functions import main_gcs_staging
+from main_functions import main_http_fetch
+from main_functions import main_ingestion
+from .step0_utils import write_asset_as_empty, write_lst_band_to_cog, find_time_index, read_netcdf_metadata
 import netCDF4
-import xarray as xr
-import subprocess
-import rasterio
 import os
-import numpy as np
-from datetime import datetime, timezone
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
 import requests
-import urllib.request
 import configuration as config
 from pydrive.auth import GoogleAuth
 import json
-import time
 from oauth2client.service_account import ServiceAccountCredentials
 from google.cloud import storage
 
@@ -40,18 +40,26 @@ from google.cloud import storage
 # 3. Export NetCDF band data to GeoTIFF format.
 # 4. Generate MSG LST mosaic for a single date.
 # 5. Upload the GeoTIFF file to Google Cloud Storage (GCS).
-# 6. Export the image to Google Earth Engine as an asset.
+# 6. Ingest the image into Google Earth Engine as an asset.
+# 7. Import a date range in parallel (historical imports), one worker process per monthly file.
+
+# Monthly LST archives on data.geo.admin.ch, the file name is completed with YYYYMM01000000.nc
+MFG_ARCHIVE_URL = "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur/MFG1991-2005/mfg.LST_PMW.H_ch02.lonlat_"
+MSG_ARCHIVE_URL = "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur/MSG2004-2023/msg.LST_PMW.H_ch02.lonlat_"
 
 ###########################################
 # FUNCTIONS
 
 
-def determine_run_type():
+def determine_run_type(initialize_ee=False):
     """
     Determines the run type based on the existence of the SECRET on the local machine file.
 
     If the file `config.GDRIVE_SECRETS` exists, sets the run type to 2 (DEV) and prints a corresponding message.
     Otherwise, sets the run type to 1 (PROD) and prints a corresponding message.
+
+    Args:
+        initialize_ee (bool): Initialize GEE with the service account, when not run from satromo_processor
     """
     global run_type
     # Set scopes for Google Drive
@@ -88,6 +96,12 @@ def determine_run_type():
         )
         print("\nType 1 run PROCESSOR: We are on GitHub")
 
+    if initialize_ee:
+        credentials = ee.ServiceAccountCredentials(
+            gauth.service_account_email, gauth.service_account_file
+        )
+        ee.Initialize(credentials)
+
     # Test if GEE initialization is successful
     image = ee.Image("NASA/NASADEM_HGT/001")
     title = image.get("title").getInfo()
@@ -102,89 +116,31 @@ def determine_run_type():
     storage_client = storage.Client.from_service_account_json(
         gauth.service_account_file)
 
-def get_netcdf_info_streaming(file_url, epoch_time=None):
+def get_netcdf_info_streaming(file_url, variable_names, epoch_time=None):
     """
-    Extracts information from a NetCDF file streamed from a URL using xarray.
+    Extracts the information needed for the image properties from a NetCDF file at a URL, using the monthly
+    file cache of util_create_LSTMAX.
 
     Args:
         file_url (str): URL of the NetCDF file.
+        variable_names (list): Variables to extract the attributes for.
         epoch_time (int, optional): Specific epoch time to extract data for. Defaults to None.
 
     Returns:
         dict: A dictionary containing global attributes, dimensions, and variables of the NetCDF file.
     """
-    # Download the NetCDF file into memory
-    netcdf_data = util_create_LSTMAX.download_netcdf_to_memory(file_url)
-    if netcdf_data is None:
+    # Get the NetCDF file from the cache, e.g. already downloaded for the LST MAX calculation
+    netcdf_file = util_create_LSTMAX.get_cached_netcdf(file_url)
+    if netcdf_file is None:
         return {"error": "Failed to download the NetCDF file"}
 
-    # Open the NetCDF data with xarray from the in-memory BytesIO object using the 'scipy' engine
-    try:
-        dataset = xr.open_dataset(netcdf_data, engine="h5netcdf")
-    except ValueError as e:
-        return {"error": f"Error opening dataset: {e}"}
-
-    # Extract global attributes
-    global_attributes = {attr: dataset.attrs.get(attr) for attr in dataset.attrs}
-
-    # Extract dimensions
-    dimensions = {dim: len(dataset[dim]) for dim in dataset.dims}
-
-    # Extract variables and their attributes
-    variables = {}
-    for var_name in dataset.variables:
-        var = dataset[var_name]
-        variables[var_name] = {
-            'dimensions': var.dims,
-            'shape': var.shape,
-            'attributes': {attr: var.attrs.get(attr) for attr in var.attrs},
-        }
-
-    # If epoch_time is provided, find the index corresponding to that time
-    time_index = None
-    if epoch_time is not None:
-        if 'time' in dataset.dims:
-            time_var = dataset['time']
-            time_index = (time_var == epoch_time).argmax().item() if epoch_time in time_var.values else None
-
-    # If epoch_time is provided and found, get the data for that specific time
-    if epoch_time is not None and time_index is not None:
-        time_variables = {}
-        for var_name in dataset.variables:
-            var = dataset[var_name]
-            if 'time' in var.dims:
-                # Select data corresponding to the specific time index
-                var_data = var.isel(time=time_index).compute()
-            else:
-                var_data = var.compute()  # Non-time variables
-            time_variables[var_name] = {
-                'dimensions': var.dims,
-                'shape': var.shape,
-                'attributes': {attr: var.attrs.get(attr) for attr in var.attrs},
-                'data': var_data.tolist()
-            }
-
-        dataset.close()
-        return {
-            'global_attributes': global_attributes,
-            'dimensions': dimensions,
-            'time': epoch_time,
-            'variables': time_variables
-        }
-
-    # If no epoch_time is provided, return all variables
-    dataset.close()
-    return {
-        'global_attributes': global_attributes,
-        'dimensions': dimensions,
-        'variables': variables
-    }
+    return read_netcdf_metadata(netcdf_file, variable_names, epoch_time=epoch_time)
 
 
 
 def export_netcdf_band_to_geotiff(file_path, time_value, output_tiff):
     """
-    Exports a specific band from a NetCDF file to a GeoTIFF file.
+    Exports a specific band from a NetCDF file to a Cloud Optimized GeoTIFF in EPSG:2056.
 
     Args:
         file_path (str): Path to the NetCDF file.
@@ -201,112 +157,74 @@ def export_netcdf_band_to_geotiff(file_path, time_value, output_tiff):
     # Open the NetCDF file
     dataset = netCDF4.Dataset(file_path, 'r')
 
-    # Extract the time variable
-    time_var = dataset.variables['time']
-
     # Find the index corresponding to the specified time value
-    time_index = None
-    for i, t in enumerate(time_var[:]):
-        if t == time_value:
-            time_index = i
-            break
+    time_index = find_time_index(dataset.variables['time'][:], time_value)
 
     if time_index is None:
         raise ValueError("Time value not found in the NetCDF file.")
 
-    # Extract the specific band for the given time
-    lst_var = dataset.variables['LST_PMW']
-    lst_band = lst_var[time_index, :, :]
-
-    # Write the band to a temporary GeoTIFF file
-    temp_nc_file = 'temp.nc'
-    with netCDF4.Dataset(temp_nc_file, 'w') as temp_dataset:
-        # Create dimensions
-        temp_dataset.createDimension('lon', lst_band.shape[1])
-        temp_dataset.createDimension('lat', lst_band.shape[0])
-
-        # Create variables
-        lon_var = temp_dataset.createVariable('lon', 'f4', ('lon',))
-        lon_var[:] = dataset.variables['lon'][:]
-        lat_var = temp_dataset.createVariable('lat', 'f4', ('lat',))
-        lat_var[:] = dataset.variables['lat'][:]
-        lst_temp_var = temp_dataset.createVariable(
-            'LST', 'f4', ('lat', 'lon',))
-        lst_temp_var[:] = lst_band
-
-        # Set variable attributes
-        lst_temp_var.units = lst_var.units
-        lst_temp_var.long_name = lst_var.long_name
-
-    # Use gdal_translate to export the temporary NetCDF file to GeoTIFF
-    temp_tiff = 'temp.tif'
-    command = [
-        'gdal_translate',
-        f'NETCDF:"{temp_nc_file}":LST',
-        temp_tiff
-    ]
-    # print(result.stdout))
-
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    # print(result.stdout)
-    print(result.stderr)
-
-    # Multiply the band values by 100 and change the data type to 16-bit integer using Rasterio
-    scaled_tiff = 'scaled_temp.tif'
-
-    # Open the temporary GeoTIFF file
-    with rasterio.open(temp_tiff) as src:
-        # Read the band data and the nodata value
-        data = src.read(1)
-        nodata_value = src.nodata
-
-        # Set nodata values to 0
-        data[data == nodata_value] = 0
-
-        # Multiply the data by 100
-        scaled_data = np.clip(data * 100, -32767, 32767).astype(np.int16)
-
-        # Update the profile to set the data type to int16 and compress using LZW
-        profile = src.profile
-        profile.update(
-            dtype=rasterio.int16,
-            compress='lzw',
-            nodata=None  # Reset nodata value
-        )
-
-        # Write the scaled data to a new GeoTIFF file
-        with rasterio.open(scaled_tiff, 'w', **profile) as dst:
-            dst.write(scaled_data, 1)
-
-    # Reproject the GeoTIFF to EPSG:2056
-    command = [
-        'gdalwarp',
-        '-s_srs', 'EPSG:4326',
-        '-t_srs', 'EPSG:2056',
-        '-of', 'COG',
-        # '-cutline', config.BUFFER,
-        '-srcnodata', '0',
-        '-co', 'COMPRESS=DEFLATE',
-        '-co', 'PREDICTOR=2',
-        scaled_tiff,
-        output_tiff
-    ]
-
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    # print(result.stdout)
-    print(result.stderr)
-
-    # Clean up the temporary files
-    os.remove(temp_nc_file)
-    os.remove(temp_tiff)
-    os.remove(scaled_tiff)
+    # Extract the specific band for the given time, scale it and reproject it in memory to the COG
+    lst_band = dataset.variables['LST_PMW'][time_index, :, :]
+    write_lst_band_to_cog(lst_band, dataset.variables['lon'][:], dataset.variables['lat'][:], output_tiff)
 
     # Close the dataset
     dataset.close()
 
 
+def get_image_properties(day_to_process, LST_hour, sys_name, data_import_url, info_raw_file, long_name,
+                         product_version, netcdf_dim_time):
+    """
+    Builds the metadata properties of the LST image of a day.
+
+    Args:
+        day_to_process (str): The date (format: YYYY-MM-DD).
+        LST_hour (int): UTC hour of the LST band.
+        sys_name (str): Name of the image.
+        data_import_url (str): URL of the NetCDF file.
+        info_raw_file (dict): Metadata of the NetCDF file (see read_netcdf_metadata).
+        long_name (str): Long name of the band.
+        product_version (str): Version of the product.
+        netcdf_dim_time (str): Time value of the band in the NetCDF file.
+
+    Returns:
+        dict: Properties for main_ingestion.get_manifest
+    """
+    # Parse the datetime in UTC
+    date_time = datetime.strptime(
+        day_to_process + "T" + str(LST_hour).zfill(2) + "0000Z", '%Y-%m-%dT%H%M%SZ')
+    date_time = date_time.replace(tzinfo=timezone.utc)
+
+    # Set metadata properties
+
+    return {
+        # Convert to milliseconds Start timestamp
+        'system:time_start': int(date_time.timestamp()) * 1000,
+        # Assuming single timestamp Convert to milliseconds End timestamp
+        'system:time_end': int(date_time.timestamp()) * 1000,
+        # Set the name of the image
+        'system:name': sys_name,
+        # Set the date
+        'date': day_to_process,
+        # HourMin Sec
+        'hour': str(LST_hour),
+        # Orig filename
+        'orig_filename': os.path.basename(data_import_url),
+        # Set the spacecraft name
+        'spacecraft_name': info_raw_file['global_attributes']['platform'],
+        # Set the date
+        'long_name': long_name,
+        # Version
+        'product_version': product_version,
+        # record Status
+        'netcdf_dim_time': netcdf_dim_time,
+        # date created
+        'date_created': info_raw_file['global_attributes']['date_created'],
+        # Set the no data value, you can add more properties like baselines  etc
+        # '_FillValue': str(info_raw_file['variables']['LST_PMW']['attributes']['_FillValue'])
+        'no_data': str(config.PRODUCT_MSG_CLIMA["no_data"])
+    }
+
+
 def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str, task_description: str) -> None:
     """
     Generates a MSG MFG LST mosaic for a single date and uploads it to Google Cloud Storage and Google Earth Engine.
@@ -333,10 +251,10 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
 
     if not LST_MAX_AS:
         # MFG
-        data_import_url = "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur/MFG1991-2005/mfg.LST_PMW.H_ch02.lonlat_"+raw_filename
+        data_import_url = MFG_ARCHIVE_URL+raw_filename
 
         # MSG
-        # data_import_url = "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur/MSG2004-2023/msg.LST_PMW.H_ch02.lonlat_"+raw_filename
+        # data_import_url = MSG_ARCHIVE_URL+raw_filename
 
         # UTC Hour of LST
         LST_hour = 11
@@ -371,27 +289,24 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
     # CONFIGURATION END
     # --------------------
 
-    # Send a HEAD request to check if the file exists
     try:
-        # Send a HEAD request to check if the file exists
-        response = requests.head(data_import_url)
-
-    # Check if the response status code indicates the file exists (status code 200)
-        if response.status_code == 200:
-
-            #  download the file
-            if not LST_MAX_AS:
-                urllib.request.urlretrieve(data_import_url, raw_filename)
-            else:
+        if not LST_MAX_AS:
+            # Download the monthly file once for all its days, later runs only revalidate it (ETag / Last-Modified)
+            raw_filename = main_http_fetch.fetch(data_import_url)
+            file_exists = raw_filename is not None
+        else:
+            # Send a HEAD request to check if the file exists
+            response = requests.head(data_import_url)
+            file_exists = response.status_code == 200
+            if file_exists:
                 print("no download necessary using streaming via xr.open_dataset ")
                 util_create_LSTMAX.calc_LST_for_date(day_to_process, plattform, resolution, "https://data.geo.admin.ch/ch.meteoschweiz.landoberflaechentemperatur", os.getcwd())
 
-
-        else:
+        if not file_exists:
             write_asset_as_empty(
                 collection, day_to_process, 'No candidate scene')
             return False  # File does not exist
-    except requests.RequestException as e:
+    except (requests.RequestException, IOError) as e:
         print(f"An error occurred: {e}")
         return False  # An error occurred
 
@@ -421,9 +336,12 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
         # Rename the output file from LST1max to the desired LST filename
         os.rename(plattform+".LST1max.H_"+resolution+'.lonlat_'+day_to_process.replace("-", "")+"000000.tif", "M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
 
-    # Get the metadata for the epoch
+    # Get the metadata for the epoch, from the downloaded file if there is one
 
-    info_raw_file = get_netcdf_info_streaming(data_import_url, epoch_time=epochtime)
+    if not LST_MAX_AS:
+        info_raw_file = read_netcdf_metadata(raw_filename, [band_name], epoch_time=epochtime)
+    else:
+        info_raw_file = get_netcdf_info_streaming(data_import_url, ['SDL'], epoch_time=epochtime)
 
     # check if we are on a local machine or on github
     determine_run_type()
@@ -437,8 +355,8 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
     try:
         blob = bucket.blob("M_LST_"+day_to_process +
                            "T"+str(LST_hour)+"0000.tif")
-        blob.upload_from_filename(
-            "M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
+        main_gcs_staging.upload_file(
+            blob, "M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
         print(f"File M_LST_"+day_to_process+"T"+str(LST_hour) +
               "0000.tif uploaded to gs://"+bucket_name+"/M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
     except Exception as e:
@@ -449,18 +367,6 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
     asset_name = config.PRODUCT_MSG_CLIMA['step0_collection']+"/"+asset_prefix+day_to_process + \
         "T"+str(LST_hour)+"0000"+'_bands-02d'
 
-    # Load the GeoTIFF file as an Earth Engine Image
-    image = ee.Image.loadGeoTIFF(
-        f"gs://{bucket_name}/M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
-
-    # rename band
-    image = image.rename([band_name])
-
-    # Parse the datetime in UTC
-    date_time = datetime.strptime(
-        day_to_process + "T" + str(LST_hour).zfill(2) + "0000Z", '%Y-%m-%dT%H%M%SZ')
-    date_time = date_time.replace(tzinfo=timezone.utc)
-
     if not LST_MAX_AS:
         sys_name=asset_prefix+day_to_process+"T"+str(LST_hour)+"0000"+'_bands-02d'
         long_name= info_raw_file['variables']['LST_PMW']['attributes']['long_name']
@@ -474,78 +380,241 @@ def generate_msg_lst_mosaic_for_single_date(day_to_process: str, collection: str
         zeit="n.a."
 
     # Set metadata properties
+    properties = get_image_properties(day_to_process, LST_hour, sys_name, data_import_url, info_raw_file,
+                                      long_name, product_version, zeit)
 
-    image = image.set({
-        # Convert to milliseconds Start timestamp
-        'system:time_start': int(date_time.timestamp()) * 1000,
-        # Assuming single timestamp Convert to milliseconds End timestamp
-        'system:time_end': int(date_time.timestamp()) * 1000,
-        # Set the name of the image
-        'system:name': sys_name,
-        # Set the date
-        'date': day_to_process,
-        # HourMin Sec
-        'hour': str(LST_hour),
-        # Orig filename
-        'orig_filename': os.path.basename(data_import_url),
-        # Set the spacecraft name
-        'spacecraft_name': info_raw_file['global_attributes']['platform'],
-        # Set the date
-        'long_name': long_name,
-        # Version
-        'product_version': product_version,
-        # record Status
-        'netcdf_dim_time': zeit,
-        # date created
-        'date_created': info_raw_file['global_attributes']['date_created'],
-        # Set the no data value, you can add more properties like baselines  etc
-        # '_FillValue': str(info_raw_file['variables']['LST_PMW']['attributes']['_FillValue'])
-        'no_data': str(config.PRODUCT_MSG_CLIMA["no_data"])
-    })
+    # Ingest the GeoTIFF on GCS as asset, without an EE compute task. An existing asset is overwritten
+    manifest = main_ingestion.get_manifest(
+        asset_name, f"gs://{bucket_name}/M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif", [band_name], properties)
+    task_id = main_ingestion.start_ingestion(manifest, description=task_description)
 
-    # Check if the asset already exists
-    asset_exists = ee.data.getInfo(asset_name)
+    if wait_for_upload is True:
+        # Track the ingestion in the background, GCS is cleaned up when it has finished
+        def on_complete(status):
+            # If the task is completed, continue with cleaning up GCS
+            if status['state'] == 'COMPLETED':
+                print("upload finished:" + asset_prefix+day_to_process +
+                      "T"+str(LST_hour)+"0000"+'_bands-02d')
 
-    # If the asset exists, delete it, otherwise upload failes
-    if asset_exists:
-        ee.data.deleteAsset(asset_name)
-        print(f"Deleted existing asset: {asset_name}")
+                # delete file on GCS
+                blob.delete()
 
-    # Export the image to the asset folder
-    task = ee.batch.Export.image.toAsset(
-        image, assetId=asset_name,
-        description=task_description)  # force Enable overwrite
-    task.start()
+            # If the task has failed, print the error message
+            elif status['state'] == 'FAILED':
+                print("Ingestion failed with error message:", status.get('error_message'))
 
-    if wait_for_upload is True:
-        # Wait for 15 seconds
-        time.sleep(15)
-
-        # Check the export task status:
-        # If bulk upload is required: no while loop is required, you need to parse thet stats in dict and then check for FAILED tasks
-        while task.active():
-            print("Export task is still active. Waiting...")
-            time.sleep(5)  # Check status every 5 seconds
-
-        # If the task is completed, continue with cleaning up GCS
-        if task.status()['state'] == 'COMPLETED':
-            # Continue with your code here
-            pass
-            print("upload finished:" + asset_prefix+day_to_process +
-                  "T"+str(LST_hour)+"0000"+'_bands-02d')
-
-            # delete file on GCS
-            blob.delete()
-
-        # If the task has failed, print the error message
-        elif task.status()['state'] == 'FAILED':
-            error_message = task.status()['error_message']
-            print("Export task failed with error message:", error_message)
+        main_task_tracker.register(task_id, on_complete, task_description)
 
     # remove the local file
 
     os.remove("M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif")
-    if not LST_MAX_AS:
-        os.remove(raw_filename)
-    else:
+    # the raw file of the import stays in the fetch cache
+    if LST_MAX_AS:
         os.remove(plattform+".LST1max.H_"+resolution+'.lonlat_'+day_to_process.replace("-", "")+"000000.nc")
+
+
+def convert_month(raw_filename, days, LST_hour=11):
+    """
+    Converts the days of one monthly NetCDF file to GeoTIFFs, run in a worker process of import_date_range.
+
+    The monthly file is opened once for all its days. It is fetched and pinned in the fetch cache by the parent
+    process, so it is not evicted while the worker reads it.
+
+    Args:
+        raw_filename (str): Path of the monthly NetCDF file.
+        days (list): Dates of the month to convert (format: YYYY-MM-DD).
+        LST_hour (int): UTC hour of the LST band.
+
+    Returns:
+        list: Tuples (day, path of the GeoTIFF, metadata of the day) of the days, the path is None if the day
+        could not be converted.
+    """
+    # The attributes are the same for all days of the month
+    month_info = read_netcdf_metadata(raw_filename, ["LST_PMW"])
+
+    results = []
+    with netCDF4.Dataset(raw_filename, 'r') as dataset:
+        time_values = dataset.variables['time'][:]
+        lon = dataset.variables['lon'][:]
+        lat = dataset.variables['lat'][:]
+
+        for day_to_process in days:
+            year, month, day = day_to_process.split('-')
+
+            # we use the 1100 UTC LST dataset
+            epochtime = int(datetime(int(year), int(month),
+                            int(day), LST_hour, 00, 00).timestamp())
+            output_tiff = "M_LST_"+day_to_process+"T"+str(LST_hour)+"0000.tif"
+
+            try:
+                time_index = find_time_index(time_values, epochtime)
+                if time_index is None:
+                    raise ValueError("Time value not found in the NetCDF file.")
+                write_lst_band_to_cog(dataset.variables['LST_PMW'][time_index, :, :], lon, lat, output_tiff)
+                results.append((day_to_process, output_tiff, dict(month_info, time=epochtime, time_index=time_index)))
+            except Exception as e:
+                print(f"Error converting {day_to_process}: {str(e)}")
+                results.append((day_to_process, None, None))
+
+    return results
+
+
+def import_date_range(start_date, end_date, collection, archive_url=MSG_ARCHIVE_URL, max_workers=None,
+                      upload_workers=8):
+    """
+    Imports the LST of a date range, e.g. the 2004-2023 archive, as one asset per day.
+
+    The days are split by their monthly file and each month is converted by a worker process (see convert_month),
+    so the import scales with the number of cores. The monthly files are fetched by this process ahead of the
+    workers and pinned in the fetch cache until their month is converted, at most two per worker. The GeoTIFFs
+    are handed to a shared pool of upload threads, which upload them to GCS and start their ingestion while the
+    next months are converted. Days which cannot be imported are written to the empty asset list, as the days
+    of a missing monthly file.
+
+    Args:
+        start_date (str): First date (format: YYYY-MM-DD).
+        end_date (str): Last date (inclusive, format: YYYY-MM-DD).
+        collection (str): The collection of the assets.
+        archive_url (str): URL of the monthly files without YYYYMM01000000.nc, e.g. MSG_ARCHIVE_URL.
+        max_workers (int): Number of worker processes, None for the number of CPUs.
+        upload_workers (int): Number of parallel uploads.
+
+    Returns:
+        int: Number of days of which the ingestion was started
+    """
+    # UTC Hour of LST
+    LST_hour = 11
+
+    # Band name
+    band_name = "LST_PMW"
+
+    # GCS Google cloud storage bucket
+    bucket_name = "viirs_lst_meteoswiss"
+
+    # GEE asset NAME prefix
+    asset_prefix = "M_METEOSWISS_mosaic_"
+
+    # Split the days by their monthly file
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    months = {}
+    for offset in range((end - start).days + 1):
+        day_to_process = (start + timedelta(days=offset)).strftime('%Y-%m-%d')
+        raw_filename = day_to_process.replace("-", "")[:6] + "01"+"000000.nc"
+        months.setdefault(archive_url+raw_filename, []).append(day_to_process)
+
+    def upload(day_to_process, output_tiff, info_raw_file, data_import_url):
+        # Upload the GeoTIFF and start its ingestion, GCS is cleaned up when it has finished
+        blob = bucket.blob(output_tiff)
+        try:
+            main_gcs_staging.upload_file(blob, output_tiff)
+        finally:
+            os.remove(output_tiff)
+
+        sys_name = asset_prefix+day_to_process+"T"+str(LST_hour)+"0000"+'_bands-02d'
+        properties = get_image_properties(
+            day_to_process, LST_hour, sys_name, data_import_url, info_raw_file,
+            info_raw_file['variables'][band_name]['attributes']['long_name'],
+            info_raw_file['variables'][band_name]['attributes']['version'], str(info_raw_file['time']))
+        manifest = main_ingestion.get_manifest(
+            collection+"/"+sys_name, f"gs://{bucket_name}/{output_tiff}", [band_name], properties)
+
+        def on_complete(status):
+            if status['state'] == 'COMPLETED':
+                print("upload finished:" + sys_name)
+                blob.delete()
+            elif status['state'] == 'FAILED':
+                print(f"Ingestion of {day_to_process} failed with error message:", status.get('error_message'))
+
+        return main_ingestion.start_ingestion(manifest, on_complete, sys_name)
+
+    def write_days_as_empty(days, remark):
+        for day_to_process in days:
+            write_asset_as_empty(collection, day_to_process, remark)
+
+    workers = max_workers or os.cpu_count() or 1
+    month_urls = iter(months)
+    data_import_url = next(month_urls, None)
+    conversions = {}
+    uploads = {}
+    bucket = None
+    imported = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as converter, \
+            ThreadPoolExecutor(max_workers=upload_workers) as uploader:
+        while data_import_url is not None or conversions:
+            # Fetch the next monthly files ahead of the workers, pinned until their conversion has finished
+            while data_import_url is not None and len(conversions) < 2 * workers:
+                try:
+                    raw_filename = main_http_fetch.fetch(data_import_url, pin=True)
+                    if raw_filename is None:
+                        write_days_as_empty(months[data_import_url], 'No candidate scene')
+                    else:
+                        conversions[converter.submit(convert_month, raw_filename, months[data_import_url],
+                                                     LST_hour)] = (data_import_url, raw_filename)
+                except (requests.RequestException, IOError) as e:
+                    print(f"Error downloading {data_import_url}: {str(e)}")
+                    write_days_as_empty(months[data_import_url], 'Download failed')
+                data_import_url = next(month_urls, None)
+
+            if not conversions:
+                break
+
+            done, _ = wait(conversions, return_when=FIRST_COMPLETED)
+            for future in done:
+                month_url, raw_filename = conversions.pop(future)
+                main_http_fetch.unpin(raw_filename)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"Error converting {month_url}: {str(e)}")
+                    write_days_as_empty(months[month_url], 'Conversion failed')
+                    continue
+
+                if bucket is None:
+                    # check if we are on a local machine or on github, once for all days. The worker processes
+                    # are started by now, they do not need the EE and GCS clients
+                    determine_run_type()
+                    bucket = storage_client.bucket(bucket_name)
+
+                for day_to_process, output_tiff, info_raw_file in results:
+                    if output_tiff is None:
+                        write_asset_as_empty(collection, day_to_process, 'Conversion failed')
+                    else:
+                        uploads[uploader.submit(upload, day_to_process, output_tiff, info_raw_file,
+                                                month_url)] = day_to_process
+
+        for future in as_completed(uploads):
+            try:
+                future.result()
+                imported += 1
+            except Exception as e:
+                print(f"Error importing {uploads[future]}: {str(e)}")
+                write_asset_as_empty(collection, uploads[future], 'Upload failed')
+
+    print(f"Started the ingestion of {imported} days from {start_date} to {end_date}")
+    return imported
+
+
+if __name__ == "__main__":
+    # Historical import, the configuration file comes first as for satromo_processor, e.g.
+    # python -m step0_processors.step0_processor_msg_lst_clima dev_config.py 2004-01-01 -e 2023-12-31 -c projects/satromo-int/assets/LST_CLIMA_SWISS
+    parser = argparse.ArgumentParser(description="Import the MeteoSwiss LST archive for a date range.")
+    parser.add_argument('config', type=str, help="Configuration file in the configuration directory, e.g. dev_config.py.")
+    parser.add_argument('start', type=str, help="First date (YYYY-MM-DD).")
+    parser.add_argument('-e', '--end', type=str, default=None, help="Last date (YYYY-MM-DD). Defaults to the first date.")
+    parser.add_argument('-c', '--collection', type=str, required=True, help="Collection of the assets.")
+    parser.add_argument('-u', '--url', type=str, default=MSG_ARCHIVE_URL,
+                        help="URL of the monthly files without YYYYMM01000000.nc. Defaults to the MSG 2004-2023 archive.")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Number of worker processes. Defaults to the number of CPUs.")
+    args = parser.parse_args()
+
+    # Authenticate with GEE and GCS, as satromo_processor does before calling the step0 functions
+    determine_run_type(initialize_ee=True)
+
+    import_date_range(args.start, args.end or args.start, args.collection, archive_url=args.url,
+                      max_workers=args.workers)
+
+    # Wait for the ingestions of all days
+    main_task_tracker.wait_all()
@@ -1,10 +1,138 @@
 import os
+import netCDF4
+import numpy as np
 import pandas as pd
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling
 import configuration as config
 
+# Attributes of the NetCDF files which are used for the EE image properties
+NETCDF_GLOBAL_ATTRIBUTES = ['platform', 'date_created']
+NETCDF_VARIABLE_ATTRIBUTES = ['long_name', 'version']
+
 def write_asset_as_empty(collection, day_to_process, remark):
     print('Cutting asset create for {} / {}'.format(collection, day_to_process))
     print('Reason: {}'.format(remark))
     collection_name = os.path.basename(collection)
     df = pd.DataFrame([(collection_name, day_to_process, remark)])
     df.to_csv(config.EMPTY_ASSET_LIST, mode='a', header=False, index=False)
+
+
+def write_lst_band_to_cog(lst_band, lon, lat, output_tiff):
+    """
+    Writes a LST band of a lon/lat NetCDF file as int16 COG (values * 100) in EPSG:2056.
+
+    The band is scaled and reprojected in memory, only the COG is written to disk. Masked pixels are set to 0,
+    the nodata value of the COG.
+
+    Args:
+        lst_band (np.ma.MaskedArray): LST band (lat, lon) of one time step
+        lon (np.ndarray): Longitudes of the pixel centers
+        lat (np.ndarray): Latitudes of the pixel centers
+        output_tiff (str): Path to the output COG
+
+    Returns:
+        None
+    """
+    data = np.ma.filled(np.ma.asarray(lst_band, dtype=np.float32), 0)
+    scaled_data = np.clip(data * 100, -32767, 32767).astype(np.int16)
+
+    # Pixel centers to a north up transform
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    x_res = (lon[-1] - lon[0]) / (lon.size - 1)
+    y_res = (lat[-1] - lat[0]) / (lat.size - 1)
+    if x_res < 0:
+        scaled_data = scaled_data[:, ::-1]
+    if y_res > 0:
+        scaled_data = scaled_data[::-1, :]
+    transform = from_origin(lon.min() - abs(x_res) / 2, lat.max() + abs(y_res) / 2, abs(x_res), abs(y_res))
+
+    profile = {
+        'driver': 'GTiff',
+        'height': scaled_data.shape[0],
+        'width': scaled_data.shape[1],
+        'count': 1,
+        'dtype': rasterio.int16,
+        'crs': 'EPSG:4326',
+        'transform': transform,
+        'nodata': 0
+    }
+
+    # Reproject to EPSG:2056 (nearest, as gdalwarp) and write the COG from the warped dataset
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(np.ascontiguousarray(scaled_data), 1)
+        with memfile.open() as src, WarpedVRT(src, crs='EPSG:2056', resampling=Resampling.nearest) as vrt:
+            rio_copy(vrt, output_tiff, driver='COG', compress='DEFLATE', predictor=2)
+
+
+def find_time_index(time_values, epoch_time):
+    """
+    Finds the index of a time step with a binary search on the (ascending) time coordinate.
+
+    Args:
+        time_values (np.ndarray): Values of the time coordinate
+        epoch_time (int): Time value to find
+
+    Returns:
+        int: Index of the time step, None if the time value is not in the time coordinate
+    """
+    time_values = np.asarray(time_values)
+    time_index = int(np.searchsorted(time_values, epoch_time))
+    if time_index < time_values.size and time_values[time_index] == epoch_time:
+        return time_index
+    return None
+
+
+def read_netcdf_metadata(source, variable_names, epoch_time=None):
+    """
+    Reads the metadata of a NetCDF file which is needed for the EE image properties.
+
+    Only the time coordinate is read, the other variables are not loaded and only the attributes in
+    NETCDF_GLOBAL_ATTRIBUTES and NETCDF_VARIABLE_ATTRIBUTES are extracted.
+
+    Args:
+        source (str or bytes): Path to the NetCDF file or its content
+        variable_names (list): Variables to extract the attributes for, e.g. ['LST_PMW']
+        epoch_time (int, optional): Time value to look up. Defaults to None.
+
+    Returns:
+        dict: Global attributes, dimensions and variables of the NetCDF file. If epoch_time is provided, also
+        its 'time' and 'time_index' (None if the time value is not in the file).
+    """
+    if isinstance(source, bytes):
+        dataset = netCDF4.Dataset('in-memory.nc', memory=source)
+    else:
+        dataset = netCDF4.Dataset(source, 'r')
+
+    try:
+        global_attributes = {attr: dataset.getncattr(attr)
+                             for attr in NETCDF_GLOBAL_ATTRIBUTES if attr in dataset.ncattrs()}
+        dimensions = {dim: len(dataset.dimensions[dim]) for dim in dataset.dimensions}
+
+        variables = {}
+        for var_name in variable_names:
+            var = dataset.variables[var_name]
+            variables[var_name] = {
+                'dimensions': var.dimensions,
+                'shape': var.shape,
+                'attributes': {attr: var.getncattr(attr)
+                               for attr in NETCDF_VARIABLE_ATTRIBUTES if attr in var.ncattrs()}
+            }
+
+        info = {
+            'global_attributes': global_attributes,
+            'dimensions': dimensions,
+            'variables': variables
+        }
+        if epoch_time is not None:
+            info['time'] = epoch_time
+            info['time_index'] = find_time_index(dataset.variables['time'][:], epoch_time)
+        return info
+    finally:
+        dataset.close()
@@ -3,6 +3,7 @@ import datetime
 from datetime import timedelta
 import configuration as config
 from main_functions import main_utils
+from main_functions import main_task_tracker
 from step0_processors.step0_utils import write_asset_as_empty
 from step0_processors.step0_processor_msg_lst import generate_msg_lst_mosaic_for_single_date
 
@@ -276,6 +277,9 @@ def process_PRODUCT_VHI(roi, collection_ready, current_date_str):
 
             check_date = check_date.advance(1, 'day')
 
+        # The LST ingests of the days run in parallel, wait for all of them before the LST is used
+        main_task_tracker.wait_all()
+
 
     # Define item Name
     timestamp = datetime.datetime.strptime(current_date_str, '%Y-%m-%d')
@@ -0,0 +1,42 @@
+"""
+Smoke tests of the command line of the MSG LST clima processor (historical import).
+
+The configuration module reads the configuration file and the date from the first two command line arguments,
+so the CLI is run in a subprocess, as from the command line.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "step0_processors.step0_processor_msg_lst_clima"
+
+
+def run_cli(*args):
+    """Runs the clima processor as module from the repository directory and returns the completed process."""
+    return subprocess.run([sys.executable, "-m", MODULE, *args], cwd=REPO_DIR, capture_output=True, text=True,
+                          timeout=300)
+
+
+class TestClimaCli(unittest.TestCase):
+
+    def test_help(self):
+        result = run_cli("dev_config.py", "2004-01-01", "--help")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("--collection", result.stdout)
+
+    def test_missing_collection(self):
+        # Fails in argparse, i.e. after the configuration was loaded and before GEE is initialized
+        result = run_cli("dev_config.py", "2004-01-01", "-e", "2004-01-02")
+        self.assertEqual(result.returncode, 2, result.stderr)
+        self.assertIn("-c/--collection", result.stderr)
+        self.assertNotIn("BrokenPipeError", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()